@@ -1,218 +1,197 @@
 #coding:utf8
+"""
+调用 deepseek-reasoner 蒸馏SFT数据
+
+asyncio 版本：同时在途的请求数由 AdaptiveConcurrency 按 429/超时与延迟自适应调整(AIMD)，
+每个请求有超时，失败后按带随机抖动的指数退避重试；定期打印吞吐(条/秒、token/秒)。
+每行的状态记录在 <输出前缀>.manifest.sqlite(job_manifest.py)，中断后重新运行即从断点继续，
+已完成的行不会再次调用API；失败的行最多重试 --max-attempts 次。
+--dedup 时先对全部摘要做近似去重(near_dedup.py)，与已收录摘要近似重复的行不再调用API。
+"""
+import argparse
+import asyncio
 import csv
 import time
 import sys
 import json
-import pandas as pd
-import openpyxl
+import random
 from openpyxl import Workbook
 import os
-import threading
-from queue import Queue
-from openai import OpenAI
-
-client = OpenAI(api_key="sk-xxx", base_url="https://api.deepseek.com")
-
-# 配置参数
-NUM_WORKERS = 10  # 工作线程数量
+import openai
+from openai import AsyncOpenAI
+
+# JSON 提取与修复与 GRPO 奖励函数共用 src/train/grpo/score_function/json_parse.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "train", "grpo", "score_function"))
+from json_parse import extract_json_strings
+from job_manifest import JobManifest
+from near_dedup import dedup_corpus
+from literature_io import iter_rows, xlsx_to_parquet
+from kg_prompt import COMPACT_PROMPT_PREFIX, PROMPT_PREFIX, build_prompt
+
+# 重试由本脚本控制，客户端不再自动重试
+client = AsyncOpenAI(api_key=os.environ.get("DEEPSEEK_API_KEY", "sk-xxx"),
+                     base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
+                     max_retries=0)
+
+# 配置参数(可通过命令行覆盖)
+MAX_CONCURRENCY = 64  # 最大在途请求数
+INITIAL_CONCURRENCY = 10  # 初始在途请求数
 MAX_TASKS = 2000  # 最大处理任务数
+REQUEST_TIMEOUT = 900  # 单个请求超时(秒)，reasoner 最多输出 8192 token
+MAX_RETRIES = 10
 csv.field_size_limit(65536)
 
-# 全局队列
-task_queue = Queue(maxsize=100)  # 控制内存使用
-result_queue = Queue()
-
 # 输出文件配置
-EXCEL_OUTPUT = "output_deepseek_r1_else2.xlsx"
-JSONL_OUTPUT = "output_deepseek_r1_else2.jsonl"
-
-def get_chatgpt_response(question):
-    conversation = []
-    prompt = '''You are a biomedical knowledge graph construction assistant. Perform document analysis and relationship extraction following these strict protocols:
-
-# Processing Workflow
-1. **Schema Identification**
-   - Identification of Entity and Relationship Types:
-   • Identify candidate entities (12 predefined types) 
-   • Detect contextual relationships (26 predefined classes)
-   • Map findings to the following predefined schema:
-
-2. **Entity Recognition** 
-   Types with Definitions:
-   1). Anatomy : Structures or functional parts of the body systems (e.g., organs, tissues, or cellular components). 
-Key distinction: Explicitly excludes pathological states (e.g., "inflamed liver" would belong to disease/symptom).  
-Example: liver, hippocampus, T lymphocytes.
-
-2). Biomarker: A measurable biological indicator (e.g., molecular, genetic, or biochemical) used to assess physiological/pathological states or responses to interventions, typically acting as an indirect indicator (not the direct target of a drug). 
-Example: hemoglobin A1c (HbA1c), C-reactive protein.
-
-3). Complication: A secondary medical condition arising as a direct consequence of a primary disease or medical intervention (e.g., sepsis in burn patients).*  
-Key distinction: Must involve causality to a pre-existing condition.  
-Example: diabetic neuropathy in diabetes mellitus.
-
-4). Disease: A specific pathological disorder with characteristic signs/symptoms, affecting structure or function, not inherently implying a causal relationship to another condition 
-Example: Alzheimer's disease, rheumatoid arthritis.
-
-5). Drug: A chemical substance with therapeutic/diagnostic properties, including generic names, brand names, and investigational compounds. Excludes non-pharmacological interventions (e.g., surgery).  
-Example: aspirin, Bevacizumab (Avastin®).
-
-6). Gene: A functional unit of heredity represented by standardized symbols or names, distinct from gene products (e.g., proteins) classified under "Target" 
-Example: BRCA1, TP53.
-
-7). Side Effect: An unintended physiological response **directly linked to pharmacological actionof a drug at normal doses (e.g., nausea caused by chemotherapy). 
-Key distinction: Requires explicit association with drug exposure.  
-
-8). Symptom: A patient-perceived subjective manifestation of a disease or condition, independent of drug exposure (e.g., fatigue in cancer). 
-Example: fatigue, chest pain.
-
-9). Target: A molecular entity (protein, enzyme, receptor, etc.) directly modulated by a drug to exert therapeutic effects (e.g., ACE2 receptor).  
-Key distinction: Functional interaction with a drug is required.  
-
-10). Test: A diagnostic procedure or assay to detect/measure biological markers, disease states, or treatment responses, excluding the biomarkers themselves  
-Example: MRI scan, ELISA assay.
-
-11). Treatment: A clinical intervention (pharmacological, surgical, or behavioral) intended to prevent/manage diseases, including non-pharmacological approaches (e.g., radiotherapy). 
-Key distinction: Broader scope than "Drug".  
-
-   Annotation Principles:
-   (1) Non-overlapping: Single text span → single entity type
-   (2) Non-nesting: No embedded entities within spans
-   (3) Minimal punctuation: Exclude non-essential conjunctions/punctuation
-
-3. **Relation Extraction** 
-   **Relationship Definitions**  
-1). complication_of | Complication ↔ Disease
-Definition:
-A complication is a secondary medical condition directly arising from a primary disease or its treatment (e.g., surgery, drug therapy). This relationship implies bidirectional causality: the disease initiates the complication, and the complication cannot exist independently of the disease.
-Key distinctions:
-•	Must involve a causal link (e.g., diabetic retinopathy is caused by diabetes, not coincidental).
-•	Excludes unrelated coexisting diseases (e.g., hypertension and asthma in the same patient).
-Examples:
-•	"Diabetic neuropathy" complication_of "Diabetes mellitus" (explicit).
-•	"Sepsis" complication_of "Burn injury" (implicit: burns → infection → sepsis).
-________________________________________
-2). increases_expression_of | Drug ↔ Gene
-Definition:
-A drug pharmacologically enhances the transcription or translation activity of a gene, leading to measurable increases in its mRNA or protein levels. 
-Key distinctions:
-•	Gene expression changes must be drug-specific (not general cellular stress responses).
-Examples:
-•	"Tamoxifen" increases_expression_of "ESR1" (estrogen receptor gene).
-•	"Metformin" increases_expression_of "AMPK" (via metabolic pathway activation).
-________________________________________
-3). is_biomarker_of | Biomarker ↔ Disease
-Definition:
-A biomarker (e.g., protein, metabolite) is objectively measured to indicate the presence, severity, or progression of a disease. The biomarker has diagnostic, prognostic, or therapeutic monitoring utility.
-Key distinctions:
-•	Biomarkers are indicators, not therapeutic targets (contrast with is_target_of).
-Examples:
-•	"CA-125" is_biomarker_of "Ovarian cancer" (diagnostic).
-•	"Tau protein" is_biomarker_of "Alzheimer’s disease" (progression monitoring).
-________________________________________
-4). is_located_in | Disease ↔ Anatomy
-Definition:
-A disease primarily manifests in or affects a specific anatomical structure (organ, tissue, or cell type). The anatomical site is pathologically or functionally central to the disease.
-Key distinctions:
-•	Anatomical specificity is required (e.g., "lung" for pneumonia, not "respiratory system").
-•	Excludes systemic diseases without localized pathology (e.g., sepsis).
-Examples:
-•	"Hepatitis B" is_located_in "Liver" (viral replication in hepatocytes).
-•	"Glioblastoma" is_located_in "Brain" (primary tumor site).
-________________________________________
-5). is_side_effect_of | Side Effect ↔ Drug
-Definition:
-A side effect is an unintended physiological reaction directly attributable to the pharmacological action of a drug at therapeutic doses. The reaction must occur in a statistically significant patient population.
-Key distinctions:
-•	Must exclude symptoms caused by the disease itself (e.g., chemotherapy-induced nausea vs. cancer-related fatigue).
-•	Requires dose-dependency (higher dose → higher risk).
-Examples:
-•	"Hemorrhage" is_side_effect_of "Warfarin" (anticoagulant effect).
-•	"Insomnia" is_side_effect_of "Dexamethasone" (CNS stimulation).
-________________________________________
-6). is_symptom_of | Symptom ↔ Disease
-Definition:
-A symptom is a patient-reported or clinically observed manifestation (subjective or objective) that is pathognomonic or commonly associated with a disease. Symptoms arise from the disease’s pathophysiology.
-Key distinctions:
-•	Symptoms are disease-specific (e.g., "jaundice" in hepatitis).
-•	Excludes nonspecific complaints (e.g., "fatigue" without disease context).
-Examples:
-•	"Dyspnea" is_symptom_of "Heart failure" (fluid accumulation in lungs).
-•	"Hematuria" is_symptom_of "Bladder cancer" (tissue invasion).
-________________________________________
-7). is_target_of | Target ↔ Drug
-Definition:
-A target is a biomolecule (protein, receptor, enzyme) that directly interacts with a drug to mediate its therapeutic effect. The interaction is stoichiometric and mechanistically validated (e.g., binding assays, crystallography).
-Key distinctions:
-•	Targets are functional entities (e.g., HER2 protein, not the HER2 gene).
-Examples:
-•	"ACE2 receptor" is_target_of "Losartan" (angiotensin receptor blocker).
-•	"COX-1 enzyme" is_target_of "Aspirin" (irreversible acetylation).
-________________________________________
-8). treat | Drug ↔ Disease
-Definition:
-A drug is clinically used to alleviate, manage, or cure a disease through a mechanism of action supported by regulatory approval or evidence-based guidelines. The relationship implies therapeutic efficacy.
-Key distinctions:
-•	Requires clinical relevance (e.g., "insulin treats diabetes," not "vitamin C treats common cold").
-Examples:
-•	"Penicillin" treat "Streptococcal pharyngitis" (antibacterial action).
-•	"Sertraline" treat "Major depressive disorder" (SSRI mechanism).
-________________________________________
-9). is_examination_for | Test ↔ Disease
-Definition:
-A test is a standardized diagnostic or monitoring procedure (imaging, lab assay) used to confirm, stage, or track the progression of a disease. The test must have established clinical utility.
-Key distinctions:
-•	Tests are actions/tools, not biomarkers (e.g., "MRI" is a test; "elevated CRP" is a biomarker).
-•	Excludes research-only or experimental assays.
-Examples:
-•	"Colonoscopy" is_examination_for "Colorectal cancer" (diagnostic).
-•	"Electrocardiogram (ECG)" is_examination_for "Myocardial infarction" (diagnostic).
-
-   Annotation Principles:
-   (1) Intra-sentence priority: Prefer relations within single sentences
-   (2) Unidirectionality: Maintain only one directional relation per entity pair
-   (3) Schema compliance: Use only predefined relationship types
-
-# Output Specifications
-• Strict JSON format with two root keys: Entities, Relationships
-• Entity preservation: Maintain original text case and formatting
-• Relationship format: [source_entity, source_type, relationship, target_entity, target_type]
-• Please makesure the entity and relationship is from the input text
-• No null/empty values or placeholder text
-• No explanatory content
-
-# Input Text
-'''+question+'''
-
-# Output Example
-{
-    "Entities": {
-        "Hippocampal formation": "anatomy",
-        "Tau protein phosphorylation": "biomarker",
-        "Neuropsychiatric symptoms": "complication",
-        "Alzheimer's disease": "disease",
-        "Lecanemab": "drug",
-        "APOE ε4 allele": "gene",
-        "Amyloid-related imaging abnormalities": "side effect",
-        "Cognitive decline": "symptom",
-        "Amyloid-β protofibrils": "target",
-        "PET scan": "test",
-        "Anti-amyloid immunotherapy": "treatment"
-    },
-    "Relationships": [
-        ["Alzheimer's disease", "disease", "have_complication", "Neuropsychiatric symptoms", "complication"],
-        ["Lecanemab", "drug", "is_target_drug_of", "Amyloid-β protofibrils", "target"],
-        ["Tau protein phosphorylation", "biomarker", "is_biomarker_of", "Alzheimer's disease", "disease"],
-        ["Cognitive decline", "symptom", "is_symptom_of", "Alzheimer's disease", "disease"],
-        ["APOE ε4 allele", "gene", "increases_expression_of", "Amyloid-β protofibrils", "target"]
-    ]
-}'''
-    conversation.append({"role":"user","content":prompt})
+OUTPUT_PREFIX = "output_deepseek_r1_else2"
+
+
+class AdaptiveConcurrency:
+    """
+    自适应的在途请求上限(AIMD)
+
+    - 429、超时、5xx：上限减半(每个在上次减小之后发出的失败请求才会再次减半)，并在冷却期内不再增加
+    - 成功且每个输出 token 的延迟不高于基线的 latency_tolerance 倍：每轮(约 limit 个请求)上限加1
+    - 延迟明显高于基线(服务端排队)：上限乘以 0.9
+    基线为每 token 延迟 EWMA 的历史最小值，并缓慢上调以适应服务端变化。
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=1, maximum=MAX_CONCURRENCY,
+                 latency_tolerance=2.0, cooldown=30.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.ewma = None
+        self.baseline = None
+        self.last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            while self.in_flight >= int(self.limit):
+                await self._cond.wait()
+            self.in_flight += 1
+
+    async def release(self, started, latency=None, tokens=0, overloaded=False):
+        async with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                if started >= self.last_decrease:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.last_decrease = now
+            elif latency is not None and tokens > 0:  # 没有 usage 的响应无法换算每 token 延迟
+                per_token = latency / max(tokens, 1)
+                self.ewma = per_token if self.ewma is None else 0.9 * self.ewma + 0.1 * per_token
+                self.baseline = self.ewma if self.baseline is None else min(self.baseline * 1.001, self.ewma)
+                if self.ewma > self.baseline * self.latency_tolerance:
+                    self.limit = max(self.minimum, self.limit * 0.9)
+                    self.last_decrease = now
+                elif now - self.last_decrease > self.cooldown:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class ThroughputStats:
+    """吞吐统计：完成/失败条数、请求数、429次数与 token 数(含 prompt 缓存命中的 token 数)"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.done = 0
+        self.failed = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.cache_hit_tokens = 0
+        self.cache_miss_tokens = 0
+        self.completion_tokens = 0
+        self.reasoning_tokens = 0
+
+    def add_usage(self, usage):
+        if usage is None:
+            return
+        prompt_tokens = usage.prompt_tokens or 0
+        self.prompt_tokens += prompt_tokens
+        # DeepSeek 返回 prompt_cache_hit_tokens/prompt_cache_miss_tokens，OpenAI 兼容服务返回 cached_tokens
+        hit = getattr(usage, "prompt_cache_hit_tokens", None)
+        if hit is None:
+            hit = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+        miss = getattr(usage, "prompt_cache_miss_tokens", None)
+        self.cache_hit_tokens += hit
+        self.cache_miss_tokens += miss if miss is not None else prompt_tokens - hit
+        self.completion_tokens += usage.completion_tokens or 0
+        details = getattr(usage, "completion_tokens_details", None)
+        self.reasoning_tokens += (getattr(details, "reasoning_tokens", None) or 0) if details else 0
+
+    def report(self, limiter=None):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        line = (f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] done={self.done} failed={self.failed} "
+                f"requests={self.requests} 429={self.rate_limited} "
+                f"rows/s={self.done / elapsed:.2f} completion tok/s={self.completion_tokens / elapsed:.0f} "
+                f"prompt tok={self.prompt_tokens} (cache hit {self.cache_hit_tokens}, miss {self.cache_miss_tokens}, "
+                f"{self.cache_hit_tokens / max(self.prompt_tokens, 1):.1%}) reasoning tok={self.reasoning_tokens}")
+        if limiter is not None:
+            line += f" concurrency={limiter.in_flight}/{int(limiter.limit)}"
+        print(line)
+
+
+def backoff_delay(retry, base=2.0, cap=120.0):
+    """带全随机抖动的指数退避"""
+    return random.uniform(0, min(cap, base * 2 ** retry))
+
+
+def _is_overload(e):
+    return isinstance(e, (openai.RateLimitError, openai.APITimeoutError, asyncio.TimeoutError)) or (
+        isinstance(e, openai.APIStatusError) and e.status_code >= 500)
+
+
+def _retry_after(e):
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def prompt_stats(tokenizer_path=None):
+    """
+    打印两种 prompt 前缀的字符数和 token 数；未指定分词器时 token 数按 4 字符/token 估计
+
+    tokenizer_path 为模型目录时用 transformers 加载，为 tokenizer.json 文件时用 tokenizers 加载
+    """
+    encode = None
+    if tokenizer_path and os.path.isfile(tokenizer_path):
+        from tokenizers import Tokenizer
+        tokenizer = Tokenizer.from_file(tokenizer_path)
+        encode = lambda text: tokenizer.encode(text, add_special_tokens=False).ids
+    elif tokenizer_path:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        encode = lambda text: tokenizer.encode(text, add_special_tokens=False)
+    for name, prefix in (("full", PROMPT_PREFIX), ("compact", COMPACT_PROMPT_PREFIX)):
+        if encode is not None:
+            tokens = f"{len(encode(prefix))} tokens"
+        else:
+            tokens = f"~{len(prefix) // 4} tokens (估计)"
+        print(f"{name:<8} 前缀 {len(prefix)} 字符, {tokens}")
+
+async def get_chatgpt_response(question, limiter, stats, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES,
+                               compact=False):
+    """返回 (回答, 推理内容, 对话)；重试耗尽时回答为空字符串"""
+    prompt = build_prompt(question, compact)
+    conversation = [{"role": "user", "content": prompt}]
     retry = 0
     res = ""
     reasoning_content = ""
-    while retry < 10:
+    while retry < max_retries:
+        await limiter.acquire()
+        start = time.monotonic()
         try:
-            response = client.chat.completions.create(
+            stats.requests += 1
+            # 客户端默认 600s 超时，需要同时传入 timeout，wait_for 保证总耗时不超过 timeout
+            response = await asyncio.wait_for(client.chat.completions.create(
                 model="deepseek-reasoner",
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant"},
@@ -220,88 +199,36 @@ Examples:
                 ],
                 max_tokens=8192,
                 temperature=0.01,
-                stream=False
-            )
-            res = response.choices[0].message.content
-            reasoning_content = response.choices[0].message.reasoning_content
-            #print(response)
-            break
+                stream=False,
+                timeout=timeout,
+            ), timeout)
         except Exception as e:
+            overloaded = _is_overload(e)
+            stats.rate_limited += isinstance(e, openai.RateLimitError)
+            await limiter.release(start, overloaded=overloaded)
+            delay = _retry_after(e) or backoff_delay(retry)
             retry += 1
-            time.sleep(30)
             print(time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(time.time())))
-            print("get deepseek response error! retry!")
-            print(e)
-            print(question)
+            print(f"get deepseek response error! retry {retry}/{max_retries} in {delay:.1f}s: {type(e).__name__}: {e}")
+            await asyncio.sleep(delay)
+            continue
+        usage = response.usage
+        await limiter.release(start, time.monotonic() - start, usage.completion_tokens if usage else 0)
+        stats.add_usage(usage)
+        res = response.choices[0].message.content
+        reasoning_content = getattr(response.choices[0].message, "reasoning_content", "")
+        break
     return res,reasoning_content,conversation
 
-def extract_json_strings(content):
-    """提取所有最外层JSON字符串的辅助函数"""
-    json_objects = []
-    start = 0
-    while True:
-        start = content.find('{', start)
-        if start == -1:
-            break
-        
-        end = start
-        brace_count = 0
-        while end < len(content):
-            if content[end] == '{':
-                brace_count += 1
-            elif content[end] == '}':
-                brace_count -= 1
-            
-            if brace_count == 0:  # 找到一个完整的最外层 JSON
-                break
-            end += 1
-        
-        if brace_count == 0:  # 确保找到了匹配的括号
-            json_str = content[start:end + 1]
-            json_str = json_str.replace('\r\n', '').replace('  ', ' ').replace('\n', '')
-            json_str = json_str.replace('{\n', '{').replace(', ],', ' ],')
-            
-            try:
-                json_obj = json.loads(json_str, strict=False)
-                json_objects.append(json_obj)
-            except json.JSONDecodeError:
-                fixed_json = try_fix_json(json_str)
-                json_objects.append(json.loads(fixed_json))
-        
-        start = end + 1  # 移动到下一个可能的 JSON 开始位置
-
-    return json_objects[0] if json_objects else None
-
-def try_fix_json(json_string):
-    bracket_map = {'}': '{', ']': '[', '{': '}', '[': ']'}
-    stack = []
-    fixed_string = ''
-
-    for char in json_string:
-        if char in ['{', '[']:
-            stack.append(char)
-            fixed_string += char
-        elif char in ['}', ']']:
-            if stack and stack[-1] == bracket_map[char]:
-                stack.pop()
-                fixed_string += char
-            else:
-                continue
-        else:
-            fixed_string += char
-
-    while stack:
-        fixed_string += bracket_map[stack.pop()]
-    while fixed_string.startswith("{{") and fixed_string.endswith("}}"):
-        fixed_string = fixed_string[1:-1]
-
-    return fixed_string
 def parse_response(response_json, row_id, row_content):
     try:
         response_dict = extract_json_strings(response_json)
     except json.JSONDecodeError:
         print("JSON 解析错误:", response_json)
-        return None,None,None
+        return None, None
+    if not isinstance(response_dict, dict):
+        print("没有找到JSON对象:", response_json)
+        return None, None
 
     entities = []
     relationships = []
@@ -331,167 +258,283 @@ def parse_response(response_json, row_id, row_content):
 
     return entities, relationships
 
-def append_to_excel(entities, relationships, output_file):
-    """增量追加数据到Excel文件"""
-    # 获取或创建所有必需的sheet
-    sheets = {
-        "Entities": ["id", "content", "entity type", "name"],
-        "Relationships": ["id", "content", "entity type 1", "entity name 1", 
-                        "relationship", "entity type 2", "entity name 2"]
-    }
-    if os.path.exists(output_file):
-        wb = openpyxl.load_workbook(output_file)
-        for sheet_name in sheets:
-            if sheet_name not in wb.sheetnames:
-                ws = wb.create_sheet(sheet_name)
-                ws.append(sheets[sheet_name])
-    else:
-        wb = Workbook()
-        wb.remove(wb.active)  # 移除默认sheet
-        
-        # 创建并初始化所有sheet
-        entity_sheet = wb.create_sheet("Entities")
-        entity_sheet.append(sheets["Entities"])
-        
-        relationship_sheet = wb.create_sheet("Relationships")
-        relationship_sheet.append(sheets["Relationships"])
-
-    # 追加数据
-    for entity in entities:
-        wb["Entities"].append([
-            entity["id"], entity["content"],
-            entity["entity_type"], entity["name"]
-        ])
-    
-    for rel in relationships:
-        wb["Relationships"].append([
-            rel["id"], rel["content"],
-            rel["entity_type_1"], rel["entity_name_1"],
-            rel["relationship"], rel["entity_type_2"],
-            rel["entity_name_2"]
-        ])
-
-    wb.save(output_file)
-
-def worker():
-    while True:
-        task = task_queue.get()
-        if task is None:  # 终止信号
-            task_queue.task_done()
-            break
-        
-        row_id, row_content = task
-        try:
-            if len(row_content) < 30:
-                print(f"Skipping short content: ID {row_id}")
+SHEETS = {
+    "Entities": ["id", "content", "entity type", "name"],
+    "Relationships": ["id", "content", "entity type 1", "entity name 1",
+                      "relationship", "entity type 2", "entity name 2"],
+}
+
+
+def _entity_row(entity):
+    return [entity["id"], entity["content"], entity["entity_type"], entity["name"]]
+
+
+def _relationship_row(rel):
+    return [rel["id"], rel["content"], rel["entity_type_1"], rel["entity_name_1"],
+            rel["relationship"], rel["entity_type_2"], rel["entity_name_2"]]
+
+
+class ResultStore:
+    """
+    只追加的结果存储，替代每条结果都重新读写整个 xlsx 的 append_to_excel
+
+    实体、关系各写一个 jsonl(每行一个 Excel 行)，对话与回答写入 meta_path；
+    结果先在内存中缓存，每 batch_size 条一次性追加并 flush，单条写入成本与文件大小无关。
+    需要 xlsx 时在结束后用 export_excel 流式导出。
+    """
+
+    def __init__(self, prefix, meta_path, batch_size=50):
+        self.paths = {"Entities": f"{prefix}.entities.jsonl", "Relationships": f"{prefix}.relationships.jsonl"}
+        self.meta_path = meta_path
+        self.batch_size = batch_size
+        self._buffers = {"Entities": [], "Relationships": [], "meta": []}
+        self._ids = []
+        self.pending = 0
+
+    def add(self, entities, relationships, meta_data):
+        self._buffers["Entities"].extend(json.dumps(_entity_row(e), ensure_ascii=False) for e in entities)
+        self._buffers["Relationships"].extend(json.dumps(_relationship_row(r), ensure_ascii=False)
+                                              for r in relationships)
+        self._buffers["meta"].append(json.dumps(meta_data, ensure_ascii=False))
+        self._ids.append(meta_data["id"])
+        self.pending += 1
+        return self.pending >= self.batch_size
+
+    def flush(self):
+        """把缓存的结果追加到文件并落盘，返回这些结果的 id"""
+        buffers, self._buffers = self._buffers, {"Entities": [], "Relationships": [], "meta": []}
+        ids, self._ids = self._ids, []
+        self.pending = 0
+        for name, path in list(self.paths.items()) + [("meta", self.meta_path)]:
+            lines = buffers[name]
+            if not lines:
                 continue
-
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return ids
+
+    def sizes(self):
+        return {path: os.path.getsize(path) for path in list(self.paths.values()) + [self.meta_path]
+                if os.path.exists(path)}
+
+    def truncate(self, sizes):
+        """把输出文件截断到清单中记录的长度，丢弃中断时已追加但未提交的部分"""
+        for path, size in sizes.items():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                print(f"截断未提交的输出: {path} {os.path.getsize(path)} -> {size} 字节")
+                os.truncate(path, size)
+
+    def export_excel(self, output_file):
+        """用 write_only 模式把两个 jsonl 流式写成一个 xlsx"""
+        wb = Workbook(write_only=True)
+        for name, header in SHEETS.items():
+            ws = wb.create_sheet(name)
+            ws.append(header)
+            if not os.path.exists(self.paths[name]):
+                continue
+            with open(self.paths[name], "r", encoding="utf-8") as f:
+                for line in f:
+                    ws.append(json.loads(line))
+        wb.save(output_file)
+        print(f"数据已成功写入到 {output_file}")
+
+async def process_row(row_id, row_content, plan, limiter, stats, results, manifest, args):
+    if len(row_content) < 30:
+        print(f"Skipping short content: ID {row_id}")
+        return
+    answer = None
+    try:
+        if plan == "reparse":
+            # 之前已付费拿到回答但解析失败，只重新解析
+            response, reasoner = manifest.answer(row_id)
+            conversation = [{"role": "user", "content": build_prompt(row_content, args.compact_prompt)}]
+        else:
+            manifest.start(row_id)
             # 获取API响应
-            response, reasoner, conversation = get_chatgpt_response(row_content)
-            
-            # 清理响应内容
-            if response and not response.startswith("{"):
-                response = response[response.find("{"):response.rfind("}")+1]
-            
-            # 解析结果
-            entities, relationships = parse_response(response, row_id, row_content)
-            
-            if entities or relationships:
-                result_queue.put((
-                    entities,
-                    relationships,
-                    {
-                        "id": row_id,
-                        "conversation": conversation,
-                        "response": response,
-                        "reasoner": reasoner
-                    }
-                ))
-            else:
-                print(f"Empty result for ID {row_id}")
-                
-        except Exception as e:
-            print(f"Error processing ID {row_id}: {str(e)}")
-        finally:
-            task_queue.task_done()
+            response, reasoner, conversation = await get_chatgpt_response(
+                row_content, limiter, stats, args.timeout, args.max_retries, args.compact_prompt)
+            if not response:
+                stats.failed += 1
+                manifest.fail(row_id, "no response")
+                print(f"No response for ID {row_id}")
+                return
+            # 回答到达即落盘，之后崩溃也不必再次付费请求
+            await asyncio.to_thread(manifest.save_answer, row_id, (response, reasoner))
+        answer = (response, reasoner)
+
+        # 清理响应内容
+        if response and not response.startswith("{"):
+            response = response[response.find("{"):response.rfind("}")+1]
+
+        # 解析结果
+        entities, relationships = parse_response(response, row_id, row_content)
+
+        if entities or relationships:
+            stats.done += 1
+            await results.put((
+                entities,
+                relationships,
+                {
+                    "id": row_id,
+                    "conversation": conversation,
+                    "response": response,
+                    "reasoner": reasoner
+                }
+            ))
+        else:
+            stats.failed += 1
+            manifest.fail(row_id, "empty result", answer)
+            print(f"Empty result for ID {row_id}")
+    except Exception as e:
+        stats.failed += 1
+        manifest.fail(row_id, f"{type(e).__name__}: {e}", answer)
+        print(f"Error processing ID {row_id}: {str(e)}")
+
+
+def checkpoint(store, manifest):
+    """输出文件落盘后，在一个事务中提交这些行的完成状态和输出文件长度"""
+    done = store.flush()
+    manifest.commit(done, {"output_sizes": store.sizes()})
 
-def writer():
-    """专用的写入线程"""
+
+async def writer(results, store, manifest, flush_interval):
+    """专用的写入协程：攒够一批或超过 flush_interval 秒时批量追加并提交清单，文件写入放到线程中执行"""
     while True:
-        result = result_queue.get()
+        try:
+            result = await asyncio.wait_for(results.get(), flush_interval)
+        except asyncio.TimeoutError:
+            result = False
         if result is None:  # 终止信号
-            result_queue.task_done()
             break
-        
         try:
-            entities, relationships, meta_data = result
-            
-            # 写入Excel
-            append_to_excel(entities, relationships, EXCEL_OUTPUT)
-            
-            # 写入JSONL
-            with open(JSONL_OUTPUT, "a", encoding="utf-8") as f:
-                json.dump(meta_data, f, ensure_ascii=False)
-                f.write("\n")
-                
+            if result is False or store.add(*result):
+                await asyncio.to_thread(checkpoint, store, manifest)
         except Exception as e:
             print(f"写入错误: {str(e)}")
-        finally:
-            result_queue.task_done()
+    await asyncio.to_thread(checkpoint, store, manifest)
 
-def main():
-    # 初始化环境
-    #if os.path.exists(EXCEL_OUTPUT):
-    #    os.remove(EXCEL_OUTPUT)
-    #if os.path.exists(JSONL_OUTPUT):
-    #    os.remove(JSONL_OUTPUT)
-    time.sleep(7200)
-    # 读取数据
-    df = pd.read_excel("hymax_literature_khy_20230612_else.xlsx")
-    ready_data = {}
-    with open("output_deepseek_r1_else.jsonl", "r", encoding='utf8') as f:
-        for line in f:
-            data = json.loads(line)
-            ready_data[data["id"]] = True
-
-    # 创建并启动工作线程
-    workers = []
-    for _ in range(NUM_WORKERS):
-        t = threading.Thread(target=worker)
-        t.start()
-        workers.append(t)
-
-    # 启动写入线程
-    writer_thread = threading.Thread(target=writer)
-    writer_thread.start()
-
-    # 填充任务队列
+
+async def reporter(stats, limiter, interval):
+    while True:
+        await asyncio.sleep(interval)
+        stats.report(limiter)
+
+
+def read_rows(path):
+    """流式返回表格中 (id, 摘要)，id 为字符串(xlsx 与 parquet 相同)，过滤空内容和短内容"""
+    for row_id, content in iter_rows(path, columns=[0, 2]):
+        if isinstance(content, str) and len(content) >= 30:  # 预处理过滤短内容
+            yield row_id, content
+
+
+def iter_tasks(args, manifest, duplicates):
+    """返回 (id, 内容, 处理方式)，清单中已完成或失败次数达到上限的行以及近似重复的行被跳过"""
     count = 0
-    for index, row in df.iterrows():
-        if index <= 8000:
-            continue
-        if count >= MAX_TASKS:
+    skipped = 0
+    avoided = 0
+    for row_id, row_content in read_rows(args.input):
+        if count >= args.max_tasks:
             break
-        if row[0] in ready_data:
+        plan = manifest.plan(row_id)
+        if plan == "skip":
+            skipped += 1
             continue
-        if len(row[2]) >= 30:  # 预处理过滤短内容
-            task_queue.put((row[0], row[2]))
-            count += 1
-
-    # 发送终止信号给工作线程
-    for _ in range(NUM_WORKERS):
-        task_queue.put(None)
-
-    # 等待任务完成
-    task_queue.join()
+        if row_id in duplicates:
+            avoided += plan == "call"
+            continue
+        yield row_id, row_content, plan
+        count += plan == "call"
+    print(f"跳过清单中已完成或不再重试的行: {skipped}")
+    if duplicates:
+        print(f"近似重复而跳过、避免的API调用: {avoided}")
+
+
+async def run(args):
+    if args.parquet and args.input.endswith(".xlsx"):
+        parquet = os.path.splitext(args.input)[0] + ".parquet"
+        if not os.path.exists(parquet) or os.path.getmtime(parquet) < os.path.getmtime(args.input):
+            _, n = xlsx_to_parquet(args.input, parquet)
+            print(f"已转换 {args.input} -> {parquet}: {n} 行")
+        args.input = parquet
+    limiter = AdaptiveConcurrency(args.concurrency, args.min_concurrency, args.max_concurrency)
+    stats = ThroughputStats()
+    results = asyncio.Queue(maxsize=1000)
+    store = ResultStore(args.output, args.output + ".jsonl", args.flush_every)
+    manifest = JobManifest(args.manifest or args.output + ".manifest.sqlite", args.max_attempts)
+    for path in args.import_done:
+        print(f"从 {path} 导入已完成的行: {manifest.import_done(path)}")
+    interrupted = manifest.recover()
+    if interrupted:
+        print(f"上次运行中断时在途的行: {interrupted}，重新排队(不计失败次数，已拿到回答的只重新解析)")
+    store.truncate(manifest.get_meta("output_sizes", {}))
+    manifest.report()
+    duplicates = {}
+    if args.dedup:
+        duplicates = dedup_corpus(read_rows(args.input), args.dedup_index or args.output + ".minhash.npz",
+                                  args.dedup_threshold)
+    writer_task = asyncio.create_task(writer(results, store, manifest, args.flush_interval))
+    reporter_task = asyncio.create_task(reporter(stats, limiter, args.report_interval))
+
+    # 在途任务数最多为 max_concurrency，超出的行留在生成器中，内存占用与输入大小无关
+    pending = set()
+    for row_id, row_content, plan in iter_tasks(args, manifest, duplicates):
+        if len(pending) >= args.max_concurrency:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        manifest.pending(row_id)
+        pending.add(asyncio.create_task(
+            process_row(row_id, row_content, plan, limiter, stats, results, manifest, args)))
+    if pending:
+        await asyncio.wait(pending)
+
+    await results.put(None)
+    await writer_task
+    reporter_task.cancel()
+    stats.report(limiter)
+    manifest.report()
+    manifest.close()
+    if args.excel:
+        store.export_excel(args.output + ".xlsx")
 
-    # 发送终止信号给写入线程
-    result_queue.put(None)
 
-    # 等待所有线程结束
-    for t in workers:
-        t.join()
-    writer_thread.join()
+def main():
+    parser = argparse.ArgumentParser(description="调用 deepseek-reasoner 蒸馏实体/关系抽取数据")
+    parser.add_argument("--input", default="hymax_literature_khy_20230612_else.xlsx",
+                        help="文献表格(.xlsx 或 .parquet，第1列 id，第3列摘要)")
+    parser.add_argument("--parquet", action="store_true",
+                        help="先把 xlsx 转换为同名 parquet(已是最新时直接使用)，之后的扫描都读 parquet")
+    parser.add_argument("--manifest", default=None, help="任务清单，默认 <输出前缀>.manifest.sqlite")
+    parser.add_argument("--import-done", nargs="*", default=[],
+                        help="旧版输出的 jsonl(如 output_deepseek_r1_else.jsonl)，其中的id记为已完成")
+    parser.add_argument("--max-attempts", type=int, default=3, help="每行最多失败次数，达到后不再重试")
+    parser.add_argument("--max-tasks", type=int, default=MAX_TASKS, help="本次最多调用API的行数")
+    parser.add_argument("--concurrency", type=int, default=INITIAL_CONCURRENCY, help="初始在途请求数")
+    parser.add_argument("--min-concurrency", type=int, default=1)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="单个请求超时(秒)")
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES)
+    parser.add_argument("--output", default=OUTPUT_PREFIX,
+                        help="输出文件前缀：<前缀>.jsonl(对话与回答)、<前缀>.entities.jsonl、<前缀>.relationships.jsonl")
+    parser.add_argument("--flush-every", type=int, default=50, help="每攒够多少条结果追加写入一次")
+    parser.add_argument("--flush-interval", type=float, default=10, help="最多间隔多少秒写入一次")
+    parser.add_argument("--excel", action="store_true", help="结束后额外导出 <前缀>.xlsx")
+    parser.add_argument("--dedup", action="store_true", help="调用API前对全部摘要做近似去重")
+    parser.add_argument("--dedup-threshold", type=float, default=0.8, help="估计的 Jaccard 不低于该值视为重复")
+    parser.add_argument("--dedup-index", default=None, help="去重签名索引，默认 <输出前缀>.minhash.npz，增量更新")
+    parser.add_argument("--compact-prompt", action="store_true", help="使用精简版 schema prompt")
+    parser.add_argument("--prompt-stats", action="store_true", help="打印两种 prompt 前缀的长度后退出")
+    parser.add_argument("--tokenizer", default=None, help="--prompt-stats 计算 token 数使用的分词器(模型目录或 tokenizer.json)")
+    parser.add_argument("--start-delay", type=float, default=0, help="启动前等待的秒数(如等待限额重置)")
+    parser.add_argument("--report-interval", type=float, default=30, help="打印吞吐的间隔(秒)")
+    args = parser.parse_args()
+
+    if args.prompt_stats:
+        prompt_stats(args.tokenizer)
+        return
+    if args.start_delay > 0:
+        time.sleep(args.start_delay)
+    asyncio.run(run(args))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""
+蒸馏任务的断点续跑清单(SQLite)
+
+每个行 id(字符串，literature_io.iter_rows 返回的 id)记录一个状态：pending(已排队)、in_flight(已发出请求)、
+done(结果已写入输出文件)、failed(失败，附失败次数、最后一次错误以及已付费拿到的回答)。
+状态变化先缓存在内存中，由写入协程与输出文件的追加一起批量提交：done 与输出文件的长度在
+同一个事务中提交，重启时把输出文件截断到已提交的长度，因此输出中每个 id 恰好出现一次。
+付费拿到的回答不等批量提交，到达时立即写入 answer 列并提交；进程崩溃后这些行只重新解析，不会再次调用API。
+"""
+import json
+import sqlite3
+import threading
+import time
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobManifest:
+    """
+    参数:
+        path (str): SQLite 数据库文件路径
+        max_attempts (int): 每行最多失败次数，达到后不再重试
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rows (
+                id TEXT PRIMARY KEY,
+                state TEXT,
+                errors INTEGER,
+                last_error TEXT,
+                answer TEXT,
+                updated REAL
+            )""")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        # id -> [状态, 失败次数, 是否有已付费的回答]
+        self.rows = {row_id: [state, errors, has_answer] for row_id, state, errors, has_answer in
+                     self.conn.execute("SELECT id, state, errors, answer IS NOT NULL FROM rows")}
+        self._updates = {}  # id -> (状态, 失败次数, 错误, 回答)，等待下一次 commit
+
+    def recover(self):
+        """
+        上次运行中断时仍在途的行重新排队，返回这样的行数
+
+        中断不是该行本身的失败，不计入失败次数；已保存回答的行之后只重新解析。
+        """
+        interrupted = [row_id for row_id, (state, _, _) in self.rows.items() if state == IN_FLIGHT]
+        for row_id in interrupted:
+            self._set(row_id, PENDING, self._errors(row_id), "interrupted")
+        self.commit()
+        return len(interrupted)
+
+    def plan(self, row_id):
+        """
+        返回该行的处理方式：
+            "skip": 已完成，或失败次数已达上限
+            "reparse": 之前已拿到回答(解析失败)，只需重新解析，不再调用API
+            "call": 需要调用API
+        """
+        entry = self.rows.get(row_id)
+        if entry is None:
+            return "call"
+        state, errors, has_answer = entry
+        if state == DONE or errors >= self.max_attempts:
+            return "skip"
+        return "reparse" if has_answer else "call"
+
+    def answer(self, row_id):
+        """之前保存的 (回答, 推理内容)，没有时返回 None"""
+        with self.lock:
+            update = self._updates.get(row_id)
+            if update is not None and update[3] is not None:
+                return tuple(json.loads(update[3]))
+            row = self.conn.execute("SELECT answer FROM rows WHERE id = ?", (row_id,)).fetchone()
+        return tuple(json.loads(row[0])) if row and row[0] else None
+
+    def _set(self, row_id, state, errors, error=None, answer=None):
+        with self.lock:
+            entry = self.rows.get(row_id)
+            has_answer = answer is not None or (entry is not None and entry[2])
+            self.rows[row_id] = [state, errors, has_answer]
+            previous = self._updates.get(row_id)
+            if answer is None and previous is not None:
+                answer = previous[3]
+            self._updates[row_id] = (state, errors, error, answer)
+
+    def _errors(self, row_id):
+        entry = self.rows.get(row_id)
+        return entry[1] if entry else 0
+
+    def pending(self, row_id):
+        self._set(row_id, PENDING, self._errors(row_id))
+
+    def start(self, row_id):
+        self._set(row_id, IN_FLIGHT, self._errors(row_id))
+
+    def save_answer(self, row_id, answer):
+        """
+        立即写入并提交已付费拿到的 (回答, 推理内容)
+
+        在结果写入输出文件之前调用，进程在此之后崩溃时，重启后该行按 "reparse" 处理。
+        """
+        answer = json.dumps(answer, ensure_ascii=False)
+        with self.lock:
+            entry = self.rows.setdefault(row_id, [IN_FLIGHT, 0, False])
+            entry[2] = True
+            self.conn.execute(
+                """INSERT INTO rows VALUES (?, ?, ?, NULL, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET answer = excluded.answer, updated = excluded.updated""",
+                (row_id, entry[0], entry[1], answer, time.time()))
+            self.conn.commit()
+
+    def fail(self, row_id, error, answer=None):
+        """记录一次失败；answer 为已付费拿到的 (回答, 推理内容)，保存后重试时不再调用API"""
+        answer = json.dumps(answer, ensure_ascii=False) if answer is not None else None
+        self._set(row_id, FAILED, self._errors(row_id) + 1, error, answer)
+
+    def commit(self, done=(), meta=None):
+        """
+        一个事务提交缓存的状态变化、新完成的行 id 以及 meta(如输出文件长度)
+
+        done 中的行应在调用前已写入输出文件并落盘。
+        """
+        now = time.time()
+        with self.lock:
+            updates, self._updates = self._updates, {}
+            for row_id in done:
+                self.rows[row_id] = [DONE, self._errors(row_id), False]
+                updates[row_id] = (DONE, self.rows[row_id][1], None, None)
+            if not updates and not meta:
+                return
+            # answer 为 NULL 时保留原有的回答，完成的行清空回答
+            self.conn.executemany(
+                """INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET state = excluded.state, errors = excluded.errors,
+                       last_error = excluded.last_error, updated = excluded.updated,
+                       answer = CASE WHEN excluded.state = 'done' THEN NULL
+                                     ELSE COALESCE(excluded.answer, rows.answer) END""",
+                [(row_id, state, errors, error, answer, now)
+                 for row_id, (state, errors, error, answer) in updates.items()])
+            for key, value in (meta or {}).items():
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+            self.conn.commit()
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def import_done(self, path):
+        """把旧版输出 jsonl 中的 id 标记为已完成，返回导入的条数"""
+        ids = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    ids.append(json.loads(line)["id"])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+        self.commit(done=ids)
+        return len(ids)
+
+    def report(self):
+        counts = {}
+        exhausted = 0
+        with self.lock:
+            for state, errors, _ in self.rows.values():
+                counts[state] = counts.get(state, 0) + 1
+                exhausted += state == FAILED and errors >= self.max_attempts
+        states = ", ".join(f"{state} {counts.get(state, 0)}" for state in (DONE, FAILED, PENDING, IN_FLIGHT))
+        print(f"任务清单: {states} (失败达到 {self.max_attempts} 次不再重试: {exhausted}) ({self.path})")
+
+    def close(self):
+        self.commit()
+        with self.lock:
+            self.conn.close()
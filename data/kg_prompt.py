@@ -0,0 +1,250 @@
+"""
+实体/关系抽取的 prompt，蒸馏脚本(get_deepseek_res_multi.py)、SFT 数据集构建与批量推理(src/test/infer.py)共用
+
+- build_prompt: 蒸馏使用的 prompt，不变的前缀(任务说明、schema、输出示例)在导入时构建一次，摘要放在最后，
+  所有请求的前缀逐字相同，可以命中服务端的 prompt 缓存(DeepSeek 按前缀缓存)
+- build_training_prompt: GRPO 训练数据(data/grpo/*.parquet 的 problem 列)的原始布局，摘要在 schema 与输出示例之间，
+  SFT 数据与推理时需与训练时的 prompt 一致
+- extract_abstract: 从蒸馏记录的 prompt(新旧两种布局)中取回摘要，用于按训练布局重建 prompt
+"""
+import json
+
+_FULL_SCHEMA = '''You are a biomedical knowledge graph construction assistant. Perform document analysis and relationship extraction following these strict protocols:
+
+# Processing Workflow
+1. **Schema Identification**
+   - Identification of Entity and Relationship Types:
+   • Identify candidate entities (12 predefined types) 
+   • Detect contextual relationships (26 predefined classes)
+   • Map findings to the following predefined schema:
+
+2. **Entity Recognition** 
+   Types with Definitions:
+   1). Anatomy : Structures or functional parts of the body systems (e.g., organs, tissues, or cellular components). 
+Key distinction: Explicitly excludes pathological states (e.g., "inflamed liver" would belong to disease/symptom).  
+Example: liver, hippocampus, T lymphocytes.
+
+2). Biomarker: A measurable biological indicator (e.g., molecular, genetic, or biochemical) used to assess physiological/pathological states or responses to interventions, typically acting as an indirect indicator (not the direct target of a drug). 
+Example: hemoglobin A1c (HbA1c), C-reactive protein.
+
+3). Complication: A secondary medical condition arising as a direct consequence of a primary disease or medical intervention (e.g., sepsis in burn patients).*  
+Key distinction: Must involve causality to a pre-existing condition.  
+Example: diabetic neuropathy in diabetes mellitus.
+
+4). Disease: A specific pathological disorder with characteristic signs/symptoms, affecting structure or function, not inherently implying a causal relationship to another condition 
+Example: Alzheimer's disease, rheumatoid arthritis.
+
+5). Drug: A chemical substance with therapeutic/diagnostic properties, including generic names, brand names, and investigational compounds. Excludes non-pharmacological interventions (e.g., surgery).  
+Example: aspirin, Bevacizumab (Avastin®).
+
+6). Gene: A functional unit of heredity represented by standardized symbols or names, distinct from gene products (e.g., proteins) classified under "Target" 
+Example: BRCA1, TP53.
+
+7). Side Effect: An unintended physiological response **directly linked to pharmacological actionof a drug at normal doses (e.g., nausea caused by chemotherapy). 
+Key distinction: Requires explicit association with drug exposure.  
+
+8). Symptom: A patient-perceived subjective manifestation of a disease or condition, independent of drug exposure (e.g., fatigue in cancer). 
+Example: fatigue, chest pain.
+
+9). Target: A molecular entity (protein, enzyme, receptor, etc.) directly modulated by a drug to exert therapeutic effects (e.g., ACE2 receptor).  
+Key distinction: Functional interaction with a drug is required.  
+
+10). Test: A diagnostic procedure or assay to detect/measure biological markers, disease states, or treatment responses, excluding the biomarkers themselves  
+Example: MRI scan, ELISA assay.
+
+11). Treatment: A clinical intervention (pharmacological, surgical, or behavioral) intended to prevent/manage diseases, including non-pharmacological approaches (e.g., radiotherapy). 
+Key distinction: Broader scope than "Drug".  
+
+   Annotation Principles:
+   (1) Non-overlapping: Single text span → single entity type
+   (2) Non-nesting: No embedded entities within spans
+   (3) Minimal punctuation: Exclude non-essential conjunctions/punctuation
+
+3. **Relation Extraction** 
+   **Relationship Definitions**  
+1). complication_of | Complication ↔ Disease
+Definition:
+A complication is a secondary medical condition directly arising from a primary disease or its treatment (e.g., surgery, drug therapy). This relationship implies bidirectional causality: the disease initiates the complication, and the complication cannot exist independently of the disease.
+Key distinctions:
+•	Must involve a causal link (e.g., diabetic retinopathy is caused by diabetes, not coincidental).
+•	Excludes unrelated coexisting diseases (e.g., hypertension and asthma in the same patient).
+Examples:
+•	"Diabetic neuropathy" complication_of "Diabetes mellitus" (explicit).
+•	"Sepsis" complication_of "Burn injury" (implicit: burns → infection → sepsis).
+________________________________________
+2). increases_expression_of | Drug ↔ Gene
+Definition:
+A drug pharmacologically enhances the transcription or translation activity of a gene, leading to measurable increases in its mRNA or protein levels. 
+Key distinctions:
+•	Gene expression changes must be drug-specific (not general cellular stress responses).
+Examples:
+•	"Tamoxifen" increases_expression_of "ESR1" (estrogen receptor gene).
+•	"Metformin" increases_expression_of "AMPK" (via metabolic pathway activation).
+________________________________________
+3). is_biomarker_of | Biomarker ↔ Disease
+Definition:
+A biomarker (e.g., protein, metabolite) is objectively measured to indicate the presence, severity, or progression of a disease. The biomarker has diagnostic, prognostic, or therapeutic monitoring utility.
+Key distinctions:
+•	Biomarkers are indicators, not therapeutic targets (contrast with is_target_of).
+Examples:
+•	"CA-125" is_biomarker_of "Ovarian cancer" (diagnostic).
+•	"Tau protein" is_biomarker_of "Alzheimer’s disease" (progression monitoring).
+________________________________________
+4). is_located_in | Disease ↔ Anatomy
+Definition:
+A disease primarily manifests in or affects a specific anatomical structure (organ, tissue, or cell type). The anatomical site is pathologically or functionally central to the disease.
+Key distinctions:
+•	Anatomical specificity is required (e.g., "lung" for pneumonia, not "respiratory system").
+•	Excludes systemic diseases without localized pathology (e.g., sepsis).
+Examples:
+•	"Hepatitis B" is_located_in "Liver" (viral replication in hepatocytes).
+•	"Glioblastoma" is_located_in "Brain" (primary tumor site).
+________________________________________
+5). is_side_effect_of | Side Effect ↔ Drug
+Definition:
+A side effect is an unintended physiological reaction directly attributable to the pharmacological action of a drug at therapeutic doses. The reaction must occur in a statistically significant patient population.
+Key distinctions:
+•	Must exclude symptoms caused by the disease itself (e.g., chemotherapy-induced nausea vs. cancer-related fatigue).
+•	Requires dose-dependency (higher dose → higher risk).
+Examples:
+•	"Hemorrhage" is_side_effect_of "Warfarin" (anticoagulant effect).
+•	"Insomnia" is_side_effect_of "Dexamethasone" (CNS stimulation).
+________________________________________
+6). is_symptom_of | Symptom ↔ Disease
+Definition:
+A symptom is a patient-reported or clinically observed manifestation (subjective or objective) that is pathognomonic or commonly associated with a disease. Symptoms arise from the disease’s pathophysiology.
+Key distinctions:
+•	Symptoms are disease-specific (e.g., "jaundice" in hepatitis).
+•	Excludes nonspecific complaints (e.g., "fatigue" without disease context).
+Examples:
+•	"Dyspnea" is_symptom_of "Heart failure" (fluid accumulation in lungs).
+•	"Hematuria" is_symptom_of "Bladder cancer" (tissue invasion).
+________________________________________
+7). is_target_of | Target ↔ Drug
+Definition:
+A target is a biomolecule (protein, receptor, enzyme) that directly interacts with a drug to mediate its therapeutic effect. The interaction is stoichiometric and mechanistically validated (e.g., binding assays, crystallography).
+Key distinctions:
+•	Targets are functional entities (e.g., HER2 protein, not the HER2 gene).
+Examples:
+•	"ACE2 receptor" is_target_of "Losartan" (angiotensin receptor blocker).
+•	"COX-1 enzyme" is_target_of "Aspirin" (irreversible acetylation).
+________________________________________
+8). treat | Drug ↔ Disease
+Definition:
+A drug is clinically used to alleviate, manage, or cure a disease through a mechanism of action supported by regulatory approval or evidence-based guidelines. The relationship implies therapeutic efficacy.
+Key distinctions:
+•	Requires clinical relevance (e.g., "insulin treats diabetes," not "vitamin C treats common cold").
+Examples:
+•	"Penicillin" treat "Streptococcal pharyngitis" (antibacterial action).
+•	"Sertraline" treat "Major depressive disorder" (SSRI mechanism).
+________________________________________
+9). is_examination_for | Test ↔ Disease
+Definition:
+A test is a standardized diagnostic or monitoring procedure (imaging, lab assay) used to confirm, stage, or track the progression of a disease. The test must have established clinical utility.
+Key distinctions:
+•	Tests are actions/tools, not biomarkers (e.g., "MRI" is a test; "elevated CRP" is a biomarker).
+•	Excludes research-only or experimental assays.
+Examples:
+•	"Colonoscopy" is_examination_for "Colorectal cancer" (diagnostic).
+•	"Electrocardiogram (ECG)" is_examination_for "Myocardial infarction" (diagnostic).
+
+   Annotation Principles:
+   (1) Intra-sentence priority: Prefer relations within single sentences
+   (2) Unidirectionality: Maintain only one directional relation per entity pair
+   (3) Schema compliance: Use only predefined relationship types
+
+# Output Specifications
+• Strict JSON format with two root keys: Entities, Relationships
+• Entity preservation: Maintain original text case and formatting
+• Relationship format: [source_entity, source_type, relationship, target_entity, target_type]
+• Please makesure the entity and relationship is from the input text
+• No null/empty values or placeholder text
+• No explanatory content
+'''
+
+_OUTPUT_EXAMPLE = '''{
+    "Entities": {
+        "Hippocampal formation": "anatomy",
+        "Tau protein phosphorylation": "biomarker",
+        "Neuropsychiatric symptoms": "complication",
+        "Alzheimer's disease": "disease",
+        "Lecanemab": "drug",
+        "APOE ε4 allele": "gene",
+        "Amyloid-related imaging abnormalities": "side effect",
+        "Cognitive decline": "symptom",
+        "Amyloid-β protofibrils": "target",
+        "PET scan": "test",
+        "Anti-amyloid immunotherapy": "treatment"
+    },
+    "Relationships": [
+        ["Alzheimer's disease", "disease", "have_complication", "Neuropsychiatric symptoms", "complication"],
+        ["Lecanemab", "drug", "is_target_drug_of", "Amyloid-β protofibrils", "target"],
+        ["Tau protein phosphorylation", "biomarker", "is_biomarker_of", "Alzheimer's disease", "disease"],
+        ["Cognitive decline", "symptom", "is_symptom_of", "Alzheimer's disease", "disease"],
+        ["APOE ε4 allele", "gene", "increases_expression_of", "Amyloid-β protofibrils", "target"]
+    ]
+}'''
+
+# 精简版 schema：同样的 11 种实体、9 种关系(方向与完整版一致)与标注规则，每条定义压缩为一行，示例去掉缩进
+_COMPACT_SCHEMA = '''You are a biomedical knowledge graph construction assistant. Extract entities and relationships from the input text.
+
+# Entity types
+- anatomy: body structures or functional parts (organs, tissues, cells); excludes pathological states
+- biomarker: measurable molecular/genetic/biochemical indicator of a physiological or pathological state or treatment response, not the direct drug target (e.g. HbA1c)
+- complication: secondary condition directly caused by a primary disease or its treatment
+- disease: specific pathological disorder, not implying causality to another condition
+- drug: therapeutic/diagnostic chemical substance (generic, brand or investigational name); excludes non-pharmacological interventions
+- gene: heritable unit by standard symbol or name; gene products belong to target
+- side effect: unintended response directly caused by a drug at normal doses
+- symptom: patient-perceived manifestation of a disease, independent of drug exposure
+- target: molecule (protein, enzyme, receptor) directly modulated by a drug
+- test: diagnostic procedure or assay, not the measured biomarker
+- treatment: clinical intervention incl. surgery, radiotherapy and behavioral therapy
+One type per span, no nested entities, no extra punctuation or conjunctions.
+
+# Relationships
+- complication_of: complication -> disease; the disease or its treatment causes the complication (not mere coexistence)
+- increases_expression_of: drug -> gene; the drug specifically raises the gene's mRNA or protein level
+- is_biomarker_of: biomarker -> disease; measured indicator of presence, severity or progression, not a drug target
+- is_located_in: disease -> anatomy; the specific organ, tissue or cell where the disease primarily manifests
+- is_side_effect_of: side effect -> drug; unintended reaction caused by the drug at therapeutic doses, not by the disease
+- is_symptom_of: symptom -> disease; manifestation arising from the disease's pathophysiology
+- is_target_of: target -> drug; biomolecule the drug directly binds or modulates for its therapeutic effect
+- treat: drug -> disease; clinically used to alleviate, manage or cure the disease
+- is_examination_for: test -> disease; established diagnostic or monitoring procedure for the disease
+Prefer relations within one sentence, keep one direction per entity pair, use predefined relationship types only.
+
+# Output
+Strict JSON with keys "Entities" ({entity: type}) and "Relationships" ([source_entity, source_type, relationship, target_entity, target_type]).
+Keep the original text of entities, only use entities and relationships from the input text, no empty values, no explanations.
+'''
+
+PROMPT_PREFIX = _FULL_SCHEMA + "\n# Output Example\n" + _OUTPUT_EXAMPLE + "\n\n# Input Text\n"
+# 训练数据生成时去掉了 schema 每行末尾的空白，推理时按相同文本构造，前缀也在导入时构建一次
+TRAINING_PROMPT_PREFIX = "\n".join(line.rstrip() for line in _FULL_SCHEMA.split("\n")) + "\n# Input Text\n"
+TRAINING_PROMPT_SUFFIX = "\n\n# Output Example\n" + _OUTPUT_EXAMPLE
+COMPACT_PROMPT_PREFIX = (_COMPACT_SCHEMA + "Example: "
+                         + json.dumps(json.loads(_OUTPUT_EXAMPLE), ensure_ascii=False) + "\n\n# Input Text\n")
+
+
+def build_prompt(question, compact=False):
+    return (COMPACT_PROMPT_PREFIX if compact else PROMPT_PREFIX) + question
+
+
+def build_training_prompt(question):
+    """与 data/grpo/*.parquet 的 problem 列逐字相同(前缀为 TRAINING_PROMPT_PREFIX，摘要之后是输出示例)"""
+    return TRAINING_PROMPT_PREFIX + question + TRAINING_PROMPT_SUFFIX
+
+
+def extract_abstract(prompt):
+    """
+    取回 prompt 中的摘要，不是本模块构造的 prompt 时返回 None
+
+    摘要放在最后的布局(build_prompt)中摘要是 "# Input Text" 之后的全部内容；
+    旧布局(build_training_prompt 及最初的蒸馏脚本)中摘要之后还有输出示例。
+    """
+    head, sep, rest = prompt.partition("# Input Text\n")
+    if not sep:
+        return None
+    abstract, sep, _ = rest.rpartition("\n\n# Output Example\n")
+    return abstract if sep else rest
@@ -0,0 +1,113 @@
+"""
+文献表格的流式读取，供蒸馏脚本和近似去重使用
+
+- iter_rows: 逐行返回表格的各列，xlsx 用 openpyxl 只读模式解析，parquet 用内存映射按批读取，
+  内存占用与文件大小无关，第一行在打开文件后立即返回；两种文件的单元格都返回字符串(空单元格为 None)，
+  同一份语料无论从哪种文件读取，id 都是相同的字符串
+- xlsx_to_parquet: 把 xlsx 中流水线用到的列(id 与摘要)一次性转换为字符串列的 parquet，之后多次读取
+  (去重 + 蒸馏两遍扫描、重复运行)时不必再解析 xlsx；parquet 中记录各列在 xlsx 中的位置，
+  iter_rows 按 xlsx 的列位置读取两种文件
+
+    python literature_io.py hymax_literature_khy_20230612_else.xlsx
+"""
+import argparse
+import json
+import os
+import time
+
+from openpyxl import load_workbook
+
+# 文献表格中流水线用到的列：第1列 id，第3列摘要
+LITERATURE_COLUMNS = (0, 2)
+_COLUMNS_KEY = b"xlsx_columns"
+
+
+def iter_rows(path, columns=None, batch_size=1024):
+    """
+    逐行返回 tuple，第一行(表头)跳过；单元格按 xlsx_to_parquet 的方式转换为 str，空单元格为 None
+
+    参数:
+        path (str): .xlsx 或 .parquet
+        columns (list): 只返回这些位置(xlsx 中的列位置)的列，None 表示全部列
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path, memory_map=True)
+        names = pf.schema_arrow.names
+        # xlsx_to_parquet 只保留了部分列，按记录的原始位置找到对应的列
+        metadata = pf.schema_arrow.metadata or {}
+        positions = json.loads(metadata[_COLUMNS_KEY]) if _COLUMNS_KEY in metadata else list(range(len(names)))
+        selected = names if columns is None else [names[positions.index(i)] for i in columns]
+        for batch in pf.iter_batches(batch_size=batch_size, columns=selected):
+            yield from zip(*(batch.column(i).to_pylist() for i in range(batch.num_columns)))
+        return
+    wb = load_workbook(path, read_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(min_row=2, values_only=True):
+            if columns is None:
+                yield tuple(_cell_str(cell) for cell in row)
+            else:
+                yield tuple(_cell_str(row[i]) if i < len(row) else None for i in columns)
+    finally:
+        wb.close()
+
+
+def xlsx_to_parquet(path, output=None, columns=LITERATURE_COLUMNS, batch_size=10000):
+    """
+    把 xlsx 第一个工作表中 columns 位置的列流式转换为 parquet，返回输出路径与行数
+
+    各列统一写为字符串(单元格用 str() 转换，空单元格为 null)，同一列中混有字符串与数字 id 时
+    也能写入；表头作为列名，columns 记录在 schema 的 metadata 中。
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    output = output or os.path.splitext(path)[0] + ".parquet"
+    wb = load_workbook(path, read_only=True)
+    rows = wb.worksheets[0].iter_rows(values_only=True)
+    header = next(rows, ())
+    names = []
+    for i in columns:
+        name = header[i] if i < len(header) and header[i] is not None else f"column_{i}"
+        names.append(str(name) if str(name) not in names else f"{name}_{i}")
+    schema = pa.schema([(name, pa.string()) for name in names],
+                       metadata={_COLUMNS_KEY: json.dumps(list(columns)).encode()})
+    n = 0
+    tmp = output + ".tmp"
+    try:
+        with pq.ParquetWriter(tmp, schema) as writer:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    writer.write_table(_to_table(batch, columns, schema, pa))
+                    n += len(batch)
+                    batch = []
+            writer.write_table(_to_table(batch, columns, schema, pa))
+            n += len(batch)
+    finally:
+        wb.close()
+    os.replace(tmp, output)
+    return output, n
+
+
+def _cell_str(cell):
+    return None if cell is None else str(cell)
+
+
+def _to_table(batch, columns, schema, pa):
+    arrays = [pa.array([_cell_str(row[i]) if i < len(row) else None for row in batch],
+                       type=pa.string()) for i in columns]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把文献 xlsx 转换为 parquet")
+    parser.add_argument("input", help="xlsx 文件")
+    parser.add_argument("--output", default=None, help="默认与输入同名的 .parquet")
+    args = parser.parse_args()
+
+    start = time.time()
+    output, n = xlsx_to_parquet(args.input, args.output)
+    print(f"{args.input} -> {output}: {n} 行，耗时 {time.time() - start:.1f}s")
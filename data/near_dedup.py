@@ -0,0 +1,208 @@
+"""
+文献摘要的近似去重(MinHash + LSH)，蒸馏前跳过与已收录摘要近似重复的行
+
+- 摘要规范化后取词的 shingle(默认5个词，中文按字)，词的 crc32 组合成64位 shingle 哈希，
+  再用 num_perm 个 multiply-shift 哈希 (a*x+b mod 2^64)>>32 求 MinHash 签名，全部在 numpy 中向量化计算
+- 签名按 bands x rows 分段分桶，同一桶中的候选再用签名估计 Jaccard，不低于阈值即判为重复
+- 索引(保留下来的摘要签名以及已判定的重复)保存为 npz，下次运行只需计算新增摘要的签名
+
+    python near_dedup.py --input hymax_literature_khy_20230612_else.xlsx --index literature.minhash.npz
+"""
+import argparse
+import os
+import re
+import string
+import time
+import zlib
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[\u4e00-\u9fff]|[^\W_\u4e00-\u9fff]+")
+_PUNCT = str.maketrans({c: " " for c in string.punctuation})
+_FNV_PRIME = np.uint64(0x100000001B3)
+_SHIFT = np.uint64(32)
+
+
+def tokenize(text):
+    """小写后按标点和空白分词，含非 ASCII 字符时中文按字切分"""
+    text = str(text).lower()
+    if text.isascii():
+        return text.translate(_PUNCT).split()
+    return _TOKEN_RE.findall(text)
+
+
+def shingles(text, k=5):
+    """连续 k 个词的64位哈希(逐词 crc32 按 FNV 方式组合)，词数不足 k 时整段作为一个 shingle"""
+    tokens = tokenize(text)
+    hashes = np.fromiter(map(zlib.crc32, map(str.encode, tokens)), dtype=np.uint64, count=len(tokens))
+    k = max(1, min(k, len(tokens)))
+    n = len(tokens) - k + 1
+    if n <= 0:
+        return np.zeros(1, dtype=np.uint64)
+    h = hashes[:n].copy()
+    for j in range(1, k):
+        h *= _FNV_PRIME
+        h ^= hashes[j:j + n]
+    return h
+
+
+def lsh_params(threshold, num_perm):
+    """
+    选择 bands x rows <= num_perm，使候选概率曲线 1-(1-s^rows)^bands 的拐点 (1/bands)^(1/rows) 最接近阈值；
+    拐点略低于阈值时漏判更少，误报由签名估计的 Jaccard 再过滤一次
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        knee = (1 / bands) ** (1 / rows)
+        score = abs(knee - threshold) + (0.05 if knee > threshold else 0.0)
+        if best is None or score < best[0]:
+            best = (score, bands, rows)
+    return best[1], best[2]
+
+
+class MinHashIndex:
+    """
+    参数:
+        threshold (float): Jaccard 相似度不低于该值视为重复
+        num_perm (int): 签名长度
+        shingle (int): 每个 shingle 的词数
+        seed (int): 哈希参数的随机种子，持久化的索引必须使用相同的 num_perm/shingle/seed
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, shingle=5, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.randint(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.ids = []
+        self.signatures = []
+        self.duplicates = {}  # id -> (重复的摘要 id, 估计的 Jaccard)
+        self._known = {}  # id -> 签名编号
+        self._buckets = [{} for _ in range(self.bands)]
+
+    def signature(self, text):
+        h = self.a * shingles(text, self.shingle)  # uint64 溢出即 mod 2^64
+        h += self.b
+        # 高32位的最小值等于64位最小值的高32位，先取最小值再移位
+        return (h.min(axis=1) >> _SHIFT).astype(np.uint32)
+
+    def _band_keys(self, sig):
+        r = self.rows
+        return [sig[i * r:(i + 1) * r].tobytes() for i in range(self.bands)]
+
+    def query(self, sig):
+        """返回 (最相似的已收录摘要 id, 估计的 Jaccard)，没有达到阈值的候选时返回 (None, 0)"""
+        candidates = set()
+        for band, key in enumerate(self._band_keys(sig)):
+            candidates.update(self._buckets[band].get(key, ()))
+        best, best_sim = None, 0.0
+        for i in candidates:
+            sim = float(np.count_nonzero(self.signatures[i] == sig)) / self.num_perm
+            if sim > best_sim:
+                best, best_sim = i, sim
+        if best is None or best_sim < self.threshold:
+            return None, 0.0
+        return self.ids[best], best_sim
+
+    def _insert(self, doc_id, sig):
+        i = len(self.ids)
+        self.ids.append(doc_id)
+        self.signatures.append(sig)
+        self._known[doc_id] = i
+        for band, key in enumerate(self._band_keys(sig)):
+            self._buckets[band].setdefault(key, []).append(i)
+
+    def add(self, doc_id, text):
+        """
+        加入一篇摘要，返回 (重复的摘要 id, 估计的 Jaccard)；不重复时收录并返回 (None, 0)
+
+        已见过的 id 直接返回之前的判定结果，不再计算签名。
+        """
+        if doc_id in self._known:
+            return None, 0.0
+        if doc_id in self.duplicates:
+            return self.duplicates[doc_id]
+        sig = self.signature(text)
+        dup_of, sim = self.query(sig)
+        if dup_of is None:
+            self._insert(doc_id, sig)
+        else:
+            self.duplicates[doc_id] = (dup_of, sim)
+        return dup_of, sim
+
+    def save(self, path):
+        """先写临时文件再替换，中断时不会留下损坏的索引"""
+        tmp = path + ".tmp.npz"
+        dup_ids = list(self.duplicates)
+        np.savez(tmp,
+                 params=np.array([self.num_perm, self.shingle, self.seed]),
+                 ids=np.array(self.ids, dtype=str),
+                 signatures=(np.stack(self.signatures) if self.signatures
+                             else np.zeros((0, self.num_perm), dtype=np.uint32)),
+                 dup_ids=np.array(dup_ids, dtype=str),
+                 dup_of=np.array([self.duplicates[i][0] for i in dup_ids], dtype=str),
+                 dup_sim=np.array([self.duplicates[i][1] for i in dup_ids], dtype=np.float32))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, threshold=0.8, num_perm=128, shingle=5, seed=1):
+        """读取已保存的索引；阈值可以与保存时不同，分桶按新阈值重建"""
+        index = cls(threshold, num_perm, shingle, seed)
+        if not os.path.exists(path):
+            return index
+        data = np.load(path)
+        if tuple(data["params"]) != (num_perm, shingle, seed):
+            raise ValueError(f"{path} 的签名参数 {tuple(data['params'])} 与 (num_perm, shingle, seed)="
+                             f"{(num_perm, shingle, seed)} 不一致")
+        for doc_id, sig in zip(data["ids"].tolist(), data["signatures"]):
+            index._insert(doc_id, sig)
+        for doc_id, dup_of, sim in zip(data["dup_ids"].tolist(), data["dup_of"].tolist(), data["dup_sim"].tolist()):
+            index.duplicates[doc_id] = (dup_of, sim)
+        return index
+
+
+def dedup_corpus(rows, index_path=None, threshold=0.8, num_perm=128, shingle=5):
+    """
+    对 (id, 摘要) 序列去重
+
+    返回:
+        duplicates (dict): {id: (重复的摘要 id, 估计的 Jaccard)}，包含之前运行已判定的重复
+    """
+    start = time.time()
+    if index_path:
+        index = MinHashIndex.load(index_path, threshold, num_perm, shingle)
+    else:
+        index = MinHashIndex(threshold, num_perm, shingle)
+    known = len(index.ids) + len(index.duplicates)
+    n = 0
+    for doc_id, text in rows:
+        index.add(doc_id, text)
+        n += 1
+    if index_path:
+        index.save(index_path)
+    print(f"近似去重: {n} 篇摘要，索引中原有 {known} 篇，收录 {len(index.ids)} 篇，重复 {len(index.duplicates)} 篇 "
+          f"(Jaccard >= {threshold}, bands={index.bands} rows={index.rows})，耗时 {time.time() - start:.1f}s")
+    return index.duplicates
+
+
+if __name__ == "__main__":
+    from literature_io import iter_rows
+
+    parser = argparse.ArgumentParser(description="文献摘要近似去重统计")
+    parser.add_argument("--input", required=True, help="文献表格(.xlsx 或 .parquet，第1列 id，第3列摘要)")
+    parser.add_argument("--index", default=None, help="签名索引 npz，存在时增量更新")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--shingle", type=int, default=5)
+    parser.add_argument("--show", type=int, default=10, help="打印的重复样例数")
+    args = parser.parse_args()
+
+    rows = ((doc_id, text) for doc_id, text in iter_rows(args.input, columns=[0, 2]) if isinstance(text, str))
+    duplicates = dedup_corpus(rows, args.index, args.threshold, args.num_perm, args.shingle)
+    for doc_id, (dup_of, sim) in list(duplicates.items())[:args.show]:
+        print(f"{doc_id} ~ {dup_of} ({sim:.2f})")
@@ -1,15 +1,70 @@
+import argparse
 import json
-import pandas as pd
-import time
+import os
+import re
 from openpyxl import Workbook
 
 from openai import OpenAI
 
-client = OpenAI(api_key="sk-xxxxx", base_url="https://api.deepseek.com")
+from judge import TokenBucket, chat_with_retry, estimate_tokens, pack_by_budget, run_ordered
+from judge_cache import VerdictCache
+from local_match import best_gold_match, prematch_entities, prematch_relationships
+from result_io import JsonlIndex, chunked, export_verdicts_parquet, iter_jsonl, load_done_ids
+
+JUDGE_MODEL = "deepseek-chat"
+JUDGE_TEMPERATURE = 0.01
+
+client = OpenAI(api_key=os.environ.get("JUDGE_API_KEY", "sk-xxxxx"),
+                base_url=os.environ.get("JUDGE_BASE_URL", "https://api.deepseek.com"))
+
+def cached_verdict(prompt, cache):
+    """查询评判缓存，命中时返回 (n_true, result)，结果行末尾附加来源 cache"""
+    if cache is None:
+        return None
+    hit = cache.get(cache.make_key(prompt, JUDGE_MODEL, JUDGE_TEMPERATURE))
+    if hit is None:
+        return None
+    return hit["n_true"], [row + ["cache"] for row in hit["result"]]
+
+def store_verdict(prompt, cache, res, n_true, result):
+    if cache is not None and res:
+        cache.put(cache.make_key(prompt, JUDGE_MODEL, JUDGE_TEMPERATURE), JUDGE_MODEL, res, n_true, result)
+
+def run_judge(prompt, parse, limiter=None, cache=None):
+    """调用评判模型并解析结果，命中缓存时直接返回缓存的解析结果；每行结果末尾附加来源(llm/cache)"""
+    hit = cached_verdict(prompt, cache)
+    if hit is not None:
+        return hit
+    res = chat_with_retry(client, prompt, JUDGE_MODEL, limiter, temperature=JUDGE_TEMPERATURE)
+    n_true, result = parse(res)
+    store_verdict(prompt, cache, res, n_true, result)
+    return n_true, [row + ["llm"] for row in result]
+
+def prematch_rows(prematch, standard_answer, test_result, match_mode="local", threshold=0.8):
+    """按 match_mode 做本地判定，返回 (本地判定正确数, 本地结果行, 待评判行)"""
+    if match_mode == "llm":
+        return 0, [], test_result
+    n_local, local_result, residue = prematch(standard_answer, test_result, match_mode == "offline", threshold)
+    return n_local, [row + ["local"] for row in local_result], residue
+
+def judge_with_prematch(prematch, build_prompt, parse, standard_answer, test_result,
+                        limiter=None, cache=None, match_mode="local", threshold=0.8):
+    """
+    先用本地规则判定明确的行，只把剩余行交给评判模型
+
+    match_mode:
+        llm: 全部交给评判模型
+        local: 本地规则 + 评判模型
+        offline: 仅本地规则，剩余行按相似度阈值判定
+    """
+    n_local, local_result, residue = prematch_rows(prematch, standard_answer, test_result, match_mode, threshold)
+    if not residue:
+        return n_local, local_result
+    n_true, result = run_judge(build_prompt(standard_answer, residue), parse, limiter, cache)
+    return n_local + n_true, local_result + result
 
-def compare_entities(standard_answer, test_result):
-    conversation = []
-    prompt = '''你是一个实体识别结果的评判官，负责根据标准答案判定模型识别结果是否正确，最后给出评估的得分
+def build_entity_prompt(standard_answer, test_result):
+    return '''你是一个实体识别结果的评判官，负责根据标准答案判定模型识别结果是否正确，最后给出评估的得分
 
 ## 注意
 1. 判断依据来源于标准答案，请不要使用自己的知识
@@ -31,29 +86,8 @@ disease|Gliomas|正确
 treatment|conventional therapeutic strategies|错误
 target|growth factor receptor protein tyrosine kinase (PTK)|正确
 '''
-    retry = 0
-    res = ""
-    while retry < 10:
-        try:
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant"},
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=8192,
-                temperature=0.01,
-                stream=False
-            )
-            res = response.choices[0].message.content
-            #print(response)
-            break
-        except Exception as e:
-            retry += 1
-            time.sleep(30)
-            print(time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(time.time())))
-            print("get deepseek response error! retry!")
-            print(e)
+
+def parse_entity_verdict(res):
     n_true = 0
     result = []
     for line in res.split("\n"):
@@ -70,9 +104,12 @@ target|growth factor receptor protein tyrosine kinase (PTK)|正确
                 result.append([line[0], line[1], line[2]])
     return n_true, result
 
-def compare_relationships(standard_answer, test_result):
-    conversation = []
-    prompt = '''你是一个知识图谱关系识别结果的评判官，负责根据标准答案判定模型识别结果是否正确，最后给出评估的得分
+def compare_entities(standard_answer, test_result, limiter=None, cache=None, match_mode="local", threshold=0.8):
+    return judge_with_prematch(prematch_entities, build_entity_prompt, parse_entity_verdict,
+                               standard_answer, test_result, limiter, cache, match_mode, threshold)
+
+def build_relationship_prompt(standard_answer, test_result):
+    return '''你是一个知识图谱关系识别结果的评判官，负责根据标准答案判定模型识别结果是否正确，最后给出评估的得分
 
 ## 注意
 1. 判断依据来源于标准答案，请不要使用自己的知识
@@ -93,29 +130,8 @@ def compare_relationships(standard_answer, test_result):
 实体名称1|关系|实体名称2|判定结果
 Cerebral atherosclerosis (AS)|is_located_in|aged brain|错误
 '''
-    retry = 0
-    res = ""
-    while retry < 10:
-        try:
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant"},
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=8192,
-                temperature=0.01,
-                stream=False
-            )
-            res = response.choices[0].message.content
-            #print(response)
-            break
-        except Exception as e:
-            retry += 1
-            time.sleep(30)
-            print(time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(time.time())))
-            print("get deepseek response error! retry!")
-            print(e)
+
+def parse_relationship_verdict(res):
     n_true = 0
     result = []
     for line in res.split("\n"):
@@ -132,6 +148,116 @@ Cerebral atherosclerosis (AS)|is_located_in|aged brain|错误
                 result.append([line[0], line[1], line[2], line[3]])
     return n_true, result
 
+def compare_relationships(standard_answer, test_result, limiter=None, cache=None, match_mode="local", threshold=0.8):
+    return judge_with_prematch(prematch_relationships, build_relationship_prompt, parse_relationship_verdict,
+                               standard_answer, test_result, limiter, cache, match_mode, threshold)
+
+# 批量评判：多个文档、两类任务打包进同一个请求，按 <doc> 标签拆分结果
+JUDGE_TASKS = {
+    "entity": (prematch_entities, build_entity_prompt, parse_entity_verdict),
+    "relationship": (prematch_relationships, build_relationship_prompt, parse_relationship_verdict),
+}
+JUDGE_COMPARE = {
+    "entity": compare_entities,
+    "relationship": compare_relationships,
+}
+BATCH_SECTION_RE = re.compile(r'<doc id="([^"]*)" task="(entity|relationship)">\s*(.*?)\s*</doc>', re.DOTALL)
+
+def build_batch_prompt(items):
+    """items: [(doc_id, task, standard_answer, test_result)]"""
+    sections = []
+    for doc_id, task, standard_answer, test_result in items:
+        sections.append(f'<doc id="{doc_id}" task="{task}">\n## 标准答案\n'
+                        + "\n".join(["|".join(ans) for ans in standard_answer])
+                        + "\n## 模型识别结果\n"
+                        + "\n".join(["|".join(ans) for ans in test_result])
+                        + "\n</doc>")
+    return '''你是一个知识图谱抽取结果的评判官，负责根据标准答案判定模型识别结果是否正确。下面包含多个评判任务，每个任务用 <doc id="文档编号" task="任务类型"> 和 </doc> 包裹，请对每个任务分别独立评判
+
+## 注意
+1. 判断依据来源于该任务自己的标准答案，请不要使用自己的知识，也不要参考其他任务
+2. task="entity" 为实体识别任务，数据格式为 实体类别|实体名称，识别结果与标准答案之间的主体一致即认为是正确，忽略大小写，缩写，备注等信息
+3. task="relationship" 为关系识别任务，数据格式为 实体名称1|关系|实体名称2，实体和关系都一致才能认为是正确，有一项不一致就是错误，实体和关系的名称需要忽略大小写，缩写，备注等信息
+4. 输出每个任务中识别结果的每一行的判定结果，并用与输入相同的 <doc> 标签包裹，不要遗漏任务
+
+## 评判任务
+''' + "\n\n".join(sections) + '''
+
+## 输出格式
+<doc id="文档编号" task="entity">
+disease|Gliomas|正确
+treatment|conventional therapeutic strategies|错误
+</doc>
+<doc id="文档编号" task="relationship">
+Cerebral atherosclerosis (AS)|is_located_in|aged brain|错误
+</doc>
+'''
+
+def parse_batch_verdict(res):
+    """返回 {(doc_id, task): 该任务的判定结果文本}"""
+    return {(m.group(1), m.group(2)): m.group(3) for m in BATCH_SECTION_RE.finditer(res)}
+
+def judge_batch(items, limiter=None, cache=None):
+    """
+    一次请求评判多个任务；某个任务的结果缺失或行数与识别结果不一致时，单独重新评判该任务
+
+    返回:
+        list: 与 items 对应的 (n_true, result)
+    """
+    res = chat_with_retry(client, build_batch_prompt(items), JUDGE_MODEL, limiter, temperature=JUDGE_TEMPERATURE)
+    sections = parse_batch_verdict(res)
+    verdicts = []
+    for doc_id, task, standard_answer, test_result in items:
+        _, build_prompt, parse = JUDGE_TASKS[task]
+        prompt = build_prompt(standard_answer, test_result)
+        section = sections.get((doc_id, task))
+        if section is not None:
+            n_true, result = parse(section)
+            if len(result) == len(test_result):
+                # 以单文档prompt为键写入缓存，批量与单文档模式共享缓存
+                store_verdict(prompt, cache, section, n_true, result)
+                verdicts.append((n_true, [row + ["llm"] for row in result]))
+                continue
+        verdicts.append(run_judge(prompt, parse, limiter, cache))
+    return verdicts
+
+def judge_jobs_batched(jobs, limiter=None, cache=None, match_mode="local", threshold=0.8,
+                       batch_tokens=6000, max_workers=8):
+    """
+    jobs: [(doc_id, task, standard_answer, test_result)]，返回与 jobs 对应的 (n_true, result)
+
+    本地判定与缓存命中之后剩余的任务按 token 预算打包，每个包一次请求。
+    """
+    verdicts = []
+    pending = []
+    for i, (doc_id, task, standard_answer, test_result) in enumerate(jobs):
+        prematch, build_prompt, _ = JUDGE_TASKS[task]
+        n_local, local_result, residue = prematch_rows(prematch, standard_answer, test_result, match_mode, threshold)
+        verdicts.append((n_local, local_result))
+        if not residue:
+            continue
+        hit = cached_verdict(build_prompt(standard_answer, residue), cache)
+        if hit is not None:
+            verdicts[i] = (n_local + hit[0], local_result + hit[1])
+            continue
+        pending.append((i, (doc_id, task, standard_answer, residue)))
+
+    def cost(entry):
+        _, (doc_id, task, standard_answer, residue) = entry
+        rows = "\n".join(["|".join(ans) for ans in residue])
+        # 输入包含标准答案与识别结果，输出约等于识别结果加判定
+        return estimate_tokens("\n".join(["|".join(ans) for ans in standard_answer])) + 2 * estimate_tokens(rows)
+
+    batches = pack_by_budget(pending, cost, batch_tokens)
+    batch_verdicts = run_ordered(lambda batch: judge_batch([item for _, item in batch], limiter, cache),
+                                 batches, max_workers)
+    for batch, results in zip(batches, batch_verdicts):
+        for (i, _), (n_true, result) in zip(batch, results):
+            verdicts[i] = (verdicts[i][0] + n_true, verdicts[i][1] + result)
+    if batches:
+        print(f"批量评判: {len(pending)} 个任务打包为 {len(batches)} 个请求")
+    return verdicts
+
 def calculate_metrics(true_list, pred_list):
     true_set = set(true_list)
     pred_set = set(pred_list)
@@ -167,16 +293,16 @@ def print_metrics_table(metrics_dict):
 
 def write_lists_to_excel(data, excel_filename):
     """
-    将二维列表写入Excel文件
+    将二维列表写入Excel文件，使用 write_only 模式逐行写出，不在内存中保留整个工作表
     
     参数:
-        data (list of lists): 要写入的二维数据，每个子列表代表一行
+        data (iterable of lists): 要写入的二维数据，每个子列表代表一行，可以是生成器
         excel_filename (str): 要保存的Excel文件名（包括.xlsx后缀）
     """
     try:
-        # 创建一个新的工作簿
-        wb = Workbook()
-        ws = wb.active
+        # 创建一个新的只写工作簿
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
         
         # 遍历数据并写入Excel
         for row in data:
@@ -188,43 +314,78 @@ def write_lists_to_excel(data, excel_filename):
     except Exception as e:
         print(f"写入Excel文件时出错: {e}")
 
-def compare_json_files(std_answer_file, test_result_file, outputdir='./'):
-    std_answer_docs = []
-    test_result_docs = []
-
-    with open(std_answer_file, 'r') as f:
-        for line in f:
-            std_answer_docs.append(json.loads(line.lower()))
+def build_jobs(std_doc, test_doc):
+    """一篇文档对应实体、关系两个评判任务 (doc_id, task, 标准答案, 识别结果)"""
+    std_entities = [[e['entity_type'], e['name']] for e in std_doc['entities']]
+    test_entities = [[e['entity_type'], e['name']] for e in test_doc['entities']]
+
+    for e in test_doc['relationships']:
+        if e['relationship'].find("_") > 0:
+            e['relationship'] = e['relationship'].replace("_", " ")
+    std_relationships = [[e['entity_name1'], e['relationship'], e['entity_name2']] for e in std_doc['relationships']]
+    test_relationships = [[e['entity_name1'], e['relationship'], e['entity_name2']] for e in test_doc['relationships']]
+    return [(std_doc['id'], "entity", std_entities, test_entities),
+            (std_doc['id'], "relationship", std_relationships, test_relationships)]
+
+def iter_doc_pairs(std_index, test_result_file, skip_ids):
+    """按识别结果文件的顺序产生 (标准答案, 识别结果)，跳过标准答案中没有的、已评测的和重复的文档"""
+    seen = set()
+    for test_doc in iter_jsonl(test_result_file, lower=True):
+        doc_id = test_doc.get('id')
+        if doc_id in seen or doc_id in skip_ids or doc_id not in std_index:
+            continue
+        seen.add(doc_id)
+        yield std_index.get(doc_id), test_doc
 
-    with open(test_result_file, 'r') as f:
-        for line in f:
-            try:
-                test_result_docs.append(json.loads(line.lower()))
-            except:
-                continue
+def compare_json_files(std_answer_file, test_result_file, outputdir='./', max_workers=8, requests_per_second=5.0,
+                       cache=None, match_mode="local", threshold=0.8, batch_tokens=0, resume=False, window=256,
+                       excel=False):
+    """
+    流式评测：逐批读取识别结果，评判后把逐文档结果追加写入 <outputdir>doc_results.jsonl
 
-    #std_answer_docs = std_answer_docs[:5]
-    # Filter out documents from the test result that are not present in the standard answer
-    test_result_docs = {doc['id']: doc for doc in test_result_docs}
-    std_answer_docs = {doc['id']: doc for doc in std_answer_docs}
-    common_doc_ids = set(std_answer_docs.keys()) & set(test_result_docs.keys())
-
-    std_answer_docs = [std_answer_docs[doc_id] for doc_id in common_doc_ids]
-    test_result_docs = [test_result_docs[doc_id] for doc_id in common_doc_ids]
-
-    docid_2_doc = {}
-    for doc in std_answer_docs:
-        docid_2_doc[doc['id']] = doc['content']
-    #print('len(std_answer_docs):', len(std_answer_docs))
-    #print('len(test_result_docs):', len(test_result_docs))
-    #print(std_answer_docs[0])
-    #print(test_result_docs[0])
-
-    # Initialize empty lists to store ground truth and predicted entities, relationships, and attributes
-    true_entities = []
-    pred_entities = []
-    true_relationships = []
-    pred_relationships = []
+    resume 为真时跳过 doc_results.jsonl 中已评测的文档，最终指标基于该文件中的全部文档计算。
+    评测结束后判定结果写为 <outputdir>verdicts.parquet，excel 为真时另外导出两个 xlsx 文件。
+    """
+    std_index = JsonlIndex(std_answer_file, lower=True)
+    results_file = outputdir + 'doc_results.jsonl'
+    if resume:
+        done_ids = load_done_ids(results_file)
+        print(f"断点续评: 跳过已评测的 {len(done_ids)} 篇文档")
+    else:
+        done_ids = set()
+        open(results_file, 'w').close()
+
+    limiter = TokenBucket(requests_per_second)
+    n_docs = 0
+    with open(results_file, 'a', encoding='utf-8') as sink:
+        for pairs in chunked(iter_doc_pairs(std_index, test_result_file, done_ids), window):
+            jobs = [job for std_doc, test_doc in pairs for job in build_jobs(std_doc, test_doc)]
+            if batch_tokens > 0 and match_mode != "offline":
+                verdicts = judge_jobs_batched(jobs, limiter, cache, match_mode, threshold, batch_tokens, max_workers)
+            else:
+                verdicts = run_ordered(lambda job: JUDGE_COMPARE[job[1]](job[2], job[3], limiter, cache, match_mode, threshold),
+                                       jobs, max_workers)
+            for i in range(0, len(jobs), 2):
+                doc_id, _, std_entities, test_entities = jobs[i]
+                _, _, std_relationships, test_relationships = jobs[i + 1]
+                right, result = verdicts[i]
+                right1, result1 = verdicts[i + 1]
+                # 逐文档的 [判定正确数, 标准答案数, 识别结果数] 及判定结果，供断点续评和 significance.py 使用
+                record = {
+                    "id": doc_id,
+                    "entity": [right, len(std_entities), len(test_entities)],
+                    "relationship": [right1, len(std_relationships), len(test_relationships)],
+                    "entity_results": result,
+                    "relationship_results": result1,
+                    "entity_gold_match": [best_gold_match("entity", row, std_entities) for row in result],
+                    "relationship_gold_match": [best_gold_match("relationship", row, std_relationships)
+                                                for row in result1],
+                }
+                sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+            sink.flush()
+            n_docs += len(pairs)
+            print(f"已评测 {n_docs} 篇文档")
+    std_index.close()
 
     n_entity_right = 0
     n_entity_test = 0
@@ -234,30 +395,18 @@ def compare_json_files(std_answer_file, test_result_file, outputdir='./'):
     n_relationship_test = 0
     n_relationship_std = 0
 
-    entity_results = []
-    relationship_results = []
-
-    for std_doc, test_doc in zip(std_answer_docs, test_result_docs):
-        std_entities = [[e['entity_type'], e['name']] for e in std_doc['entities']]
-        test_entities = [[e['entity_type'], e['name']] for e in test_doc['entities']]
-
-        right, result = compare_entities(std_entities, test_entities)
-        n_entity_right += right
-        n_entity_std += len(std_entities)
-        n_entity_test += len(test_entities)
-        entity_results.extend(result)
-
-        for e in test_doc['relationships']:
-            if e['relationship'].find("_") > 0:
-                e['relationship'] = e['relationship'].replace("_", " ")
-        std_relationships = [[e['entity_name1'], e['relationship'], e['entity_name2']] for e in std_doc['relationships']]
-        test_relationships = [[e['entity_name1'], e['relationship'], e['entity_name2']] for e in test_doc['relationships']]
-        
-        right1, result1 = compare_relationships(std_relationships, test_relationships)
-        n_relationship_right += right1
-        n_relationship_std += len(std_relationships)
-        n_relationship_test += len(test_relationships)
-        relationship_results.extend(result1)
+    n_local = 0
+    n_rows = 0
+    for record in iter_jsonl(results_file):
+        n_entity_right += record['entity'][0]
+        n_entity_std += record['entity'][1]
+        n_entity_test += record['entity'][2]
+        n_relationship_right += record['relationship'][0]
+        n_relationship_std += record['relationship'][1]
+        n_relationship_test += record['relationship'][2]
+        for row in record['entity_results'] + record['relationship_results']:
+            n_local += row[-1] == "local"
+            n_rows += 1
 
     # Calculate metrics for entities, relationships, and attributes
     entity_metrics = calculate_metrics1(n_entity_right, n_entity_std, n_entity_test)
@@ -267,15 +416,52 @@ def compare_json_files(std_answer_file, test_result_file, outputdir='./'):
         "Entities": entity_metrics,
         "Relationships": relationship_metrics
     }
-    write_lists_to_excel(entity_results, outputdir + 'entity_results.xlsx')
-    write_lists_to_excel(relationship_results, outputdir + 'relationship_results.xlsx')
+    export_verdicts_parquet(results_file, outputdir + 'verdicts.parquet')
+    if excel:
+        write_lists_to_excel((row for record in iter_jsonl(results_file) for row in record['entity_results']),
+                             outputdir + 'entity_results.xlsx')
+        write_lists_to_excel((row for record in iter_jsonl(results_file) for row in record['relationship_results']),
+                             outputdir + 'relationship_results.xlsx')
     print_metrics_table(metrics_dict)
-
-#time.sleep(4000)
-# Replace 'std_answer.json' and 'test_result.json' with the actual paths to your JSON files
-compare_json_files('../data/test_new.json', '../test/output_deepseek_r1_2.xlsx.json','../result/deepseek-r1-')
-#compare_json_files('../data/test_new.json', '../test/output_qwen2.5-7b-grpo1.xlsx.json', '../result/7b-grpo1-')
-#compare_json_files('../data/test_new.json', '../test/output_qwen2.5-7b-600-grpo.xlsx.json', '../result/7b-600-grpo-')
-#compare_json_files('../data/test_new.json', '../test/output_qwen2.5-7b-grpo.xlsx.json', '../result/7b-grpo-')
-#compare_json_files('../data/test_new.json', '../test/output_qwen2.5-0.5b-grpo.xlsx.json', '../result/0.5b-grpo-')
-exit()
+    print(f"本地规则判定: {n_local}/{n_rows} ({n_local / n_rows if n_rows > 0 else 0:.1%})")
+    if cache is not None:
+        cache.report()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="使用LLM评判模型计算实体/关系抽取的P/R/F1")
+    parser.add_argument("--std", default='../data/test_new.json', help="标准答案文件(jsonl)")
+    parser.add_argument("--pred", default='../test/output_deepseek_r1_2.xlsx.json', help="模型识别结果文件(jsonl)")
+    parser.add_argument("--outputdir", default='../result/deepseek-r1-', help="结果文件前缀")
+    parser.add_argument("--workers", type=int, default=8, help="并发评判请求数，1为串行")
+    parser.add_argument("--rps", type=float, default=5.0, help="每秒最大评判请求数，<=0不限流")
+    parser.add_argument("--base-url", default=None, help="OpenAI兼容的评判服务地址，可指向本地桩服务")
+    parser.add_argument("--match", choices=["llm", "local", "offline"], default="local",
+                        help="llm: 全部由评判模型判定; local: 本地规则优先; offline: 仅本地规则，不调用API")
+    parser.add_argument("--match-threshold", type=float, default=0.8, help="offline 模式的词集合相似度阈值")
+    parser.add_argument("--batch-tokens", type=int, default=0,
+                        help="批量评判时每个请求的token预算，多个文档打包进一个请求；0为逐文档评判")
+    parser.add_argument("--resume", action="store_true", help="跳过 <outputdir>doc_results.jsonl 中已评测的文档")
+    parser.add_argument("--window", type=int, default=256, help="每批读取并评测的文档数，每批评完即写入结果")
+    parser.add_argument("--excel", action="store_true", help="另外导出 entity_results.xlsx / relationship_results.xlsx")
+    parser.add_argument("--cache", default='../result/judge_cache.sqlite', help="评判结果缓存文件")
+    parser.add_argument("--no-cache", action="store_true", help="不读写评判结果缓存")
+    parser.add_argument("--cache-max-mb", type=float, default=None, help="缓存大小上限(MB)")
+    parser.add_argument("--cache-max-age-days", type=float, default=None, help="缓存条目最长保留天数")
+    args = parser.parse_args()
+
+    if args.base_url:
+        client = OpenAI(api_key=client.api_key, base_url=args.base_url)
+    cache = None
+    if not args.no_cache and args.match != "offline":
+        max_bytes = int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb is not None else None
+        cache = VerdictCache(args.cache, max_bytes, args.cache_max_age_days)
+    compare_json_files(args.std, args.pred, args.outputdir, args.workers, args.rps, cache,
+                       args.match, args.match_threshold, args.batch_tokens, args.resume,
+                       args.window, args.excel)
+    if cache is not None:
+        cache.close()
+    # 其他对比模型:
+    # --pred ../test/output_qwen2.5-7b-grpo1.xlsx.json --outputdir ../result/7b-grpo1-
+    # --pred ../test/output_qwen2.5-7b-600-grpo.xlsx.json --outputdir ../result/7b-600-grpo-
+    # --pred ../test/output_qwen2.5-7b-grpo.xlsx.json --outputdir ../result/7b-grpo-
+    # --pred ../test/output_qwen2.5-0.5b-grpo.xlsx.json --outputdir ../result/0.5b-grpo-
@@ -0,0 +1,236 @@
+"""
+批量推理：把测试集摘要发送到 OpenAI 兼容的推理服务(如 vLLM)，生成 eval.py 使用的识别结果文件
+
+- prompt 与 GRPO 训练数据逐字相同(data/kg_prompt.build_training_prompt + EasyR1 的 format prompt)，
+  所有请求共享 schema 前缀：先单独发送一条请求让服务端缓存前缀(vLLM --enable-prefix-caching)，
+  其余请求按 prompt 从长到短排序后以高并发发出，长文档先开始，尾部等待更短
+- 每完成一篇即追加写入输出 jsonl；重新运行时跳过已写入的 id，文件末尾写了一半的行会被截掉
+- 回复按奖励函数的方式取 <answer> 中的 JSON(没有 answer 标签时取 </think> 之后的内容)，
+  转换为 {"id", "entities": [{entity_type, name}], "relationships": [{entity_name1, relationship, entity_name2, ...}]}
+- 结束时报告 token 吞吐、每篇文档延迟的分位数以及无法解析的回复数
+
+    python -m vllm.entrypoints.openai.api_server --model /datadisk/ckpt/qwen2_5_7b_kg --enable-prefix-caching
+    python infer.py --pred ../test/output_qwen2.5-7b-grpo.xlsx.json
+    python eval.py --pred ../test/output_qwen2.5-7b-grpo.xlsx.json --outputdir ../result/7b-grpo-
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from openai import AsyncOpenAI
+
+from judge import backoff_delay
+from result_io import iter_jsonl, load_done_ids
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.insert(0, os.path.join(ROOT, "data"))
+sys.path.insert(0, os.path.join(ROOT, "src", "train", "grpo"))
+sys.path.insert(0, os.path.join(ROOT, "src", "train", "grpo", "score_function"))
+from kg_prompt import build_training_prompt
+from preprocess_parquet import build_prompt, read_format_prompt
+from json_parse import parse_json
+from kg import scan_response
+
+
+def extract_answer(text):
+    """取第一段 <answer>...</answer> 的内容(与奖励函数一致)，没有时取最后一个 </think> 之后的内容"""
+    answer = scan_response(text).answer
+    if answer is not None:
+        return answer
+    end = text.rfind("</think>")
+    return text[end + len("</think>"):] if end >= 0 else text
+
+
+def parse_prediction(doc_id, text):
+    """
+    把模型回复转换为 eval.py 的识别结果格式
+
+    返回:
+        record (dict): id/entities/relationships，无法解析时实体与关系为空
+        ok (bool): 回复中的 JSON 是否解析成功
+    """
+    record = {"id": doc_id, "entities": [], "relationships": []}
+    try:
+        data, _ = parse_json(extract_answer(text).strip())
+    except json.JSONDecodeError:
+        return record, False
+    if not isinstance(data, dict):
+        return record, False
+    entities = data.get("Entities")
+    if isinstance(entities, dict):
+        record["entities"] = [{"entity_type": str(entity_type), "name": str(name)}
+                              for name, entity_type in entities.items()]
+    relationships = data.get("Relationships")
+    if isinstance(relationships, list):
+        for rel in relationships:
+            if isinstance(rel, list) and len(rel) == 5:
+                record["relationships"].append({
+                    "entity_name1": str(rel[0]), "entity_type1": str(rel[1]), "relationship": str(rel[2]),
+                    "entity_name2": str(rel[3]), "entity_type2": str(rel[4])})
+            elif isinstance(rel, list) and len(rel) == 3:
+                record["relationships"].append({
+                    "entity_name1": str(rel[0]), "relationship": str(rel[1]), "entity_name2": str(rel[2])})
+    return record, True
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+class InferenceStats:
+    """完成/失败篇数、token 数与每篇文档的延迟(秒，含重试)"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.done = 0
+        self.failed = 0
+        self.parse_errors = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = []
+
+    def add(self, latency, usage, ok):
+        self.done += 1
+        self.parse_errors += not ok
+        self.latencies.append(latency)
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.cached_tokens += getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+    def report(self, final=False):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        latencies = sorted(self.latencies)
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] done={self.done} failed={self.failed} "
+              f"parse_errors={self.parse_errors} docs/s={self.done / elapsed:.2f} "
+              f"completion tok/s={self.completion_tokens / elapsed:.0f} "
+              f"prompt tok/s={self.prompt_tokens / elapsed:.0f} (cached {self.cached_tokens}) "
+              f"latency p50={percentile(latencies, 0.5):.1f}s p90={percentile(latencies, 0.9):.1f}s "
+              f"p99={percentile(latencies, 0.99):.1f}s max={latencies[-1] if latencies else 0:.1f}s")
+        if final:
+            print(f"共 {self.done} 篇，耗时 {elapsed:.1f}s，completion {self.completion_tokens} tokens，"
+                  f"prompt {self.prompt_tokens} tokens")
+
+
+async def generate(client, model, prompt, args):
+    """请求一次补全，失败时按带抖动的指数退避重试，重试耗尽时抛出最后一个异常"""
+    for retry in range(args.max_retries):
+        try:
+            return await client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=args.temperature,
+                max_tokens=args.max_tokens,
+                timeout=args.timeout,
+            )
+        except Exception as e:
+            if retry + 1 == args.max_retries:
+                raise
+            delay = backoff_delay(retry)
+            print(f"请求失败({type(e).__name__}: {e})，{delay:.1f}s 后重试")
+            await asyncio.sleep(delay)
+
+
+async def run(client, model, jobs, output, stats, args):
+    """jobs 为 (doc_id, prompt) 列表，第一条单独发送以缓存共享前缀，其余由 concurrency 个协程并发处理"""
+    queue = asyncio.Queue()
+    for job in jobs[1:]:
+        queue.put_nowait(job)
+
+    async def process(doc_id, prompt):
+        start = time.monotonic()
+        try:
+            response = await generate(client, model, prompt, args)
+        except Exception as e:
+            stats.failed += 1
+            print(f"{doc_id} 失败: {type(e).__name__}: {e}")
+            return
+        text = response.choices[0].message.content or ""
+        record, ok = parse_prediction(doc_id, text)
+        if not ok:
+            print(f"{doc_id} 的回复无法解析为JSON")
+        if args.keep_response:
+            record["response"] = text
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+        stats.add(time.monotonic() - start, response.usage, ok)
+
+    async def worker():
+        while True:
+            try:
+                job = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await process(*job)
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(args.report_interval)
+            stats.report()
+
+    if not jobs:
+        return
+    await process(*jobs[0])
+    report_task = asyncio.create_task(reporter())
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    report_task.cancel()
+
+
+async def main(args):
+    format_prompt = args.format_prompt if args.format_prompt is not None else read_format_prompt(args.format_prompt_from)
+    done = load_done_ids(args.pred)
+    jobs = []
+    seen = set(done)
+    for doc in iter_jsonl(args.input):
+        doc_id = doc.get("id")
+        if doc_id is None or doc_id in seen or not doc.get("content"):
+            continue
+        seen.add(doc_id)
+        jobs.append((doc_id, build_prompt(build_training_prompt(doc["content"]), format_prompt)))
+    if args.limit:
+        jobs = jobs[:args.limit]
+    # 共享前缀由第一条请求缓存，其余按长度从长到短
+    jobs[1:] = sorted(jobs[1:], key=lambda job: len(job[1]), reverse=True)
+    print(f"{args.input}: 待推理 {len(jobs)} 篇，已完成 {len(done)} 篇 ({args.pred})")
+
+    client = AsyncOpenAI(api_key=args.api_key, base_url=args.base_url, max_retries=0)
+    model = args.model
+    if model is None:
+        model = (await client.models.list()).data[0].id
+    print(f"模型 {model} @ {args.base_url}，并发 {args.concurrency}")
+
+    stats = InferenceStats()
+    os.makedirs(os.path.dirname(os.path.abspath(args.pred)), exist_ok=True)
+    with open(args.pred, "a", encoding="utf-8") as output:
+        await run(client, model, jobs, output, stats, args)
+    stats.report(final=True)
+    if stats.failed:
+        print(f"{stats.failed} 篇请求失败，重新运行同一命令即可补齐")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量推理，生成 eval.py 的识别结果文件")
+    parser.add_argument("--input", default=os.path.join(ROOT, "data", "test_new.json"),
+                        help="待推理的摘要(jsonl，每行含 id 与 content)")
+    parser.add_argument("--pred", required=True, help="识别结果文件(jsonl)，已存在时跳过其中的 id 续跑")
+    parser.add_argument("--base-url", default=os.environ.get("INFER_BASE_URL", "http://localhost:8000/v1"))
+    parser.add_argument("--api-key", default=os.environ.get("INFER_API_KEY", "EMPTY"))
+    parser.add_argument("--model", default=None, help="默认使用服务端 /v1/models 返回的第一个模型")
+    parser.add_argument("--format-prompt-from", default=os.path.join(ROOT, "src", "train", "grpo", "qwen2_5_7b_kg.sh"),
+                        help="从该训练脚本读取 FORMAT_PROMPT，与训练时的 prompt 保持一致")
+    parser.add_argument("--format-prompt", default=None, help="直接指定 format prompt，优先于 --format-prompt-from")
+    parser.add_argument("--concurrency", type=int, default=128, help="同时在途的请求数")
+    parser.add_argument("--max-tokens", type=int, default=8192)
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=600.0, help="单个请求的超时(秒)")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=0, help="只推理前 N 篇，0 表示全部")
+    parser.add_argument("--keep-response", action="store_true", help="在结果中保留模型的原始回复(response 字段)")
+    parser.add_argument("--report-interval", type=float, default=30.0, help="进度报告间隔(秒)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,119 @@
+"""
+LLM评判引擎：并发请求、令牌桶限流与带抖动的指数退避
+
+eval.py 中的 compare_entities / compare_relationships 通过本模块访问评判模型，
+所有请求共享同一个限流器，并由有界线程池并发执行，结果按输入顺序返回。
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶限流器
+
+    参数:
+        rate (float): 每秒补充的令牌数，即平均请求速率；<= 0 表示不限流
+        capacity (float): 桶容量，允许的最大突发请求数
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1.0):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(retry, base=1.0, cap=60.0):
+    """带完全抖动(full jitter)的指数退避时间，retry 从 0 开始计数"""
+    return random.uniform(0, min(cap, base * (2 ** retry)))
+
+
+def chat_with_retry(client, prompt, model, limiter=None, max_retries=10,
+                    temperature=0.01, max_tokens=8192, base_delay=1.0, max_delay=60.0):
+    """
+    调用评判模型，失败时按带抖动的指数退避重试
+
+    返回:
+        str: 模型回复内容，重试耗尽时返回空字符串
+    """
+    for retry in range(max_retries):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant"},
+                    {"role": "user", "content": prompt},
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=False
+            )
+            return response.choices[0].message.content or ""
+        except Exception as e:
+            delay = backoff_delay(retry, base_delay, max_delay)
+            print(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time())))
+            print(f"get judge response error! retry {retry + 1}/{max_retries} in {delay:.1f}s")
+            print(e)
+            time.sleep(delay)
+    return ""
+
+
+def run_ordered(func, items, max_workers=8):
+    """
+    用有界线程池并发执行 func(item)，结果顺序与 items 一致
+
+    max_workers <= 1 时退化为串行执行，便于与原始流程逐条对比。
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+
+def estimate_tokens(text):
+    """粗略估计token数：ASCII字符约4个一个token，其余字符(中文等)各算一个token"""
+    n_ascii = sum(1 for ch in text if ord(ch) < 128)
+    return n_ascii // 4 + (len(text) - n_ascii) + 1
+
+
+def pack_by_budget(items, cost, budget):
+    """
+    按顺序把 items 贪心地装入若干批次，每批 cost 之和不超过 budget
+
+    单个超出预算的 item 独占一批。
+    """
+    batches = []
+    batch = []
+    used = 0
+    for item in items:
+        c = cost(item)
+        if batch and used + c > budget:
+            batches.append(batch)
+            batch = []
+            used = 0
+        batch.append(item)
+        used += c
+    if batch:
+        batches.append(batch)
+    return batches
@@ -0,0 +1,106 @@
+"""
+LLM评判结果的持久化缓存(SQLite)
+
+缓存键为 (评判模型, temperature, 评判prompt) 的 sha256，值为评判模型的原始回复
+以及解析后的 n_true 与逐行判定结果。未变化的文档再次评测时无需调用API。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class VerdictCache:
+    """
+    参数:
+        path (str): SQLite 数据库文件路径
+        max_bytes (int): 缓存总大小上限，超出时按最近访问时间淘汰；None 表示不限
+        max_age_days (float): 条目最长保留天数，None 表示不限
+    """
+
+    def __init__(self, path, max_bytes=None, max_age_days=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                raw TEXT,
+                n_true INTEGER,
+                result TEXT,
+                size INTEGER,
+                created REAL,
+                accessed REAL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_verdicts_accessed ON verdicts(accessed)")
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(prompt, model, temperature):
+        payload = json.dumps([model, temperature, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """命中时返回 {"raw", "n_true", "result"}，否则返回 None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT raw, n_true, result FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE verdicts SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return {"raw": row[0], "n_true": row[1], "result": json.loads(row[2])}
+
+    def put(self, key, model, raw, n_true, result):
+        result_json = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, raw, n_true, result_json, len(raw) + len(result_json), now, now))
+            self.conn.commit()
+
+    def evict(self):
+        """按保留时间和总大小淘汰条目，返回淘汰的条目数"""
+        removed = 0
+        with self.lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self.conn.execute("DELETE FROM verdicts WHERE created < ?", (cutoff,)).rowcount
+            if self.max_bytes is not None:
+                total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM verdicts").fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self.conn.execute("SELECT key, size FROM verdicts ORDER BY accessed").fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self.conn.executemany("DELETE FROM verdicts WHERE key = ?", stale)
+                    removed += len(stale)
+            self.conn.commit()
+        return removed
+
+    def report(self):
+        with self.lock:
+            n, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM verdicts").fetchone()
+        total = self.hits + self.misses
+        rate = self.hits / total if total > 0 else 0
+        print(f"评判缓存: 命中 {self.hits}, 未命中 {self.misses}, 命中率 {rate:.1%}, "
+              f"条目 {n}, 大小 {size / 1024 / 1024:.2f} MB ({self.path})")
+
+    def close(self):
+        self.evict()
+        with self.lock:
+            self.conn.close()
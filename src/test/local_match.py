@@ -0,0 +1,134 @@
+"""
+评判前的本地规则匹配
+
+对于大小写、括号缩写(如 "Medical Qigong (MQ)")、关系名中 "_" 与空格等差异，
+无需调用LLM即可判定。本模块只在本地判定明确正确的行，其余行(包括与标准答案没有共同词的行，
+可能是评判模型会接受的缩写或同义词，如 "MQ" 与 "Medical Qigong")都交给评判模型，
+指标与全部交给评判模型时可比；offline 模式下剩余行按词集合相似度阈值判定，完全不调用API。
+"""
+import os
+import re
+import sys
+
+# 名称规范化与奖励函数的软匹配共用，见 src/train/grpo/score_function/name_norm.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "train", "grpo", "score_function"))
+from name_norm import name_variants, normalize, strip_abbreviation
+
+RIGHT = "正确"
+WRONG = "错误"
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def token_set(text):
+    return set(_TOKEN_RE.findall(strip_abbreviation(text)))
+
+
+def name_similarity(a, b):
+    """两个实体名称的相似度：等价写法相同为1，否则为词集合的Jaccard相似度"""
+    if name_variants(a) & name_variants(b):
+        return 1.0
+    ta, tb = token_set(a), token_set(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def _decide(score, exact, offline, threshold):
+    """exact 为真时判正确，其余行 offline 模式下按阈值判定，否则返回 None 交给评判模型"""
+    if exact:
+        return RIGHT
+    if offline:
+        return RIGHT if score >= threshold else WRONG
+    return None
+
+
+def prematch_entities(standard_answer, test_result, offline=False, threshold=0.8):
+    """
+    本地判定实体识别结果
+
+    参数:
+        standard_answer (list): [[实体类别, 实体名称], ...]
+        test_result (list): [[实体类别, 实体名称], ...]
+        offline (bool): 是否不调用评判模型，剩余行按阈值判定
+        threshold (float): offline 模式下的词集合相似度阈值
+
+    返回:
+        (n_true, result, residue): 本地判定正确数、本地判定结果行 [类别, 名称, 判定结果]、待评判模型判定的行
+    """
+    n_true = 0
+    result = []
+    residue = []
+    for row in test_result:
+        entity_type, name = normalize(row[0]), row[1]
+        exact = False
+        score = 0.0
+        for std_row in standard_answer:
+            sim = name_similarity(name, std_row[1])
+            if normalize(std_row[0]) == entity_type:
+                exact = exact or sim == 1.0
+                score = max(score, sim)
+            elif sim > 0.0:
+                # 名称相近但类别不同，交给评判模型
+                score = max(score, min(sim, threshold / 2))
+        verdict = _decide(score, exact, offline, threshold)
+        if verdict is None:
+            residue.append(row)
+            continue
+        if verdict == RIGHT:
+            n_true += 1
+        result.append([row[0], row[1], verdict])
+    return n_true, result, residue
+
+
+def prematch_relationships(standard_answer, test_result, offline=False, threshold=0.8):
+    """
+    本地判定关系识别结果，行格式为 [实体名称1, 关系, 实体名称2]，返回值同 prematch_entities
+    """
+    n_true = 0
+    result = []
+    residue = []
+    for row in test_result:
+        relation = normalize(row[1])
+        exact = False
+        score = 0.0
+        for std_row in standard_answer:
+            sim = min(name_similarity(row[0], std_row[0]), name_similarity(row[2], std_row[2]))
+            if sim <= 0.0:
+                continue
+            if normalize(std_row[1]) == relation:
+                exact = exact or sim == 1.0
+                score = max(score, sim)
+            else:
+                score = max(score, min(sim, threshold / 2))
+        verdict = _decide(score, exact, offline, threshold)
+        if verdict is None:
+            residue.append(row)
+            continue
+        if verdict == RIGHT:
+            n_true += 1
+        result.append([row[0], row[1], row[2], verdict])
+    return n_true, result, residue
+
+
+def best_gold_match(task, row, standard_answer):
+    """
+    返回与识别结果行最相近的标准答案行("|" 连接)，没有任何相近的行时返回 None
+
+    实体按名称相似度选择，关系按两端实体相似度的较小值选择，同类别/同关系的行优先。
+    """
+    best = None
+    best_score = 0.0
+    for std_row in standard_answer:
+        if task == "entity":
+            score = name_similarity(row[1], std_row[1])
+            same_label = normalize(row[0]) == normalize(std_row[0])
+        else:
+            score = min(name_similarity(row[0], std_row[0]), name_similarity(row[2], std_row[2]))
+            same_label = normalize(row[1]) == normalize(std_row[1])
+        if score <= 0.0:
+            continue
+        score += 0.5 if same_label else 0.0
+        if score > best_score:
+            best, best_score = std_row, score
+    return "|".join(best) if best is not None else None
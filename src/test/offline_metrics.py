@@ -0,0 +1,233 @@
+"""
+离线评测：不调用评判模型，直接按字符串匹配计算实体/三元组的P/R/F1
+
+标准答案与识别结果文件(jsonl，格式同 eval.py)被展开为列式的 NumPy 整数数组，
+strict(原样)、ci(忽略大小写)、relaxed(再忽略括号缩写与 "_"/空格差异) 三种匹配方式
+各做一次向量化的集合匹配，同时给出 micro/macro 指标、按实体类别/关系类别的指标
+以及逐文档的 TP/FP/FN，可作为训练过程中的验证指标。
+"""
+import argparse
+import json
+
+import numpy as np
+
+from local_match import normalize, strip_abbreviation
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+LEVELS = ("strict", "ci", "relaxed")
+
+
+def _norm_name(text, level):
+    if level == "strict":
+        return text
+    if level == "ci":
+        return text.strip().lower()
+    return strip_abbreviation(text)
+
+
+def _norm_label(text, level):
+    if level == "strict":
+        return text
+    return normalize(text)
+
+
+def load_docs(path):
+    """读取 jsonl 文件，返回 {doc_id: doc}，无法解析的行跳过"""
+    docs = {}
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                doc = _loads(line)
+            except ValueError:
+                continue
+            docs[doc["id"]] = doc
+    return docs
+
+
+def intern(strings, vocab):
+    """把字符串编码为整数，vocab 为 {字符串: 编码} 并原地扩充"""
+    return np.array([vocab.setdefault(s, len(vocab)) for s in strings], dtype=np.int64)
+
+
+def to_columns(docs, doc_ids, vocab):
+    """
+    把文档展开为列式整数数组，字符串统一编码进 vocab
+
+    返回:
+        (ent, rel): ent 为 (doc, type, name) 三个数组，rel 为 (doc, name1, relationship, name2) 四个数组
+    """
+    ent = ([], [], [])
+    rel = ([], [], [], [])
+    for i, doc_id in enumerate(doc_ids):
+        doc = docs[doc_id]
+        for e in doc.get("entities") or []:
+            ent[0].append(i)
+            ent[1].append(str(e.get("entity_type", "")))
+            ent[2].append(str(e.get("name", "")))
+        for r in doc.get("relationships") or []:
+            rel[0].append(i)
+            rel[1].append(str(r.get("entity_name1", "")))
+            rel[2].append(str(r.get("relationship", "")))
+            rel[3].append(str(r.get("entity_name2", "")))
+    ent = (np.array(ent[0], dtype=np.int64),) + tuple(intern(col, vocab) for col in ent[1:])
+    rel = (np.array(rel[0], dtype=np.int64),) + tuple(intern(col, vocab) for col in rel[1:])
+    return ent, rel
+
+
+def pack_keys(columns):
+    """
+    把多列非负整数编码合并为一列 int64 键，相同的行得到相同的键
+
+    每合并一列前若可能溢出，先用 np.unique 把已有键压缩为连续编码。
+    """
+    key = columns[0].astype(np.int64)
+    for col in columns[1:]:
+        radix = int(col.max()) + 1 if len(col) else 1
+        if len(key) and (int(key.max()) + 1) * radix >= 2 ** 62:
+            key = np.unique(key, return_inverse=True)[1].reshape(-1)
+        key = key * radix + col
+    return key
+
+
+def _prf(tp, n_pred, n_gold):
+    tp = np.asarray(tp, dtype=np.float64)
+    precision = np.divide(tp, n_pred, out=np.zeros_like(tp), where=np.asarray(n_pred) > 0)
+    recall = np.divide(tp, n_gold, out=np.zeros_like(tp), where=np.asarray(n_gold) > 0)
+    denom = precision + recall
+    f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(tp), where=denom > 0)
+    return precision, recall, f1
+
+
+def match_sets(gold_key, pred_key, gold_doc, pred_doc, gold_group, pred_group, n_docs, n_groups):
+    """
+    集合匹配：键相同即为命中，键中已包含文档编号
+
+    返回:
+        dict: 逐文档与逐类别的 tp / n_pred / n_gold
+    """
+    gold_u, gold_first = np.unique(gold_key, return_index=True)
+    pred_u, pred_first = np.unique(pred_key, return_index=True)
+    pred_hit = np.isin(pred_u, gold_u, assume_unique=True)
+    pred_doc = pred_doc[pred_first]
+    pred_group = pred_group[pred_first]
+    return {
+        "doc_tp": np.bincount(pred_doc[pred_hit], minlength=n_docs),
+        "doc_pred": np.bincount(pred_doc, minlength=n_docs),
+        "doc_gold": np.bincount(gold_doc[gold_first], minlength=n_docs),
+        "type_tp": np.bincount(pred_group[pred_hit], minlength=n_groups),
+        "type_pred": np.bincount(pred_group, minlength=n_groups),
+        "type_gold": np.bincount(gold_group[gold_first], minlength=n_groups),
+    }
+
+
+def _summarize(counts, labels):
+    tp, n_pred, n_gold = counts["doc_tp"].sum(), counts["doc_pred"].sum(), counts["doc_gold"].sum()
+    micro = [float(x) for x in _prf(tp, n_pred, n_gold)]
+    type_p, type_r, type_f = _prf(counts["type_tp"], counts["type_pred"], counts["type_gold"])
+    supported = counts["type_gold"] > 0
+    macro = [float(x[supported].mean()) if supported.any() else 0.0 for x in (type_p, type_r, type_f)]
+    per_type = {}
+    for t, label in enumerate(labels):
+        if counts["type_pred"][t] == 0 and counts["type_gold"][t] == 0:
+            continue
+        per_type[label] = {
+            "precision": float(type_p[t]), "recall": float(type_r[t]), "f1": float(type_f[t]),
+            "tp": int(counts["type_tp"][t]), "pred": int(counts["type_pred"][t]), "gold": int(counts["type_gold"][t]),
+        }
+    return {"micro": micro, "macro": macro, "per_type": per_type}
+
+
+def score_columns(gold_cols, pred_cols, vocab, n_docs, level="strict"):
+    """
+    计算一种匹配方式下实体与三元组的指标
+
+    只对词表中的不同字符串做一次规范化，再通过数组下标映射到每一行。
+
+    返回:
+        dict: {"entities": {...}, "relationships": {...}}，其中 micro/macro 为 [P, R, F1]
+              (macro 为按类别平均)，per_type 为按类别的指标，doc_counts 为逐文档 (tp, fp, fn) 的 (n_docs, 3) 数组
+    """
+    raw = list(vocab)
+    names = {}
+    labels = {}
+    name_map = intern([_norm_name(s, level) for s in raw], names)
+    # 类别只来自实体类别列与关系列，避免按类别统计的数组随实体名称数量增长
+    label_codes = np.unique(np.concatenate([gold_cols[0][1], pred_cols[0][1], gold_cols[1][2], pred_cols[1][2]]))
+    label_map = np.zeros(len(raw), dtype=np.int64)
+    label_map[label_codes] = intern([_norm_label(raw[c], level) for c in label_codes], labels)
+    label_values = list(labels)
+
+    result = {}
+    for task, (gold, pred) in (("entities", (gold_cols[0], pred_cols[0])),
+                               ("relationships", (gold_cols[1], pred_cols[1]))):
+        if task == "entities":
+            # (doc, type, name)，按实体类别统计
+            gold_parts = [gold[0], label_map[gold[1]], name_map[gold[2]]]
+            pred_parts = [pred[0], label_map[pred[1]], name_map[pred[2]]]
+        else:
+            # (doc, name1, relationship, name2)，按关系类别统计
+            gold_parts = [gold[0], name_map[gold[1]], label_map[gold[2]], name_map[gold[3]]]
+            pred_parts = [pred[0], name_map[pred[1]], label_map[pred[2]], name_map[pred[3]]]
+        group_col = 1 if task == "entities" else 2
+        n_gold = len(gold[0])
+        keys = pack_keys([np.concatenate([g, p]) for g, p in zip(gold_parts, pred_parts)])
+        counts = match_sets(keys[:n_gold], keys[n_gold:], gold[0], pred[0],
+                            gold_parts[group_col], pred_parts[group_col], n_docs, len(label_values))
+        summary = _summarize(counts, label_values)
+        summary["doc_counts"] = np.stack([counts["doc_tp"],
+                                          counts["doc_pred"] - counts["doc_tp"],
+                                          counts["doc_gold"] - counts["doc_tp"]], axis=1)
+        result[task] = summary
+    return result
+
+
+def score_files(std_answer_file, test_result_file, levels=LEVELS):
+    """只统计两个文件共有的文档，返回 (doc_ids, {level: score_columns 结果})"""
+    gold_docs = load_docs(std_answer_file)
+    pred_docs = load_docs(test_result_file)
+    doc_ids = [doc_id for doc_id in gold_docs if doc_id in pred_docs]
+    vocab = {}
+    gold_cols = to_columns(gold_docs, doc_ids, vocab)
+    pred_cols = to_columns(pred_docs, doc_ids, vocab)
+    return doc_ids, {level: score_columns(gold_cols, pred_cols, vocab, len(doc_ids), level) for level in levels}
+
+
+def print_scores(scores, per_type=False):
+    print(f"{'Metric':<28} {'Precision':<12} {'Recall':<12} {'F-Score':<12}")
+    print("-" * 64)
+    for level, result in scores.items():
+        for task, summary in result.items():
+            for avg in ("micro", "macro"):
+                p, r, f = summary[avg]
+                print(f"{task + ' ' + level + ' ' + avg:<28} {p:<12.3f} {r:<12.3f} {f:<12.3f}")
+    if per_type:
+        for level, result in scores.items():
+            for task, summary in result.items():
+                print(f"\n[{task} / {level}]")
+                for label, m in sorted(summary["per_type"].items(), key=lambda x: -x[1]["gold"]):
+                    print(f"{label:<28} {m['precision']:<12.3f} {m['recall']:<12.3f} {m['f1']:<12.3f} "
+                          f"tp={m['tp']} pred={m['pred']} gold={m['gold']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线计算实体/三元组的 strict/ci/relaxed P/R/F1")
+    parser.add_argument("--std", default='../data/test_new.json', help="标准答案文件(jsonl)")
+    parser.add_argument("--pred", required=True, help="模型识别结果文件(jsonl)")
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=list(LEVELS))
+    parser.add_argument("--per-type", action="store_true", help="输出按实体类别/关系类别的指标")
+    parser.add_argument("--json", default=None, help="把指标写入json文件")
+    args = parser.parse_args()
+
+    doc_ids, scores = score_files(args.std, args.pred, args.levels)
+    print(f"共有文档: {len(doc_ids)}")
+    print_scores(scores, args.per_type)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({level: {task: {k: v for k, v in summary.items() if k != "doc_counts"}
+                               for task, summary in result.items()}
+                       for level, result in scores.items()}, f, ensure_ascii=False, indent=2)
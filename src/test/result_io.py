@@ -0,0 +1,137 @@
+"""
+评测输入输出的流式读写
+
+- JsonlIndex: 标准答案文件只建立 {doc_id: 文件偏移} 索引，按需读取单个文档
+- iter_jsonl: 逐行读取识别结果文件的生成器，无法解析的行跳过
+- 逐文档结果以 jsonl 追加写入，断点续评时跳过已评测的文档
+"""
+import json
+import os
+
+
+def iter_jsonl(path, lower=False):
+    """逐行读取 jsonl 文件，lower 为真时先转小写(与 eval.py 的比较口径一致)"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if lower:
+                line = line.lower()
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+class JsonlIndex:
+    """
+    jsonl 文件的惰性索引，只在内存中保存每个文档的文件偏移
+
+    同一 id 出现多次时以最后一次为准。
+    """
+
+    def __init__(self, path, lower=False):
+        self.path = path
+        self.lower = lower
+        self.offsets = {}
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    doc = json.loads(line.decode("utf-8").lower() if lower else line)
+                    self.offsets[doc["id"]] = offset
+                except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+                    pass
+                offset += len(line)
+        self.file = open(path, "rb")
+
+    def __contains__(self, doc_id):
+        return doc_id in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get(self, doc_id):
+        offset = self.offsets.get(doc_id)
+        if offset is None:
+            return None
+        self.file.seek(offset)
+        line = self.file.readline().decode("utf-8")
+        return json.loads(line.lower() if self.lower else line)
+
+    def close(self):
+        self.file.close()
+
+
+def load_done_ids(path):
+    """读取已写入的逐文档结果，返回已评测的 doc_id 集合；文件末尾写了一半的行会被截掉"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    valid_size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, UnicodeDecodeError, KeyError):
+                break
+            valid_size += len(line)
+    if valid_size < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(valid_size)
+    return done
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+VERDICT_COLUMNS = ["doc_id", "task", "type", "pred", "gold_match", "verdict", "source"]
+
+
+def _with_gold(results, gold_match, missing):
+    """逐行配上 gold_match；旧结果文件没有或长度不足时补 None，并把补齐的行数计入 missing[0]"""
+    gold_match = gold_match or []
+    missing[0] += max(0, len(results) - len(gold_match))
+    for i, row in enumerate(results):
+        yield row, gold_match[i] if i < len(gold_match) else None
+
+
+def iter_verdict_rows(results_file, missing=None):
+    """
+    把逐文档结果展开为判定行 (doc_id, task, type, pred, gold_match, verdict, source)
+
+    参数:
+        missing: 长度为1的列表，累加没有 gold_match 的行数(这些行的 gold_match 为 None，不丢弃)
+    """
+    missing = missing if missing is not None else [0]
+    for record in iter_jsonl(results_file):
+        for row, gold in _with_gold(record["entity_results"], record.get("entity_gold_match"), missing):
+            yield (record["id"], "entity", row[0], row[1], gold, row[2], row[-1])
+        for row, gold in _with_gold(record["relationship_results"], record.get("relationship_gold_match"), missing):
+            yield (record["id"], "relationship", row[1], "|".join(row[:3]), gold, row[3], row[-1])
+
+
+def export_verdicts_parquet(results_file, parquet_file, batch_rows=50000):
+    """以固定行数的 row group 流式写出 Parquet，内存占用与结果总量无关"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.string()) for name in VERDICT_COLUMNS])
+    n_rows = 0
+    missing = [0]
+    with pq.ParquetWriter(parquet_file, schema, compression="zstd") as writer:
+        for rows in chunked(iter_verdict_rows(results_file, missing), batch_rows):
+            writer.write_table(pa.Table.from_arrays([pa.array(col, pa.string()) for col in zip(*rows)], schema=schema))
+            n_rows += len(rows)
+        if n_rows == 0:
+            writer.write_table(schema.empty_table())
+    print(f"判定结果已写入 {parquet_file} ({n_rows} 行)")
+    if missing[0]:
+        print(f"其中 {missing[0]} 行在结果文件中没有 gold_match，该列为空")
+    return n_rows
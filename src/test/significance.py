@@ -0,0 +1,183 @@
+"""
+多个模型识别结果的对比：配对 bootstrap 置信区间与近似随机化(approximate randomization)显著性检验
+
+输入为 eval.py 输出的逐文档计数文件 (<outputdir>doc_results.jsonl)，不会重新调用评判模型；
+也可以用 --std 指定标准答案，直接对多个识别结果文件做离线(offline_metrics)计数。
+重采样以矩阵乘法向量化，并按批次分配到多个进程。
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+TASKS = ("entity", "relationship")
+
+
+def load_doc_counts(path):
+    """读取 doc_results.jsonl，返回 {task: {doc_id: (tp, fp, fn)}}"""
+    counts = {task: {} for task in TASKS}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            for task in TASKS:
+                right, n_std, n_test = record[task]
+                counts[task][record["id"]] = (right, max(n_test - right, 0), max(n_std - right, 0))
+    return counts
+
+
+def offline_doc_counts(std_answer_file, test_result_file, level):
+    """用 offline_metrics 计算逐文档计数，返回格式同 load_doc_counts"""
+    from offline_metrics import score_files
+
+    doc_ids, scores = score_files(std_answer_file, test_result_file, [level])
+    result = scores[level]
+    return {task: dict(zip(doc_ids, map(tuple, result[key]["doc_counts"].tolist())))
+            for task, key in (("entity", "entities"), ("relationship", "relationships"))}
+
+
+def align(systems):
+    """只保留所有系统共有的文档，返回 (doc_ids, (S, D, 3) 的计数数组)"""
+    doc_ids = [doc_id for doc_id in systems[0] if all(doc_id in s for s in systems[1:])]
+    counts = np.array([[s[doc_id] for doc_id in doc_ids] for s in systems], dtype=np.float64)
+    return doc_ids, counts.reshape(len(systems), len(doc_ids), 3)
+
+
+def f1_from_totals(totals):
+    """totals[..., 0/1/2] 为 tp/fp/fn，返回 micro F1"""
+    tp, fp, fn = totals[..., 0], totals[..., 1], totals[..., 2]
+    denom = 2 * tp + fp + fn
+    return np.divide(2 * tp, denom, out=np.zeros_like(tp), where=denom > 0)
+
+
+def _bootstrap_chunk(counts, n, seed):
+    """counts: (S, D, 3)，返回 (S, n) 每次重采样的F1"""
+    rng = np.random.default_rng(seed)
+    n_docs = counts.shape[1]
+    weights = rng.multinomial(n_docs, np.full(n_docs, 1.0 / n_docs), size=n).astype(np.float64)
+    totals = np.einsum("bd,sdk->sbk", weights, counts)
+    return f1_from_totals(totals)
+
+
+def _randomization_chunk(counts_a, counts_b, n, seed):
+    """counts_a/counts_b: (D, 3)，返回 (n,) 每次随机交换后两个系统的F1差"""
+    rng = np.random.default_rng(seed)
+    swap = rng.integers(0, 2, size=(n, counts_a.shape[0])).astype(np.float64)
+    moved = swap @ (counts_b - counts_a)
+    totals_a = counts_a.sum(axis=0) + moved
+    totals_b = counts_b.sum(axis=0) - moved
+    return f1_from_totals(totals_a) - f1_from_totals(totals_b)
+
+
+def _split(n, chunk_size):
+    return [min(chunk_size, n - start) for start in range(0, n, chunk_size)]
+
+
+def _run_chunks(func, args_list, workers):
+    if workers <= 1 or len(args_list) <= 1:
+        return [func(*args) for args in args_list]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(func, *args) for args in args_list]
+        return [future.result() for future in futures]
+
+
+def paired_bootstrap(counts, n_resamples=10000, seed=0, workers=None, chunk_size=1000):
+    """所有系统共用同一组重采样文档，返回 (S, n_resamples) 的F1"""
+    workers = workers or os.cpu_count() or 1
+    sizes = _split(n_resamples, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = _run_chunks(_bootstrap_chunk, [(counts, n, s) for n, s in zip(sizes, seeds)], workers)
+    return np.concatenate(chunks, axis=1)
+
+
+def approximate_randomization(counts_a, counts_b, n_resamples=10000, seed=0, workers=None, chunk_size=1000):
+    """双侧近似随机化检验，返回 p 值"""
+    workers = workers or os.cpu_count() or 1
+    observed = abs(f1_from_totals(counts_a.sum(axis=0)) - f1_from_totals(counts_b.sum(axis=0)))
+    sizes = _split(n_resamples, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    diffs = np.concatenate(_run_chunks(_randomization_chunk,
+                                       [(counts_a, counts_b, n, s) for n, s in zip(sizes, seeds)], workers))
+    return (np.sum(np.abs(diffs) >= observed - 1e-12) + 1) / (n_resamples + 1)
+
+
+def compare_systems(systems, names, n_resamples=10000, seed=0, workers=None, alpha=0.05, baseline=0):
+    """
+    参数:
+        systems (list): 每个系统的 {task: {doc_id: (tp, fp, fn)}}
+        names (list): 系统名称
+        baseline (int): 作为对比基准的系统下标
+
+    返回:
+        dict: {task: {"n_docs", "systems": [...], "pairs": [...]}}
+    """
+    report = {}
+    for task in TASKS:
+        doc_ids, counts = align([s[task] for s in systems])
+        observed = f1_from_totals(counts.sum(axis=1))
+        samples = paired_bootstrap(counts, n_resamples, seed, workers)
+        low, high = np.quantile(samples, [alpha / 2, 1 - alpha / 2], axis=1)
+        rows = [{"name": name, "f1": float(observed[i]), "ci": [float(low[i]), float(high[i])]}
+                for i, name in enumerate(names)]
+        pairs = []
+        for i in range(len(names)):
+            if i == baseline:
+                continue
+            delta = samples[i] - samples[baseline]
+            observed_delta = float(observed[i] - observed[baseline])
+            # 配对 bootstrap 的双侧 p 值：重采样差值越过0的比例
+            p_boot = 2 * min(np.mean(delta <= 0), np.mean(delta >= 0))
+            pairs.append({
+                "name": names[i], "baseline": names[baseline], "delta": observed_delta,
+                "ci": [float(x) for x in np.quantile(delta, [alpha / 2, 1 - alpha / 2])],
+                "p_bootstrap": float(min(p_boot, 1.0)),
+                "p_randomization": float(approximate_randomization(counts[baseline], counts[i],
+                                                                   n_resamples, seed, workers)),
+            })
+        report[task] = {"n_docs": len(doc_ids), "systems": rows, "pairs": pairs}
+    return report
+
+
+def print_report(report, alpha=0.05):
+    level = int(round((1 - alpha) * 100))
+    for task, result in report.items():
+        print(f"\n[{task}] 共有文档: {result['n_docs']}")
+        print(f"{'System':<30} {'F1':<8} {str(level) + '% CI':<20}")
+        print("-" * 60)
+        for row in result["systems"]:
+            print(f"{row['name']:<30} {row['f1']:<8.3f} [{row['ci'][0]:.3f}, {row['ci'][1]:.3f}]")
+        if result["pairs"]:
+            print(f"\n{'System':<30} {'ΔF1':<8} {str(level) + '% CI':<20} {'p(boot)':<10} {'p(AR)':<10}")
+            print("-" * 80)
+            for pair in result["pairs"]:
+                print(f"{pair['name'] + ' - ' + pair['baseline']:<30} {pair['delta']:<+8.3f} "
+                      f"[{pair['ci'][0]:+.3f}, {pair['ci'][1]:+.3f}]    {pair['p_bootstrap']:<10.4f} "
+                      f"{pair['p_randomization']:<10.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多个模型结果的配对 bootstrap 置信区间与显著性检验")
+    parser.add_argument("inputs", nargs="+",
+                        help="eval.py 输出的 doc_results.jsonl；指定 --std 时为识别结果文件")
+    parser.add_argument("--names", nargs="+", default=None, help="系统名称，默认使用文件名")
+    parser.add_argument("--std", default=None, help="标准答案文件，指定时用离线匹配计数而不是评判结果")
+    parser.add_argument("--level", choices=["strict", "ci", "relaxed"], default="relaxed", help="离线匹配方式")
+    parser.add_argument("--baseline", type=int, default=0, help="对比基准的系统下标")
+    parser.add_argument("--resamples", type=int, default=10000)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认使用全部CPU")
+    parser.add_argument("--json", default=None, help="把结果写入json文件")
+    args = parser.parse_args()
+
+    names = args.names or [os.path.basename(path) for path in args.inputs]
+    if args.std:
+        systems = [offline_doc_counts(args.std, path, args.level) for path in args.inputs]
+    else:
+        systems = [load_doc_counts(path) for path in args.inputs]
+    report = compare_systems(systems, names, args.resamples, args.seed, args.workers, args.alpha, args.baseline)
+    print_report(report, args.alpha)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
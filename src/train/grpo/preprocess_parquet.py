@@ -0,0 +1,153 @@
+"""
+GRPO 训练数据预处理：预先分词、过滤超长 prompt、规范化标注
+
+EasyR1 每次启动都会在每个 worker 上重新对 problem 列分词并过滤超长 prompt。本脚本按 EasyR1 的方式
+(problem + " " + format_prompt，chat template，add_generation_prompt)一次性分词，写出增加以下列的 parquet：
+- prompt_ids / prompt_length: prompt 的 token id 与长度，超过 max_prompt_length 的行被删除并报告条数
+- answer_canonical: 紧凑的标注 JSON(只保留 Entities/Relationships，去掉空白与重复的关系)，
+  kg.py 解析得到的实体与关系集合与原标注完全相同；无法解析的标注保持原样
+- length_bucket: 按 prompt 长度排序后每 bucket_size 行一个编号，便于按长度分组采样
+
+    python src/train/grpo/preprocess_parquet.py /datadisk/data/train_new.parquet /datadisk/data/test_new.parquet
+
+训练时把 data.train_files/val_files 换成输出的 *.prep.parquet，data.answer_key 设为 answer_canonical；
+prompt 已经过滤，EasyR1 的 data.filter_overlong_prompts 可以关闭。
+"""
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import yaml
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+_tokenizer = None
+
+
+def canonical_answer(answer):
+    """
+    标注的紧凑规范形式，kg.parse_ground_truth 对两者的解析结果相同
+
+    只保留 Entities 与 Relationships 两个键；关系都是字符串列表时按首次出现的顺序去重
+    (kg.py 把关系转为集合)。不是 JSON 对象的标注原样返回。
+    """
+    try:
+        data = json.loads(answer)
+    except (json.JSONDecodeError, TypeError):
+        return answer
+    if not isinstance(data, dict):
+        return answer
+    compact = {}
+    if "Entities" in data:
+        compact["Entities"] = data["Entities"]
+    if "Relationships" in data:
+        relations = data["Relationships"]
+        if isinstance(relations, list) and all(
+                isinstance(rel, list) and all(isinstance(x, str) for x in rel) for rel in relations):
+            seen = set()
+            unique = []
+            for rel in relations:
+                key = tuple(rel)
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(rel)
+            relations = unique
+        compact["Relationships"] = relations
+    return json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_prompt(problem, format_prompt):
+    """与 EasyR1 RLHFDataset 相同：format_prompt 去掉首尾空白后以空格接在 problem 之后"""
+    return problem + " " + format_prompt.strip() if format_prompt else problem
+
+
+def _init_tokenizer(path):
+    global _tokenizer
+    from transformers import AutoTokenizer
+    _tokenizer = AutoTokenizer.from_pretrained(path)
+
+
+def _tokenize(prompts):
+    return [_tokenizer.apply_chat_template([{"role": "user", "content": prompt}],
+                                           add_generation_prompt=True, tokenize=True) for prompt in prompts]
+
+
+def tokenize_all(prompts, tokenizer_path, num_workers, chunk_size=64):
+    """按 chat template 分词，num_workers 为 0 时在当前进程中分词"""
+    chunks = [prompts[i:i + chunk_size] for i in range(0, len(prompts), chunk_size)]
+    if num_workers == 0:
+        _init_tokenizer(tokenizer_path)
+        return [ids for chunk in chunks for ids in _tokenize(chunk)]
+    with ProcessPoolExecutor(num_workers, initializer=_init_tokenizer, initargs=(tokenizer_path,)) as pool:
+        return [ids for result in pool.map(_tokenize, chunks) for ids in result]
+
+
+def preprocess(path, output, tokenizer_path, format_prompt, max_prompt_length, bucket_size,
+               prompt_key="problem", answer_key="answer", num_workers=4):
+    start = time.time()
+    table = pq.read_table(path)
+    problems = table.column(prompt_key).to_pylist()
+    answers = table.column(answer_key).to_pylist()
+    prompt_ids = tokenize_all([build_prompt(p, format_prompt) for p in problems], tokenizer_path, num_workers)
+    lengths = [len(ids) for ids in prompt_ids]
+    keep = [i for i, n in enumerate(lengths) if n <= max_prompt_length]
+
+    canonical = [canonical_answer(answers[i]) for i in keep]
+    ranks = sorted(range(len(keep)), key=lambda j: lengths[keep[j]])
+    buckets = [0] * len(keep)
+    for rank, j in enumerate(ranks):
+        buckets[j] = rank // bucket_size
+
+    table = table.take(pa.array(keep, type=pa.int64()))
+    table = table.append_column("answer_canonical", pa.array(canonical, type=pa.string()))
+    table = table.append_column("prompt_ids", pa.array([prompt_ids[i] for i in keep], type=pa.list_(pa.int32())))
+    table = table.append_column("prompt_length", pa.array([lengths[i] for i in keep], type=pa.int32()))
+    table = table.append_column("length_bucket", pa.array(buckets, type=pa.int32()))
+    pq.write_table(table, output)
+
+    kept_lengths = sorted(lengths[i] for i in keep)
+    n = len(kept_lengths)
+    invalid = sum(1 for i, c in zip(keep, canonical) if c is answers[i])
+    answer_bytes = sum(len(answers[i].encode("utf-8")) for i in keep if isinstance(answers[i], str))
+    canonical_bytes = sum(len(c.encode("utf-8")) for c in canonical if isinstance(c, str))
+    print(f"{path} -> {output}: {len(problems)} 行，超过 max_prompt_length={max_prompt_length} 删除 "
+          f"{len(problems) - n} 行，保留 {n} 行，耗时 {time.time() - start:.1f}s")
+    if n:
+        print(f"  prompt token 数: p50 {kept_lengths[n // 2]}, p90 {kept_lengths[min(n - 1, int(n * 0.9))]}, "
+              f"max {kept_lengths[-1]}；length_bucket 0..{max(buckets)} (每桶 {bucket_size} 行)")
+    print(f"  标注 {answer_bytes} -> {canonical_bytes} 字节，无法解析保持原样 {invalid} 条")
+
+
+def read_format_prompt(script):
+    """从训练脚本中读取 FORMAT_PROMPT 的内容，没有时返回空字符串"""
+    with open(script, "r", encoding="utf-8") as f:
+        match = re.search(r'FORMAT_PROMPT="""(.*?)"""', f.read(), re.S)
+    return match.group(1) if match else ""
+
+
+if __name__ == "__main__":
+    with open(os.path.join(HERE, "config.yaml"), "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    parser = argparse.ArgumentParser(description="GRPO parquet 预处理：分词、过滤超长 prompt、规范化标注")
+    parser.add_argument("inputs", nargs="+", help="train/test parquet")
+    parser.add_argument("--tokenizer", default=config["worker"]["actor"]["model"]["model_path"])
+    parser.add_argument("--format-prompt-from", default=os.path.join(HERE, "qwen2_5_7b_kg.sh"),
+                        help="从该训练脚本读取 FORMAT_PROMPT")
+    parser.add_argument("--format-prompt", default=None, help="直接指定 format prompt，优先于 --format-prompt-from")
+    parser.add_argument("--max-prompt-length", type=int, default=config["data"]["max_prompt_length"])
+    parser.add_argument("--bucket-size", type=int, default=config["data"]["rollout_batch_size"])
+    parser.add_argument("--prompt-key", default=config["data"]["prompt_key"])
+    parser.add_argument("--answer-key", default=config["data"]["answer_key"])
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1), help="0 表示不使用进程池")
+    args = parser.parse_args()
+
+    format_prompt = args.format_prompt if args.format_prompt is not None else read_format_prompt(args.format_prompt_from)
+    for path in args.inputs:
+        output = os.path.splitext(path)[0] + ".prep.parquet"
+        preprocess(path, output, args.tokenizer, format_prompt, args.max_prompt_length, args.bucket_size,
+                   args.prompt_key, args.answer_key, args.workers)
@@ -0,0 +1,272 @@
+"""
+奖励函数吞吐基准
+
+用 data/grpo/train_new.parquet 的标注构造几类rollout：
+- valid: 正常的 <think>...</think><answer>JSON</answer>，实体/关系随机删减、改写
+- truncated: answer 中的JSON被截断(需要括号修复或解析失败)
+- missing_tags: 没有 <answer> 标签或只有一半标签
+- long_think: 约 8k token(32k 字符)的 think
+- huge_entities: answer 中有上千个实体和关系
+- overlapping_names: answer 中有数百个与同一标注实体名称高度相似的同类实体(如 "interleukin-1" 的
+  "interleukin-1-0".."interleukin-1-399")，soft 模式下构成一个很大的匹配分量；
+  用 KG_REWARD_MODE=soft 运行才会走软匹配
+
+对 compute_score(标注缓存命中/不命中)以及 compute_score_batch 测量
+samples/sec 与逐条延迟的 p50/p99；--procs 1 2 4 ... 另外测量 N 个相互独立的打分进程
+(每个进程对自己的一段 rollout 调用 compute_score_batch)的总 samples/sec，对应训练时每个 reward worker
+各占一个核的情况。--save 保存基线，--compare 与基线对比，
+吞吐下降或 p99 上升超过 --tolerance 时以非0状态码退出，可放在CI或训练前检查。
+
+    python bench_reward.py --save bench_baseline.json
+    python bench_reward.py --compare bench_baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import kg
+
+SHAPES = ("valid", "truncated", "missing_tags", "long_think", "huge_entities", "overlapping_names")
+
+
+def _think(rng, n_chars):
+    words = ["the", "entity", "drug", "disease", "relation", "abstract", "mentions", "patients", "treat", "\n"]
+    parts = []
+    size = 0
+    while size < n_chars:
+        word = rng.choice(words)
+        parts.append(word)
+        size += len(word) + 1
+    return " ".join(parts)
+
+
+def _perturb_answer(rng, gt):
+    data = json.loads(gt)
+    entities = {}
+    for name, entity_type in data.get("Entities", {}).items():
+        r = rng.random()
+        if r < 0.15:
+            continue
+        if r < 0.25:
+            name = name.lower()
+        elif r < 0.3:
+            entity_type = "disease"
+        entities[name] = entity_type
+    relations = [rel for rel in data.get("Relationships", []) if rng.random() > 0.15]
+    return json.dumps({"Entities": entities, "Relationships": relations}, ensure_ascii=False)
+
+
+def _huge_answer(rng, n):
+    entities = {f"entity {i} {rng.random():.6f}": rng.choice(["drug", "disease", "gene"]) for i in range(n)}
+    names = list(entities)
+    relations = [[rng.choice(names), "drug", "treat", rng.choice(names), "disease"] for _ in range(n)]
+    return json.dumps({"Entities": entities, "Relationships": relations})
+
+
+def _overlapping_answer(rng, gt, n):
+    """标注实体之外再加入 n 个与其中一个实体名称只差后缀的同类实体，关系的源实体同样替换"""
+    data = json.loads(gt)
+    entities = dict(data.get("Entities", {}))
+    relations = list(data.get("Relationships", []))
+    if not entities:
+        return json.dumps(data, ensure_ascii=False)
+    name, entity_type = rng.choice(list(entities.items()))
+    for i in range(n):
+        entities[f"{name}-{i}"] = entity_type
+    sources = [rel for rel in relations if isinstance(rel, list) and len(rel) == 5]
+    for i in range(n if sources else 0):
+        rel = list(rng.choice(sources))
+        rel[0] = f"{rel[0]}-{i}"
+        relations.append(rel)
+    return json.dumps({"Entities": entities, "Relationships": relations}, ensure_ascii=False)
+
+
+def make_rollouts(answers, shape, n, seed=0):
+    """返回 (predicts, ground_truths)，每个标注连续出现 8 次，与一组rollout的顺序一致"""
+    rng = random.Random(f"{seed}-{shape}")
+    predicts, ground_truths = [], []
+    while len(predicts) < n:
+        gt = rng.choice(answers)
+        for _ in range(min(8, n - len(predicts))):
+            answer = _perturb_answer(rng, gt)
+            think = _think(rng, rng.randint(500, 4000))
+            if shape == "truncated":
+                answer = answer[:rng.randint(1, max(1, len(answer) - 1))]
+            elif shape == "long_think":
+                think = _think(rng, 32000)
+            elif shape == "huge_entities":
+                answer = _huge_answer(rng, 1500)
+            elif shape == "overlapping_names":
+                answer = _overlapping_answer(rng, gt, 400)
+            if shape == "missing_tags":
+                predict = rng.choice([f"<think>{think}</think>\n{answer}",
+                                      f"<think>{think}</think>\n<answer>{answer}",
+                                      f"{think}</think>\n{answer}</answer>"])
+            else:
+                predict = f"<think>{think}</think>\n<answer>{answer}</answer>"
+            predicts.append(predict)
+            ground_truths.append(gt)
+    return predicts, ground_truths
+
+
+def _latency_stats(latencies_ns, elapsed):
+    latencies = sorted(latencies_ns)
+    n = len(latencies)
+    return {
+        "samples_per_sec": n / elapsed if elapsed > 0 else 0.0,
+        "p50_us": latencies[n // 2] / 1000,
+        "p99_us": latencies[min(n - 1, int(n * 0.99))] / 1000,
+        "mean_us": statistics.fmean(latencies) / 1000,
+    }
+
+
+def bench_single(predicts, ground_truths, cached=True, repeat=3):
+    """逐条调用 compute_score；cached=False 时每次都重新解析标注"""
+    best = None
+    original_cache = kg.GT_CACHE
+    try:
+        kg.GT_CACHE = kg.GroundTruthCache(8192 if cached else 0)
+        if cached:
+            kg.GT_CACHE.preload(ground_truths)
+        for _ in range(repeat):
+            latencies = []
+            start = time.perf_counter()
+            for predict_str, ground_truth in zip(predicts, ground_truths):
+                t0 = time.perf_counter_ns()
+                kg.compute_score(predict_str, ground_truth)
+                latencies.append(time.perf_counter_ns() - t0)
+            stats = _latency_stats(latencies, time.perf_counter() - start)
+            if best is None or stats["samples_per_sec"] > best["samples_per_sec"]:
+                best = stats
+    finally:
+        kg.GT_CACHE = original_cache
+    return best
+
+
+def bench_batch(predicts, ground_truths, repeat=3):
+    """compute_score_batch 的吞吐"""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        kg.compute_score_batch(predicts, ground_truths)
+        best = max(best, len(predicts) / (time.perf_counter() - start))
+    return {"samples_per_sec": best}
+
+
+_CHUNKS = []
+
+
+def _init_chunks(chunks):
+    global _CHUNKS
+    _CHUNKS = chunks
+
+
+def _score_chunk(index):
+    predicts, ground_truths = _CHUNKS[index]
+    kg.compute_score_batch(predicts, ground_truths)
+    return len(predicts)
+
+
+def bench_procs(predicts, ground_truths, procs, repeat=3):
+    """
+    procs 个独立进程的总吞吐：rollout 按组连续切成 procs*4 段，进程启动时拿到全部分段，计时内只传递段号
+
+    进程先对全部分段打分一次(标注缓存预热)，不计入计时。
+    """
+    size = -(-len(predicts) // (procs * 4))
+    size += -size % 8  # 同一标注的 8 个 rollout 不拆开
+    chunks = [(predicts[i:i + size], ground_truths[i:i + size]) for i in range(0, len(predicts), size)]
+    best = 0.0
+    with multiprocessing.Pool(procs, initializer=_init_chunks, initargs=(chunks,)) as pool:
+        pool.map(_score_chunk, range(len(chunks)), chunksize=1)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            n = sum(pool.map(_score_chunk, range(len(chunks)), chunksize=1))
+            best = max(best, n / (time.perf_counter() - start))
+    return {"samples_per_sec": best}
+
+
+def run_suite(answers, shapes, n, repeat, procs=()):
+    results = {}
+    for shape in shapes:
+        # huge_entities 等单条耗时高，样本数减少
+        size = max(64, n // 10) if shape in ("huge_entities", "long_think", "overlapping_names") else n
+        predicts, ground_truths = make_rollouts(answers, shape, size)
+        results[f"{shape}/single_cached"] = bench_single(predicts, ground_truths, True, repeat)
+        results[f"{shape}/single_uncached"] = bench_single(predicts, ground_truths, False, repeat)
+        results[f"{shape}/batch"] = bench_batch(predicts, ground_truths, repeat)
+        for num_procs in procs:
+            results[f"{shape}/procs{num_procs}"] = bench_procs(predicts, ground_truths, num_procs, repeat)
+        print(f"{shape:<14} " + "  ".join(f"{name.split('/')[1]}={r['samples_per_sec']:.0f}/s"
+                                         for name, r in results.items() if name.startswith(shape + "/")))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """返回退化的条目 [(名称, 指标, 基线值, 当前值)]"""
+    regressions = []
+    for name, base in baseline["results"].items():
+        cur = results.get(name)
+        if cur is None:
+            continue
+        if cur["samples_per_sec"] < base["samples_per_sec"] * (1 - tolerance):
+            regressions.append((name, "samples_per_sec", base["samples_per_sec"], cur["samples_per_sec"]))
+        if "p99_us" in base and cur["p99_us"] > base["p99_us"] * (1 + tolerance):
+            regressions.append((name, "p99_us", base["p99_us"], cur["p99_us"]))
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'Benchmark':<36} {'samples/s':>12} {'p50 (us)':>10} {'p99 (us)':>10}")
+    print("-" * 72)
+    for name, r in results.items():
+        p50 = f"{r['p50_us']:.1f}" if "p50_us" in r else "-"
+        p99 = f"{r['p99_us']:.1f}" if "p99_us" in r else "-"
+        print(f"{name:<36} {r['samples_per_sec']:>12.0f} {p50:>10} {p99:>10}")
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="奖励函数吞吐与延迟基准")
+    parser.add_argument("--data", default=os.path.join(here, "../../../../data/grpo/train_new.parquet"),
+                        help="提供标注的parquet文件")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--n", type=int, default=2000, help="每类rollout的条数")
+    parser.add_argument("--procs", nargs="+", type=int, default=None,
+                        help="独立打分进程数，默认 1 和 CPU 数；传 0 不测多进程")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最好的一次")
+    parser.add_argument("--save", default=None, help="把结果保存为基线")
+    parser.add_argument("--compare", default=None, help="与基线对比，退化时退出码为1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化")
+    args = parser.parse_args()
+
+    import pyarrow.parquet as pq
+
+    answers = pq.read_table(args.data, columns=["answer"]).column("answer").to_pylist()
+    procs = [p for p in (args.procs or sorted({1, os.cpu_count() or 1})) if p > 0]
+    results = run_suite(answers, args.shapes, args.n, args.repeat, procs)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "cpu_count": os.cpu_count(), "reward_mode": kg.REWARD_MODE, "results": results}, f, indent=2)
+        print(f"基线已保存到 {args.save}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("cpu_count") != os.cpu_count():
+            print(f"注意: 基线在 {baseline.get('cpu_count')} 核的机器上测量，当前 {os.cpu_count()} 核，procs* 的对比仅供参考")
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, base, cur in regressions:
+            print(f"退化: {name} {metric} {base:.1f} -> {cur:.1f}")
+        if regressions:
+            sys.exit(1)
+        print(f"与基线 {args.compare} 相比没有超过 {args.tolerance:.0%} 的退化")
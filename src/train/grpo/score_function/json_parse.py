@@ -0,0 +1,174 @@
+"""
+容错的JSON解析，奖励函数(kg.py)与蒸馏数据脚本(data/get_deepseek_res_multi.py)共用
+
+- loads: 优先使用 orjson，解析失败时回退到标准库 json
+- repair_json: 一次线性扫描，删除不匹配的右括号、补全未闭合的字符串与括号，字符串内的括号不计入
+- parse_json: 先直接解析，失败后修复再解析，同时返回是否经过修复，供奖励按修复与否给分
+- extract_json_strings: 数据脚本原有的同名函数，改为基于上面的线性实现
+"""
+import json
+import re
+from typing import Any, Iterator, Tuple
+
+try:
+    import orjson
+    _fast_loads = orjson.loads
+except ImportError:
+    _fast_loads = None
+
+_STRUCT_RE = re.compile(r'[\[\]{}"\\]')
+_PAIR = {"}": "{", "]": "[", "{": "}", "[": "]"}
+
+
+def loads(text: str, strict: bool = True) -> Any:
+    """
+    解析JSON字符串，orjson 可用时优先使用
+
+    orjson 比标准库更严格(不接受 NaN、超过64位的整数等)，失败时回退到 json.loads，
+    因此能解析的输入及结果与 json.loads 一致；都失败时抛出 json.JSONDecodeError。
+    """
+    if _fast_loads is not None:
+        try:
+            return _fast_loads(text)
+        except (ValueError, TypeError):
+            pass
+    return json.loads(text, strict=strict)
+
+
+def _last_non_space(s: str, i: int, lower: int) -> int:
+    """返回 s[lower:i] 中最后一个非空白字符的位置，没有时返回 -1"""
+    i -= 1
+    while i >= lower and s[i].isspace():
+        i -= 1
+    return i if i >= lower else -1
+
+
+def repair_json(text: str) -> str:
+    """
+    修复括号不匹配的JSON字符串
+
+    只在结构字符(括号、引号、反斜杠)之间跳转，输出按片段拼接，耗时与长度成线性关系：
+    - 与栈顶不匹配的右括号被删除，右括号前多余的逗号被删除
+    - 末尾未闭合的字符串补上引号，末尾多余的逗号删除，悬空的冒号补 null
+    - 未闭合的括号按嵌套顺序补全，最外层多余的一层 "{{...}}" 去掉
+    """
+    parts = []
+    stack = []
+    last = 0  # text[last:] 尚未写入 parts
+    in_string = False
+    escaped = -1  # 被反斜杠转义的字符位置
+    for m in _STRUCT_RE.finditer(text):
+        i = m.start()
+        c = text[i]
+        if i == escaped:
+            continue
+        if c == "\\":
+            if in_string:
+                escaped = i + 1
+            continue
+        if c == '"':
+            in_string = not in_string
+            continue
+        if in_string:
+            continue
+        if c in "{[":
+            stack.append(c)
+            continue
+        if stack and stack[-1] == _PAIR[c]:
+            stack.pop()
+            comma = _last_non_space(text, i, last)
+            if comma != -1 and text[comma] == ",":
+                parts.append(text[last:comma])
+                last = comma + 1
+        else:
+            parts.append(text[last:i])
+            last = i + 1
+    parts.append(text[last:])
+    fixed = "".join(parts)
+    if in_string:
+        fixed += '"'
+    elif stack:
+        fixed = fixed.rstrip()
+        if fixed.endswith(","):
+            fixed = fixed[:-1]
+        elif fixed.endswith(":"):
+            fixed += " null"
+    fixed += "".join(_PAIR[c] for c in reversed(stack))
+    while fixed.startswith("{{") and fixed.endswith("}}"):
+        fixed = fixed[1:-1]
+    return fixed
+
+
+def parse_json(text: str, strict: bool = True) -> Tuple[Any, bool]:
+    """
+    容错解析JSON
+
+    返回:
+        (obj, repaired): 解析结果，以及是否经过 repair_json 修复；修复后仍无法解析时抛出 json.JSONDecodeError
+    """
+    try:
+        return loads(text, strict), False
+    except json.JSONDecodeError:
+        pass
+    return loads(repair_json(text), strict), True
+
+
+def iter_json_spans(content: str) -> Iterator[Tuple[int, int]]:
+    """
+    依次返回 content 中每个括号配平的最外层 {...} 的 [start, end)
+
+    一次线性扫描，字符串内的括号不计入；末尾未配平的对象不返回。
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = -1
+    for m in _STRUCT_RE.finditer(content):
+        i = m.start()
+        c = content[i]
+        if depth == 0:
+            if c == "{":
+                depth, start, in_string = 1, i, False
+            continue
+        if i == escaped:
+            continue
+        if c == "\\":
+            if in_string:
+                escaped = i + 1
+        elif c == '"':
+            in_string = not in_string
+        elif in_string or c in "[]":
+            continue
+        elif c == "{":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                yield start, i + 1
+
+
+def extract_json_strings(content):
+    """提取第一个最外层JSON对象，直接解析失败时修复后解析；没有配平的对象时返回 None"""
+    for start, end in iter_json_spans(content):
+        json_str = content[start:end]
+        json_str = json_str.replace('\r\n', '').replace('  ', ' ').replace('\n', '')
+        json_str = json_str.replace('{\n', '{').replace(', ],', ' ],')
+        return parse_json(json_str, strict=False)[0]
+    return None
+
+
+if __name__ == "__main__":
+    samples = [
+        ('{"Entities": {"a": "b"}, "Relationships": [["a", "T", "r", "c", "T"]]}', False),
+        ('{"Entities": {"a": "b"}, "Relationships": [["a", "T", "r", "c", "T"]]', True),
+        ('{"Entities": {"a": "b"}, "Relationships": [["a", "T", "r", "c", "T"],', True),
+        ('{"Entities": {"a (x]": "b"}}]', True),
+        ('{"Entities": {"a": "b\\"}', True),
+        ('{"Entities": {"a": ', True),
+        ('{{"Entities": {}}}', True),
+    ]
+    for text, repaired in samples:
+        obj, was_repaired = parse_json(text)
+        assert was_repaired == repaired, text
+        print(was_repaired, obj)
+    print(extract_json_strings('思考...\n```json\n{"Entities": {"x{": "y"},\n "Relationships": []}\n```'))
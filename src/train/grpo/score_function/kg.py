@@ -12,10 +12,124 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import re
+import os
+import sys
 import json
-from typing import Dict, List, Tuple
-from collections import defaultdict
+import hashlib
+import threading
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+from collections import OrderedDict, defaultdict
+
+# EasyR1 按文件路径加载本文件，同目录的模块需要手动加入 sys.path
+_HERE = os.path.dirname(os.path.abspath(__file__))
+if _HERE not in sys.path:
+    sys.path.insert(0, _HERE)
+from json_parse import parse_json
+from soft_match import SoftIndex
+from reward_profile import CallTimer, profiler_from_env
+
+# answer 中的JSON需要修复括号才能解析时，准确率得分乘以该系数；设为0即不给分
+JSON_REPAIR_CREDIT = float(os.environ.get("KG_JSON_REPAIR_CREDIT", "0.5"))
+
+# 准确率奖励的匹配方式: exact 为实体/关系完全相同才计分；soft 为按名称相似度做最优一对一匹配，
+# 与评测端把 "Medical Qigong" 和 "Medical Qigong (MQ)" 判为正确的口径一致
+REWARD_MODE = os.environ.get("KG_REWARD_MODE", "exact")
+# soft 模式下名称相似度低于该值的不计分
+SOFT_MIN_SIM = float(os.environ.get("KG_SOFT_MIN_SIM", "0.5"))
+
+# KG_PROFILE=1 时记录各阶段耗时与失败分支计数，见 reward_profile.py；关闭时打分路径上只多一次判断
+PROFILER = profiler_from_env()
+
+class ParsedGroundTruth(NamedTuple):
+    entities: Dict[str, str]               # 实体字典 {entity_name: entity_type}
+    relations: Optional[FrozenSet[tuple]]  # 关系元组集合，关系无法转换为元组集合时为 None
+    soft: Optional[SoftIndex] = None       # soft 模式下预先建立的名称 n-gram 索引
+
+class ResponseScan(NamedTuple):
+    think_spans: List[Tuple[int, int]]  # 每段 <think> 内容的 [start, end)，与 re.findall(r'<think>(.*?)</think>') 一致
+    think_length: int                   # 全部 <think> 内容的长度之和
+    answer: Optional[str]               # 第一段 <answer>...</answer> 的内容，与 re.search(..., re.DOTALL) 一致
+    format_ok: bool                     # 是否满足 fullmatch(r"<think>.*?</think>\s*<answer>.*?</answer>", re.DOTALL)
+
+def scan_response(predict_str: str) -> ResponseScan:
+    """
+    一次线性扫描得到标签位置、think长度、answer内容和格式是否正确
+
+    只做前向的 str.find，不回溯，耗时与回复长度成线性关系，不受畸形输出影响。
+    """
+    s = predict_str
+    n = len(s)
+
+    # <think>(.*?)</think>，不带 DOTALL：内容中不能有换行，失败时从下一个位置继续找
+    think_spans = []
+    think_length = 0
+    pos = 0
+    next_close = -2  # 缓存的下一个 "</think>" 位置，-1 表示之后没有
+    next_newline = -2
+    while True:
+        i = s.find("<think>", pos)
+        if i == -1:
+            break
+        start = i + 7
+        if next_close != -1 and next_close < start:
+            next_close = s.find("</think>", start)
+        if next_newline != -1 and next_newline < start:
+            next_newline = s.find("\n", start)
+        if next_close != -1 and (next_newline == -1 or next_newline > next_close):
+            think_spans.append((start, next_close))
+            think_length += next_close - start
+            pos = next_close + 8
+        else:
+            pos = i + 1
+
+    # <answer>(.*?)</answer>，DOTALL：第一个 <answer> 之后的第一个 </answer>
+    answer = None
+    i = s.find("<answer>")
+    if i != -1:
+        j = s.find("</answer>", i + 8)
+        if j != -1:
+            answer = s[i + 8:j]
+
+    # 整体格式：以 <think> 开头、</answer> 结尾，中间存在 "</think>\s*<answer>"；
+    # 第一个满足条件的 </think> 使 <answer> 的结束位置最靠前，只需检查它
+    format_ok = False
+    if s.startswith("<think>") and s.endswith("</answer>"):
+        p = s.find("</think>", 7)
+        while p != -1:
+            j = p + 8
+            while j < n and s[j].isspace():
+                j += 1
+            if s.startswith("<answer>", j):
+                format_ok = j + 8 <= n - 9
+                break
+            p = s.find("</think>", j)
+    return ResponseScan(think_spans, think_length, answer, format_ok)
+
+_MISSING = object()
+
+def _intern(value):
+    """字符串放入解释器的驻留表，整个训练过程中相同的实体名称、类别、关系只保存一份"""
+    return sys.intern(value) if type(value) is str else value
+
+def parse_ground_truth(ground_truth: str) -> ParsedGroundTruth:
+    """
+    解析标注JSON并预先构建关系元组集合，同一标注的多个rollout可以共用；字符串经过驻留，缓存中的标注共用同一份
+
+    异常:
+        json.JSONDecodeError / AttributeError: 标注不是合法的JSON对象
+    """
+    gt_data = json.loads(ground_truth)
+    gt_entities = gt_data.get("Entities", {})
+    if isinstance(gt_entities, dict):
+        gt_entities = {_intern(name): _intern(entity_type) for name, entity_type in gt_entities.items()}
+    try:
+        gt_tuples = frozenset(tuple(map(_intern, rel)) for rel in gt_data.get("Relationships", []))
+    except Exception:
+        gt_tuples = None
+    soft = None
+    if REWARD_MODE == "soft" and isinstance(gt_entities, dict) and gt_tuples is not None:
+        soft = SoftIndex(gt_entities, list(gt_tuples), SOFT_MIN_SIM)
+    return ParsedGroundTruth(gt_entities, gt_tuples, soft)
 
 def accuracy_reward(predict_str: str, ground_truth: str) -> float:
     """
@@ -28,32 +142,65 @@ def accuracy_reward(predict_str: str, ground_truth: str) -> float:
     返回:
         float: 0到1之间的分数，表示预测准确率
     """
+    try:
+        parsed_gt = parse_ground_truth(ground_truth)
+    except (json.JSONDecodeError, AttributeError, KeyError):
+        return 0.0
+    return accuracy_reward_parsed(predict_str, parsed_gt)
+
+def accuracy_reward_parsed(predict_str: str, parsed_gt: Optional[ParsedGroundTruth],
+                           scan: Optional[ResponseScan] = None, timer: Optional[CallTimer] = None) -> float:
+    """
+    与 accuracy_reward 相同，标注为 parse_ground_truth 的结果；parsed_gt 为 None 表示标注无法解析，
+    scan 为已有的 scan_response 结果，timer 不为 None 时记录各阶段耗时与失败分支
+    """
     try:
         # 提取预测结果中的answer内容
         #print(predict_str)
-        content_match = re.search(r"<answer>(.*?)</answer>", predict_str, re.DOTALL)
-        if not content_match:
+        if scan is None:
+            scan = scan_response(predict_str)
+        if scan.answer is None:
+            if timer is not None:
+                timer.outcome = "no_answer"
             return 0.0
             
-        pred_content = content_match.group(1).strip()
+        pred_content = scan.answer.strip()
         
-        # 解析预测和标注的JSON
-        pred_data = json.loads(pred_content)
-        gt_data = json.loads(ground_truth)
-        
-        # 计算实体识别的F1分数
-        entity_f1 = calculate_entity_f1(pred_data.get("Entities", {}), 
-                                      gt_data.get("Entities", {}))
+        # 解析预测的JSON，缺少括号等可修复的错误按 JSON_REPAIR_CREDIT 折算得分
+        pred_data, repaired = parse_json(pred_content)
+        if timer is not None:
+            timer.mark("json")
+            timer.repaired = repaired
+        if parsed_gt is None:
+            if timer is not None:
+                timer.outcome = "gt_invalid"
+            return 0.0
         
-        # 计算关系抽取的F1分数
-        relation_f1 = calculate_relation_f1(pred_data.get("Relationships", []), 
-                                           gt_data.get("Relationships", []))
+        pred_entities = pred_data.get("Entities", {})
+        pred_relations = pred_data.get("Relationships", [])
+        if parsed_gt.soft is not None:
+            # soft 模式的两项F1共用名称相似度查询，耗时合并记在 relation_f1 阶段
+            entity_f1, relation_f1 = soft_f1_scores(pred_entities, pred_relations, parsed_gt.soft)
+        else:
+            # 计算实体识别的F1分数
+            entity_f1 = entity_f1_parsed(pred_entities, parsed_gt)
+            if timer is not None:
+                timer.mark("entity_f1")
+            
+            # 计算关系抽取的F1分数
+            relation_f1 = calculate_relation_f1(pred_relations, None, parsed_gt.relations)
+        if timer is not None:
+            timer.mark("relation_f1")
         
         # 返回平均F1分数
-        return (entity_f1 + relation_f1) / 2
+        score = (entity_f1 + relation_f1) / 2
+        return score * JSON_REPAIR_CREDIT if repaired else score
         
-    except (json.JSONDecodeError, AttributeError, KeyError):
+    except (json.JSONDecodeError, AttributeError, KeyError) as e:
         # 如果JSON解析失败或格式不正确，返回0分
+        if timer is not None:
+            timer.outcome = ("json_error" if isinstance(e, json.JSONDecodeError) else
+                             "attribute_error" if isinstance(e, AttributeError) else "key_error")
         return 0.0
 
 def calculate_entity_f1(pred_entities: Dict[str, str], 
@@ -99,13 +246,15 @@ def calculate_entity_f1(pred_entities: Dict[str, str],
         return 0.0
 
 def calculate_relation_f1(pred_relations: List[List], 
-                         gt_relations: List[List]) -> float:
+                         gt_relations: List[List],
+                         gt_tuples: Optional[FrozenSet[tuple]] = None) -> float:
     """
     计算关系抽取的F1分数
     
     参数:
         pred_relations: 预测的关系列表 [[entity1, type1, rel, type2, complication]]
         gt_relations: 标注的关系列表 [[entity1, type1, rel, type2, complication]]
+        gt_tuples: 预先构建的标注关系元组集合，提供时忽略 gt_relations
         
     返回:
         float: F1分数
@@ -113,49 +262,231 @@ def calculate_relation_f1(pred_relations: List[List],
     try:
         # 将关系转换为元组以便比较
         pred_tuples = {tuple(rel) for rel in pred_relations}
-        gt_tuples = {tuple(rel) for rel in gt_relations}
-        
-        true_positives = len(pred_tuples & gt_tuples)
-        false_positives = len(pred_tuples - gt_tuples)
-        false_negatives = len(gt_tuples - pred_tuples)
-        
-        # 计算precision和recall
-        precision = true_positives / (true_positives + false_positives) if (true_positives + false_positives) > 0 else 0
-        recall = true_positives / (true_positives + false_negatives) if (true_positives + false_negatives) > 0 else 0
+        if gt_tuples is None:
+            gt_tuples = {tuple(rel) for rel in gt_relations}
         
-        # 计算F1分数
-        f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
-        return f1
+        true_positives = len(gt_tuples.intersection(pred_tuples))
+        return _f1(true_positives, len(pred_tuples) - true_positives, len(gt_tuples) - true_positives)
+    except:
+        return 0.0
+
+def entity_f1_parsed(pred_entities: Dict[str, str], parsed_gt: ParsedGroundTruth) -> float:
+    """
+    与 calculate_entity_f1 相同，一次遍历预测实体同时统计正确数与命中的标注名称数
+
+    名称相同、类别相同才计为正确；名称出现在标注中但类别错误计为误报，不计为遗漏。
+    """
+    gt_entities = parsed_gt.entities
+    if not isinstance(gt_entities, dict):
+        return calculate_entity_f1(pred_entities, gt_entities)
+    try:
+        true_positives = 0
+        found = 0
+        for entity, pred_type in pred_entities.items():
+            gt_type = gt_entities.get(entity, _MISSING)
+            if gt_type is not _MISSING:
+                found += 1
+                if pred_type == gt_type:
+                    true_positives += 1
+        return _f1(true_positives, len(pred_entities) - true_positives, len(gt_entities) - found)
     except:
         return 0.0
 
+def soft_f1_scores(pred_entities: Dict[str, str], pred_relations: List[List],
+                   soft: SoftIndex) -> Tuple[float, float]:
+    """
+    soft 模式的实体与关系F1，预测与标注按名称相似度做最优一对一匹配，匹配得分之和作为TP
+
+    预测格式不正确的部分与 exact 模式一样记0分；实体与关系共用同一次名称相似度查询的结果。
+    """
+    sim_cache = {}
+    try:
+        entity_f1 = soft.entity_f1(pred_entities, sim_cache)
+    except Exception:
+        entity_f1 = 0.0
+    try:
+        relation_f1 = soft.relation_f1(pred_relations, sim_cache)
+    except Exception:
+        relation_f1 = 0.0
+    return entity_f1, relation_f1
+
+def _f1(true_positives: int, false_positives: int, false_negatives: int) -> float:
+    # 计算precision和recall
+    precision = true_positives / (true_positives + false_positives) if (true_positives + false_positives) > 0 else 0
+    recall = true_positives / (true_positives + false_negatives) if (true_positives + false_negatives) > 0 else 0
+    
+    # 计算F1分数
+    return 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
+
 def format_reward(predict_str: str) -> float:
-    pattern = re.compile(r"<think>.*?</think>\s*<answer>.*?</answer>", re.DOTALL)
-    format_match = re.fullmatch(pattern, predict_str)
-    return 1.0 if format_match else 0.0
+    return 1.0 if scan_response(predict_str).format_ok else 0.0
 
 def think_length_reward(predict_str: str, max_length: int) -> int:
-    # Find all content between <think> and </think> tags (non-greedy match)
-    think_contents = re.findall(r'<think>(.*?)</think>', predict_str)
-    
-    # Sum the lengths of all found think contents
-    total_length = sum(len(content) for content in think_contents)
+    # Sum the lengths of all content between <think> and </think> tags (non-greedy match)
+    return _length_score(scan_response(predict_str).think_length, max_length)
 
+def _length_score(total_length: int, max_length: int) -> float:
     score = 1 - abs(total_length - max_length)/max_length
     score = 0.0 if score < 0.0 else score
     
     return score
 
+def _safe_parse_ground_truth(ground_truth: str) -> Optional[ParsedGroundTruth]:
+    try:
+        return parse_ground_truth(ground_truth)
+    except (json.JSONDecodeError, AttributeError, KeyError):
+        return None
+
+class GroundTruthCache:
+    """
+    解析后标注的LRU缓存，键为标注字符串的哈希
+
+    同一批标注每个epoch、每组n个rollout都会重复出现，缓存后只需解析一次。
+    """
+
+    def __init__(self, maxsize: int = 8192):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(ground_truth: str) -> bytes:
+        return hashlib.blake2b(ground_truth.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, ground_truth: str) -> Optional[ParsedGroundTruth]:
+        """返回解析后的标注，标注无法解析时返回 None"""
+        key = self._key(ground_truth)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        parsed_gt = _safe_parse_ground_truth(ground_truth)
+        self._put(key, parsed_gt)
+        return parsed_gt
+
+    def _put(self, key: bytes, parsed_gt: Optional[ParsedGroundTruth]) -> None:
+        with self._lock:
+            self._data[key] = parsed_gt
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def preload(self, ground_truths: Iterable[str]) -> int:
+        """预先解析一批标注；缓存容量不足时扩大到能容纳全部标注"""
+        keys = {}
+        for ground_truth in ground_truths:
+            keys.setdefault(self._key(ground_truth), ground_truth)
+        self.maxsize = max(self.maxsize, len(keys))
+        for key, ground_truth in keys.items():
+            self._put(key, _safe_parse_ground_truth(ground_truth))
+        return len(keys)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "gt_cache/hits": self.hits,
+            "gt_cache/misses": self.misses,
+            "gt_cache/hit_rate": self.hits / total if total > 0 else 0.0,
+            "gt_cache/size": len(self._data),
+        }
+
+GT_CACHE = GroundTruthCache(int(os.environ.get("KG_GT_CACHE_SIZE", 8192)))
+
+def get_gt_cache_stats() -> Dict[str, float]:
+    """标注缓存的命中统计，供 trainer logger 记录"""
+    return GT_CACHE.stats()
+
+def preload_ground_truths(parquet_path: str, answer_key: str = "answer") -> int:
+    """在reward worker启动时预先解析训练数据的全部标注，返回不同标注的个数"""
+    import pyarrow.parquet as pq
+
+    answers = pq.read_table(parquet_path, columns=[answer_key]).column(answer_key).to_pylist()
+    return GT_CACHE.preload(answer for answer in answers if isinstance(answer, str))
+
 def compute_score(predict_str: str, ground_truth: str, format_weight: float = 0.5) -> Dict[str, float]:
-    lenght_score = think_length_reward(predict_str, 4000)
-    format_score = (format_reward(predict_str) + lenght_score)/2
-    accuracy_score = accuracy_reward(predict_str, ground_truth)
+    if PROFILER.enabled:
+        timer = PROFILER.start()
+        parsed_gt = GT_CACHE.get(ground_truth)
+        timer.mark("gt")
+        return _compute_score_profiled(predict_str, parsed_gt, format_weight, timer, ground_truth)
+    return compute_score_parsed(predict_str, GT_CACHE.get(ground_truth), format_weight)
+
+def _compute_score_profiled(predict_str: str, parsed_gt: Optional[ParsedGroundTruth], format_weight: float,
+                            timer: CallTimer, ground_truth: Optional[str] = None) -> Dict[str, float]:
+    """计时版本的 compute_score_parsed，返回值额外带有逐样本的 profile/<阶段>_us"""
+    score = compute_score_parsed(predict_str, parsed_gt, format_weight, timer)
+    PROFILER.finish(timer, predict_str, ground_truth)
+    score.update(timer.fields())
+    return score
+
+def get_reward_profile() -> Dict[str, float]:
+    """
+    累计的分阶段耗时分位数与失败分支计数(扁平字典)，未开启 KG_PROFILE 时为空
+    """
+    return PROFILER.metrics() if PROFILER.enabled else {}
+
+def compute_score_parsed(predict_str: str, parsed_gt: Optional[ParsedGroundTruth],
+                         format_weight: float = 0.5, timer: Optional[CallTimer] = None) -> Dict[str, float]:
+    """与 compute_score 相同，标注为 parse_ground_truth 的结果；回复只扫描一次"""
+    scan = scan_response(predict_str)
+    if timer is not None:
+        timer.mark("scan")
+    lenght_score = _length_score(scan.think_length, 4000)
+    format_score = ((1.0 if scan.format_ok else 0.0) + lenght_score)/2
+    if timer is not None:
+        timer.mark("length")
+    accuracy_score = accuracy_reward_parsed(predict_str, parsed_gt, scan, timer)
     return {
         "overall": (1 - format_weight) * accuracy_score + format_weight * format_score,
         "format": format_score,
         "accuracy": accuracy_score,
     }
 
+def _score_parsed(predict_str: str, parsed_gt: Optional[ParsedGroundTruth], format_weight: float,
+                  ground_truth: str) -> Dict[str, float]:
+    if PROFILER.enabled:
+        return _compute_score_profiled(predict_str, parsed_gt, format_weight, PROFILER.start(), ground_truth)
+    return compute_score_parsed(predict_str, parsed_gt, format_weight)
+
+def compute_score_batch(predicts: List[str], ground_truths: List[str],
+                        format_weight: float = 0.5) -> List[Dict[str, float]]:
+    """
+    批量计算奖励，结果与逐条调用 compute_score 相同
+
+    同一标注(一个prompt的n个rollout)只查询一次标注缓存，在当前进程中计算。不使用进程池：
+    valid rollout 逐条约 30us，把回复与结果在进程间传递的开销更大，bench_reward 中
+    256~4096 条、1~4 个进程的各种规模下进程池都比单进程慢(valid 约 3.3万/s 对 1.5~2.4万/s)。
+
+    参数:
+        predicts: 预测字符串列表
+        ground_truths: 与 predicts 一一对应的标注JSON字符串
+        format_weight: 格式奖励的权重
+
+    返回:
+        list: 与 predicts 一一对应的 {"overall", "format", "accuracy"}
+    """
+    if len(predicts) != len(ground_truths):
+        raise ValueError(f"predicts ({len(predicts)}) and ground_truths ({len(ground_truths)}) differ in length")
+
+    groups = defaultdict(list)
+    for i, ground_truth in enumerate(ground_truths):
+        groups[ground_truth].append(i)
+
+    scores = [None] * len(predicts)
+    for ground_truth, indices in groups.items():
+        parsed_gt = GT_CACHE.get(ground_truth)
+        for i in indices:
+            scores[i] = _score_parsed(predicts[i], parsed_gt, format_weight, ground_truth)
+    return scores
+
+# 例如 KG_GT_PRELOAD=/datadisk/data/train_new.parquet,/datadisk/data/test_new.parquet
+for _path in filter(None, os.environ.get("KG_GT_PRELOAD", "").split(",")):
+    preload_ground_truths(_path)
+
 if __name__ == "__main__":
     # 标注数据
     ground_truth = """
@@ -187,3 +518,13 @@ if __name__ == "__main__":
     print(compute_score(predict_str3, ground_truth))
     predict_str4 = "<think>fslajldfkjajflajsfejoqiwefjlwjfekasjdflaksdfljaljdsfkasfdjlajfkajsfd</think>\n<answer>Invalid JSON</answer>"
     print(think_length_reward(predict_str4, 70))
+
+    predicts = [predict_str1, predict_str2, predict_str3, predict_str4]
+    ground_truths = [ground_truth, ground_truth, ground_truth, "{}"]
+    def _strip_profile(scores):
+        return [{k: v for k, v in score.items() if not k.startswith("profile/")} for score in scores]
+    batch_scores = _strip_profile(compute_score_batch(predicts, ground_truths))
+    assert batch_scores == _strip_profile([compute_score(p, g) for p, g in zip(predicts, ground_truths)])
+    print(get_gt_cache_stats())
+    if PROFILER.enabled:
+        print(get_reward_profile())
@@ -0,0 +1,33 @@
+"""
+实体名称的规范化，奖励函数的软匹配(soft_match.py)与评测端的本地预判定(src/test/local_match.py)共用
+
+两端必须按同一口径判断名称是否等价，否则训练时计分的写法与评测时判对的写法会不一致；
+本文件随 score_function 目录一起复制到 EasyR1，评测端通过 sys.path 引用。
+"""
+import re
+import unicodedata
+
+_PAREN_RE = re.compile(r"\s*[(\[（]([^()\[\]（）]*)[)\]）]")
+
+
+def normalize(text) -> str:
+    """统一大小写、全半角、下划线与空白"""
+    text = unicodedata.normalize("NFKC", str(text)).lower().replace("_", " ")
+    return " ".join(text.split()).strip(" .,;:")
+
+
+def strip_abbreviation(text) -> str:
+    """去掉括号中的缩写或备注，如 "medical qigong (mq)" -> "medical qigong" """
+    return normalize(_PAREN_RE.sub(" ", text))
+
+
+def name_variants(text) -> set:
+    """实体名称的等价写法：原名、去括号名以及括号内的缩写"""
+    norm = normalize(text)
+    variants = {norm, strip_abbreviation(norm)}
+    for abbr in _PAREN_RE.findall(norm):
+        abbr = normalize(abbr)
+        if abbr:
+            variants.add(abbr)
+    variants.discard("")
+    return variants
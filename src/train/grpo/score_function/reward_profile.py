@@ -0,0 +1,243 @@
+"""
+奖励函数的分阶段计时与分支计数，供 kg.py 在 KG_PROFILE=1 时使用
+
+- 每次打分记录各阶段耗时(标注缓存、标签扫描、长度奖励、JSON解析、实体F1、关系F1、总耗时)，
+  累加到按 1/4 倍频程分桶的直方图，以及各失败分支(无 <answer>、JSON错误等)的计数
+- 可选保留耗时最长的 N 个输入，便于定位慢样本
+- 每隔 KG_PROFILE_EVERY 次打分导出一次：写入 KG_PROFILE_DIR 下的 reward_profile.jsonl(带 pid，
+  内容为累计的原始直方图)，未设置目录时打印
+- 多个reward worker的导出可用 `python reward_profile.py <dir>/reward_profile.jsonl` 合并查看
+"""
+import argparse
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+STAGES = ("gt", "scan", "length", "json", "entity_f1", "relation_f1", "total")
+N_BUCKETS = 128  # 桶 b 覆盖 [2^(b/4), 2^((b+1)/4)) 微秒，上限约 4.3e9 微秒
+
+
+def _bucket(us: float) -> int:
+    if us < 1.0:
+        return 0
+    return min(N_BUCKETS - 1, int(math.log2(us) * 4) + 1)
+
+
+def _bucket_upper(b: int) -> float:
+    return 2 ** (b / 4)
+
+
+def quantile(hist: List[int], q: float) -> float:
+    """按直方图估计分位数，返回所在桶的上界(微秒)"""
+    total = sum(hist)
+    if total == 0:
+        return 0.0
+    target = q * total
+    seen = 0
+    for b, n in enumerate(hist):
+        seen += n
+        if seen >= target:
+            return _bucket_upper(b)
+    return _bucket_upper(N_BUCKETS - 1)
+
+
+class CallTimer:
+    """单次打分的计时，mark(stage) 记录上一个时间点到现在的耗时"""
+
+    __slots__ = ("start", "last", "stages", "outcome", "repaired")
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter_ns()
+        self.stages = {}
+        self.outcome = "ok"
+        self.repaired = False
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter_ns()
+        self.stages[stage] = self.stages.get(stage, 0) + now - self.last
+        self.last = now
+
+    def fields(self) -> Dict[str, float]:
+        """逐样本的耗时(微秒)，加入 compute_score 的返回值后由 EasyR1 按step求均值记录"""
+        return {f"profile/{stage}_us": ns / 1000 for stage, ns in self.stages.items()}
+
+
+class RewardProfiler:
+    def __init__(self, enabled: bool = False, slowest: int = 0, every: int = 0, out_dir: Optional[str] = None):
+        self.enabled = enabled
+        self.slowest = slowest
+        self.every = every
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.calls = 0
+        self.hist = {stage: [0] * N_BUCKETS for stage in STAGES}
+        self.sum_us = dict.fromkeys(STAGES, 0.0)
+        self.max_us = dict.fromkeys(STAGES, 0.0)
+        self.outcomes = {}
+        self.repaired = 0
+        self._slow = []  # 最小堆 (总耗时, 序号, 记录)
+        self._seq = itertools.count()
+
+    def start(self) -> CallTimer:
+        return CallTimer()
+
+    def finish(self, call: CallTimer, predict_str: str, ground_truth: Optional[str] = None) -> None:
+        call.stages["total"] = time.perf_counter_ns() - call.start
+        with self._lock:
+            self.calls += 1
+            for stage, ns in call.stages.items():
+                us = ns / 1000
+                self.hist[stage][_bucket(us)] += 1
+                self.sum_us[stage] += us
+                if us > self.max_us[stage]:
+                    self.max_us[stage] = us
+            self.outcomes[call.outcome] = self.outcomes.get(call.outcome, 0) + 1
+            self.repaired += call.repaired
+            if self.slowest > 0:
+                total_us = call.stages["total"] / 1000
+                if len(self._slow) < self.slowest or total_us > self._slow[0][0]:
+                    self._keep_slow({"total_us": total_us, "outcome": call.outcome,
+                                     "stages_us": {k: v / 1000 for k, v in call.stages.items()},
+                                     "predict": predict_str, "ground_truth": ground_truth})
+            export = self.every > 0 and self.calls % self.every == 0
+        if export:
+            self.export()
+
+    def _snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hist": {k: list(v) for k, v in self.hist.items()},
+            "sum_us": dict(self.sum_us),
+            "max_us": dict(self.max_us),
+            "outcomes": dict(self.outcomes),
+            "repaired": self.repaired,
+            "slowest": [record for _, _, record in sorted(self._slow, key=lambda x: -x[0])],
+        }
+
+    def _keep_slow(self, record: dict) -> None:
+        item = (record["total_us"], next(self._seq), record)
+        if len(self._slow) < self.slowest:
+            heapq.heappush(self._slow, item)
+        elif item[0] > self._slow[0][0]:
+            heapq.heapreplace(self._slow, item)
+
+    def snapshot(self) -> dict:
+        """可 JSON 序列化、可合并的累计统计"""
+        with self._lock:
+            return self._snapshot()
+
+    def metrics(self) -> Dict[str, float]:
+        return metrics_from_snapshot(self.snapshot())
+
+    def export(self) -> Dict[str, float]:
+        """导出一次累计统计：写入 out_dir 或打印，返回扁平的指标字典"""
+        snapshot = self.snapshot()
+        metrics = metrics_from_snapshot(snapshot)
+        if self.out_dir:
+            os.makedirs(self.out_dir, exist_ok=True)
+            record = {"pid": os.getpid(), "time": time.time(),
+                      "snapshot": {k: v for k, v in snapshot.items() if k != "slowest"}}
+            with open(os.path.join(self.out_dir, "reward_profile.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            if snapshot["slowest"]:
+                path = os.path.join(self.out_dir, f"reward_slowest.{os.getpid()}.jsonl")
+                with open(path, "w", encoding="utf-8") as f:
+                    for item in snapshot["slowest"]:
+                        f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        else:
+            print(format_metrics(metrics))
+        return metrics
+
+
+def _merge_into(target, snapshot: dict) -> None:
+    target.calls += snapshot["calls"]
+    for stage, hist in snapshot["hist"].items():
+        target.hist[stage] = [a + b for a, b in zip(target.hist[stage], hist)]
+        target.sum_us[stage] += snapshot["sum_us"][stage]
+        target.max_us[stage] = max(target.max_us[stage], snapshot["max_us"][stage])
+    for outcome, n in snapshot["outcomes"].items():
+        target.outcomes[outcome] = target.outcomes.get(outcome, 0) + n
+    target.repaired += snapshot["repaired"]
+    if target.slowest > 0:
+        for record in snapshot.get("slowest", []):
+            target._keep_slow(record)
+
+
+def metrics_from_snapshot(snapshot: dict) -> Dict[str, float]:
+    """扁平的指标字典，键形如 reward_profile/json/p99_us，可直接交给 console/wandb logger"""
+    calls = snapshot["calls"]
+    metrics = {"reward_profile/calls": calls}
+    for stage, hist in snapshot["hist"].items():
+        n = sum(hist)
+        if n == 0:
+            continue
+        prefix = f"reward_profile/{stage}"
+        metrics[f"{prefix}/mean_us"] = snapshot["sum_us"][stage] / n
+        metrics[f"{prefix}/p50_us"] = quantile(hist, 0.5)
+        metrics[f"{prefix}/p90_us"] = quantile(hist, 0.9)
+        metrics[f"{prefix}/p99_us"] = quantile(hist, 0.99)
+        metrics[f"{prefix}/max_us"] = snapshot["max_us"][stage]
+    for outcome, n in snapshot["outcomes"].items():
+        metrics[f"reward_profile/outcome/{outcome}"] = n
+        metrics[f"reward_profile/outcome/{outcome}_rate"] = n / calls if calls else 0.0
+    metrics["reward_profile/outcome/json_repaired"] = snapshot["repaired"]
+    return metrics
+
+
+def format_metrics(metrics: Dict[str, float]) -> str:
+    return " ".join(f"{k.replace('reward_profile/', '')}={v:.1f}" if isinstance(v, float) else
+                    f"{k.replace('reward_profile/', '')}={v}" for k, v in metrics.items())
+
+
+def merge_profile_log(path: str) -> dict:
+    """合并 reward_profile.jsonl 中每个 pid 最后一次导出的累计统计"""
+    latest = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            latest[record["pid"]] = record["snapshot"]
+    merged = RewardProfiler()
+    for snapshot in latest.values():
+        _merge_into(merged, snapshot)
+    return merged.snapshot()
+
+
+def profiler_from_env() -> RewardProfiler:
+    return RewardProfiler(
+        enabled=os.environ.get("KG_PROFILE", "0") not in ("", "0"),
+        slowest=int(os.environ.get("KG_PROFILE_SLOWEST", 0)),
+        every=int(os.environ.get("KG_PROFILE_EVERY", 10000)),
+        out_dir=os.environ.get("KG_PROFILE_DIR") or None,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合并多个reward worker导出的分阶段耗时与分支计数")
+    parser.add_argument("log", help="KG_PROFILE_DIR 下的 reward_profile.jsonl")
+    args = parser.parse_args()
+
+    snapshot = merge_profile_log(args.log)
+    metrics = metrics_from_snapshot(snapshot)
+    print(f"{'Stage':<14} {'mean':>10} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}  (us)")
+    print("-" * 72)
+    for stage in STAGES:
+        prefix = f"reward_profile/{stage}"
+        if f"{prefix}/mean_us" not in metrics:
+            continue
+        print(f"{stage:<14} " + " ".join(f"{metrics[f'{prefix}/{k}_us']:>10.1f}"
+                                         for k in ("mean", "p50", "p90", "p99", "max")))
+    print(f"\ncalls: {snapshot['calls']}")
+    for outcome, n in sorted(snapshot["outcomes"].items(), key=lambda x: -x[1]):
+        print(f"{outcome:<20} {n:>10} {n / max(snapshot['calls'], 1):>8.2%}")
+    print(f"{'json_repaired':<20} {snapshot['repaired']:>10}")
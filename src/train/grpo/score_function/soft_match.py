@@ -0,0 +1,256 @@
+"""
+软匹配的实体/关系F1，供 kg.py 的 soft 奖励模式使用
+
+名称的规范化规则与评测端共用 name_norm.py(大小写、全半角、"_" 与空格、括号缩写)，
+规范化后等价的名称相似度为1，否则为字符三元组集合的 Jaccard 相似度。
+每个标注预先建立名称的 n-gram 倒排索引，预测名称只与共享 n-gram 的标注名称计算相似度；
+预测与标注之间按相似度做最优一对一匹配，匹配得分之和作为软TP计算F1。
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from name_norm import name_variants, normalize, strip_abbreviation
+
+
+def char_ngrams(text: str, n: int = 3) -> frozenset:
+    """首尾补空格后的字符 n-gram 集合"""
+    text = f" {text} "
+    if len(text) <= n:
+        return frozenset([text])
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+class NameIndex:
+    """标注名称的倒排索引：等价写法 -> 名称编号，字符 n-gram -> 名称编号"""
+
+    def __init__(self, names: List[str], min_sim: float = 0.5):
+        self.min_sim = min_sim
+        self.grams = []
+        self.by_variant = defaultdict(list)
+        self.by_gram = defaultdict(list)
+        for i, name in enumerate(names):
+            for variant in name_variants(name):
+                self.by_variant[variant].append(i)
+            grams = char_ngrams(strip_abbreviation(name))
+            self.grams.append(grams)
+            for gram in grams:
+                self.by_gram[gram].append(i)
+
+    def similar(self, name) -> Dict[int, float]:
+        """返回 {标注名称编号: 相似度}，只包含相似度不低于 min_sim 的名称"""
+        result = {}
+        for variant in name_variants(name):
+            for i in self.by_variant.get(variant, ()):
+                result[i] = 1.0
+        grams = char_ngrams(strip_abbreviation(name))
+        shared = defaultdict(int)
+        for gram in grams:
+            for i in self.by_gram.get(gram, ()):
+                shared[i] += 1
+        for i, n_shared in shared.items():
+            if i in result:
+                continue
+            sim = n_shared / (len(grams) + len(self.grams[i]) - n_shared)
+            if sim >= self.min_sim:
+                result[i] = sim
+        return result
+
+
+def _hungarian(weights: List[List[float]]) -> float:
+    """
+    n x m (n <= m) 矩阵的最大权匹配(Kuhn-Munkres)，每行匹配一个不同的列，返回匹配权重之和
+
+    每加入一行最多扩展 n 次、每次扫描 m 列，复杂度 O(n^2 * m)；调用方把较小的一侧作为行，
+    少数标注对上千个相似预测名称时耗时与预测数成线性关系。
+    """
+    n, m = len(weights), len(weights[0])
+    inf = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    match = [0] * (m + 1)  # match[列] = 行，均从1开始编号
+    way = [0] * (m + 1)
+    for row in range(1, n + 1):
+        match[0] = row
+        col0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[col0] = True
+            row0 = match[col0]
+            row_weights = weights[row0 - 1]
+            u_row0 = u[row0]
+            delta = inf
+            col1 = 0
+            for col in range(1, m + 1):
+                if used[col]:
+                    continue
+                cur = -row_weights[col - 1] - u_row0 - v[col]
+                if cur < minv[col]:
+                    minv[col] = cur
+                    way[col] = col0
+                if minv[col] < delta:
+                    delta = minv[col]
+                    col1 = col
+            for col in range(m + 1):
+                if used[col]:
+                    u[match[col]] += delta
+                    v[col] -= delta
+                else:
+                    minv[col] -= delta
+            col0 = col1
+            if match[col0] == 0:
+                break
+        while col0:
+            col1 = way[col0]
+            match[col0] = match[col1]
+            col0 = col1
+    return sum(weights[match[col] - 1][col - 1] for col in range(1, m + 1) if match[col])
+
+
+def max_weight_matching(edges: Dict[Tuple[int, int], float]) -> float:
+    """
+    预测与标注之间的最优一对一匹配，返回匹配权重之和
+
+    参数:
+        edges: {(预测编号, 标注编号): 权重}，只包含权重大于0的边
+
+    按连通分量分别求解：只有一条边的分量直接取其权重，其余分量用 Kuhn-Munkres 求解，
+    以预测与标注中较少的一侧作为行(长方阵，不补成方阵)。
+    """
+    parent = {}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for p, g in edges:
+        a, b = ("p", p), ("g", g)
+        parent.setdefault(a, a)
+        parent.setdefault(b, b)
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+    components = defaultdict(list)
+    for edge in edges:
+        components[find(("p", edge[0]))].append(edge)
+    total = 0.0
+    for component in components.values():
+        if len(component) == 1:
+            total += edges[component[0]]
+            continue
+        rows = sorted({p for p, _ in component})
+        cols = sorted({g for _, g in component})
+        row_pos = {p: i for i, p in enumerate(rows)}
+        col_pos = {g: i for i, g in enumerate(cols)}
+        transpose = len(rows) > len(cols)
+        if transpose:
+            weights = [[0.0] * len(rows) for _ in cols]
+        else:
+            weights = [[0.0] * len(cols) for _ in rows]
+        for p, g in component:
+            if transpose:
+                weights[col_pos[g]][row_pos[p]] = edges[(p, g)]
+            else:
+                weights[row_pos[p]][col_pos[g]] = edges[(p, g)]
+        total += _hungarian(weights)
+    return total
+
+
+def soft_f1(soft_tp: float, n_pred: int, n_gold: int) -> float:
+    precision = soft_tp / n_pred if n_pred > 0 else 0
+    recall = soft_tp / n_gold if n_gold > 0 else 0
+    return 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
+
+
+class SoftIndex:
+    """
+    单个标注的软匹配索引，在解析标注时建立一次，同一标注的所有rollout共用
+
+    实体要求类别规范化后相同，得分为名称相似度；关系
+    [source_entity, source_type, relationship, target_entity, target_type]
+    要求类别与关系规范化后相同，得分为两端实体名称相似度的较小值。
+    """
+
+    def __init__(self, entities: dict, relations: list, min_sim: float = 0.5):
+        names = {}
+        self.entities = []  # [(名称编号, 规范化类别)]
+        for name, entity_type in entities.items():
+            self.entities.append((names.setdefault(name, len(names)), normalize(entity_type)))
+        self.relations = []  # [(源实体名称编号, 规范化标签, 目标实体名称编号)]，格式不对的行为 None
+        for rel in relations:
+            if isinstance(rel, (list, tuple)) and len(rel) == 5:
+                labels = (normalize(rel[1]), normalize(rel[2]), normalize(rel[4]))
+                self.relations.append((names.setdefault(str(rel[0]), len(names)), labels,
+                                       names.setdefault(str(rel[3]), len(names))))
+            else:
+                self.relations.append(None)
+        self.index = NameIndex(list(names), min_sim)
+        self.entities_by_type = defaultdict(list)
+        for j, (name_id, entity_type) in enumerate(self.entities):
+            self.entities_by_type[entity_type].append((j, name_id))
+        self.relations_by_labels = defaultdict(list)
+        for k, rel in enumerate(self.relations):
+            if rel is not None:
+                self.relations_by_labels[rel[1]].append((k, rel[0], rel[2]))
+
+    def entity_f1(self, pred_entities: dict, sim_cache: Optional[dict] = None) -> float:
+        sim_cache = {} if sim_cache is None else sim_cache
+        edges = {}
+        for i, (name, entity_type) in enumerate(pred_entities.items()):
+            candidates = self.entities_by_type.get(normalize(entity_type))
+            if not candidates:
+                continue
+            sims = self._similar(name, sim_cache)
+            for j, name_id in candidates:
+                sim = sims.get(name_id)
+                if sim:
+                    edges[(i, j)] = sim
+        return soft_f1(max_weight_matching(edges), len(pred_entities), len(self.entities))
+
+    def relation_f1(self, pred_relations: list, sim_cache: Optional[dict] = None) -> float:
+        sim_cache = {} if sim_cache is None else sim_cache
+        pred_tuples = {tuple(rel) for rel in pred_relations}
+        edges = {}
+        for i, rel in enumerate(pred_tuples):
+            if len(rel) != 5:
+                continue
+            candidates = self.relations_by_labels.get((normalize(rel[1]), normalize(rel[2]), normalize(rel[4])))
+            if not candidates:
+                continue
+            source_sims = self._similar(str(rel[0]), sim_cache)
+            target_sims = self._similar(str(rel[3]), sim_cache)
+            for k, source_id, target_id in candidates:
+                sim = min(source_sims.get(source_id, 0.0), target_sims.get(target_id, 0.0))
+                if sim > 0.0:
+                    edges[(i, k)] = sim
+        return soft_f1(max_weight_matching(edges), len(pred_tuples), len(self.relations))
+
+    def _similar(self, name, sim_cache: dict) -> Dict[int, float]:
+        sims = sim_cache.get(name)
+        if sims is None:
+            sims = sim_cache[name] = self.index.similar(name)
+        return sims
+
+
+if __name__ == "__main__":
+    import itertools
+    import random
+
+    index = SoftIndex({"Medical Qigong (MQ)": "treatment", "hypertension": "disease"},
+                      [["Medical Qigong (MQ)", "treatment", "treat", "hypertension", "disease"]])
+    print(index.entity_f1({"medical qigong": "Treatment", "Hypertensions": "disease"}))
+    print(index.relation_f1([["MQ", "treatment", "treat", "hypertension", "disease"]]))
+
+    # 与穷举的最优匹配对比
+    rng = random.Random(0)
+    for _ in range(2000):
+        n_pred, n_gold = rng.randint(0, 5), rng.randint(0, 5)
+        edges = {(p, g): rng.choice([0.5, 0.7, 1.0, rng.random()]) for p in range(n_pred) for g in range(n_gold)
+                 if rng.random() < 0.5}
+        best = 0.0
+        for perm in itertools.permutations(range(max(n_pred, n_gold)), n_pred):
+            best = max(best, sum(edges.get((p, g), 0.0) for p, g in enumerate(perm)))
+        assert abs(max_weight_matching(edges) - best) < 1e-9, edges
+    print("max_weight_matching agrees with brute force")
@@ -0,0 +1,282 @@
+"""
+把蒸馏输出(data/get_deepseek_res_multi.py 的 <前缀>.jsonl，字段 id/conversation/response/reasoner)
+转换为 LLaMA-Factory 的 sharegpt 格式数据集 deepseek_sft
+
+- 一次流式读取：每条转换为 {"conversations": [human, gpt]}，先写入临时文件并记录偏移。human 按 GRPO 训练数据的
+  布局重建(data/kg_prompt.build_training_prompt + 训练脚本的 FORMAT_PROMPT，与 src/test/infer.py 相同)，
+  蒸馏时的 prompt 是摘要放在最后的布局；gpt 的内容为 <think>\\n推理\\n</think>\\n<answer>回答</answer>
+- 用 Qwen 分词器在 CPU 进程池中按 chat template 计算 token 数，打印长度分布
+- 超过 cutoff_len 的样本不进入数据集，单独写入 <输出>.overlength.jsonl 便于检查
+- 报告 qwen2_full.sft.yaml 实际使用的方式(packing: true，LLaMA-Factory 用 greedy knapsack 把样本拼接到
+  cutoff_len)以及不打包时每个 epoch 的前向步数、平均每步有效 token 与填充效率；
+  pack 与 LLaMA-Factory 的装箱算法相同，装箱结果写入 <输出>.packing.json 便于检查
+
+    python src/train/sft/build_sft_dataset.py data/output_deepseek_r1_else2.jsonl \\
+        --output /datadisk/LLaMA-Factory/data/deepseek_sft.jsonl \\
+        --dataset-info /datadisk/LLaMA-Factory/data/dataset_info.json
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "..", "data"))
+sys.path.insert(0, os.path.join(HERE, "..", "grpo"))
+from kg_prompt import build_training_prompt, extract_abstract
+from preprocess_parquet import build_prompt, read_format_prompt
+
+_tokenizer = None
+
+
+def to_sharegpt(record, format_prompt=""):
+    """
+    蒸馏输出的一条记录 -> sharegpt 样本；缺少 prompt 或回答时返回 None
+
+    human 按训练布局重建并接上 format_prompt；prompt 中找不到摘要时保留原 prompt，样本带 "raw_prompt" 标记。
+    """
+    conversation = record.get("conversation") or []
+    prompt = next((m["content"] for m in conversation if m.get("role") == "user"), None)
+    response = (record.get("response") or "").strip()
+    if not prompt or not response:
+        return None
+    reasoner = (record.get("reasoner") or "").strip()
+    abstract = extract_abstract(prompt)
+    raw_prompt = abstract is None
+    if not raw_prompt:
+        prompt = build_prompt(build_training_prompt(abstract), format_prompt)
+    return {"id": record.get("id"), "raw_prompt": raw_prompt,
+            "conversations": [{"from": "human", "value": prompt},
+                              {"from": "gpt", "value": f"<think>\n{reasoner}\n</think>\n<answer>{response}</answer>"}]}
+
+
+def _init_tokenizer(path):
+    global _tokenizer
+    if path is not None:
+        from transformers import AutoTokenizer
+        _tokenizer = AutoTokenizer.from_pretrained(path)
+
+
+def _count_tokens(samples, chars_per_token=None):
+    """按 chat template 计算每个样本的 token 数；chars_per_token 不为空时按字符数估计"""
+    lengths = []
+    for human, gpt in samples:
+        if _tokenizer is None:
+            lengths.append(int((len(human) + len(gpt)) / chars_per_token) + 1)
+            continue
+        messages = [{"role": "user", "content": human}, {"role": "assistant", "content": gpt}]
+        lengths.append(len(_tokenizer.apply_chat_template(messages, tokenize=True)))
+    return lengths
+
+
+def convert(input_paths, tmp_path, tokenizer, num_workers, chars_per_token=None, chunk_size=64, format_prompt=""):
+    """
+    流式转换并计算长度
+
+    返回:
+        samples (list): [(临时文件偏移, token 数, id)]，按输入顺序；重复的 id 只保留第一条
+        skipped (dict): 跳过的条数 {"invalid": 无法解析或缺少内容, "duplicate": 重复 id}，
+            以及保留原 prompt(找不到摘要)的条数 "raw_prompt"
+    """
+    samples = []
+    skipped = {"invalid": 0, "duplicate": 0, "raw_prompt": 0}
+    seen = set()
+    pending = []  # [(future, [(偏移, id)])]，按提交顺序取回结果
+    with ProcessPoolExecutor(num_workers, initializer=_init_tokenizer,
+                             initargs=(None if chars_per_token else tokenizer,)) as pool, \
+            open(tmp_path, "w", encoding="utf-8") as tmp:
+        chunk, meta = [], []
+
+        def submit():
+            pending.append((pool.submit(_count_tokens, chunk, chars_per_token), meta))
+
+        for path in input_paths:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        sample = to_sharegpt(json.loads(line), format_prompt)
+                    except (json.JSONDecodeError, AttributeError, KeyError, TypeError):
+                        sample = None
+                    if sample is None:
+                        skipped["invalid"] += 1
+                        continue
+                    if sample["id"] in seen:
+                        skipped["duplicate"] += 1
+                        continue
+                    seen.add(sample["id"])
+                    skipped["raw_prompt"] += sample.pop("raw_prompt")
+                    offset = tmp.tell()
+                    tmp.write(json.dumps(sample, ensure_ascii=False) + "\n")
+                    chunk.append((sample["conversations"][0]["value"], sample["conversations"][1]["value"]))
+                    meta.append((offset, sample["id"]))
+                    if len(chunk) >= chunk_size:
+                        submit()
+                        chunk, meta = [], []
+                        # 在途任务有上限，内存占用与输入大小无关
+                        while len(pending) > num_workers * 4:
+                            future, chunk_meta = pending.pop(0)
+                            samples.extend((o, n, i) for (o, i), n in zip(chunk_meta, future.result()))
+        if chunk:
+            submit()
+        for future, chunk_meta in pending:
+            samples.extend((o, n, i) for (o, i), n in zip(chunk_meta, future.result()))
+    return samples, skipped
+
+
+def pack(lengths, capacity):
+    """
+    与 LLaMA-Factory packing 使用的 greedy_knapsack 相同的装箱，返回 [[样本编号, ...], ...]
+
+    长度升序排列，每个箱反复放入能放下的最长样本(二分查找)，放不下时开新箱。
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    values = [lengths[i] for i in order]
+    bins = []
+    while values:
+        current = []
+        remaining = capacity
+        while True:
+            pos = bisect.bisect(values, remaining) - 1
+            if pos < 0:
+                break
+            remaining -= values.pop(pos)
+            current.append(order.pop(pos))
+        bins.append(current)
+    return bins
+
+
+def padding_efficiency(batches, lengths):
+    """有效 token 数 / 按 batch 内最长样本填充后的 token 数"""
+    real = sum(lengths[i] for batch in batches for i in batch)
+    padded = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches if batch)
+    return real / padded if padded else 0.0
+
+
+def length_report(lengths, cutoff_len):
+    ordered = sorted(lengths)
+    n = len(ordered)
+    if n == 0:
+        print("没有可用的样本")
+        return
+    pct = {q: ordered[min(n - 1, int(n * q))] for q in (0.5, 0.9, 0.99)}
+    print(f"样本 {n}，token 数: mean {sum(ordered) / n:.0f}, p50 {pct[0.5]}, p90 {pct[0.9]}, "
+          f"p99 {pct[0.99]}, max {ordered[-1]}")
+    step = max(1024, cutoff_len // 8)
+    edges = list(range(step, cutoff_len + step, step))
+    counts = [0] * (len(edges) + 1)
+    for length in ordered:
+        counts[bisect.bisect_left(edges, length)] += 1
+    lower = 0
+    for edge, count in zip(edges + [None], counts):
+        label = f"({lower}, {edge}]" if edge is not None else f"> {cutoff_len}"
+        print(f"  {label:<16} {count:>8} {count / n:>7.1%} {'#' * int(50 * count / n)}")
+        lower = edge
+
+
+def update_dataset_info(path, name, file_name):
+    info = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+    info[name] = {"file_name": file_name, "formatting": "sharegpt", "columns": {"messages": "conversations"}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    print(f"已写入 {path} 中的数据集 {name}")
+
+
+if __name__ == "__main__":
+    with open(os.path.join(HERE, "qwen2_full.sft.yaml"), "r", encoding="utf-8") as f:
+        sft_config = yaml.safe_load(f)
+
+    parser = argparse.ArgumentParser(description="蒸馏输出 -> LLaMA-Factory sharegpt 数据集(含长度统计与装箱统计)")
+    parser.add_argument("inputs", nargs="+", help="蒸馏输出的 jsonl，可以有多个")
+    parser.add_argument("--output", default="deepseek_sft.jsonl")
+    parser.add_argument("--tokenizer", default=sft_config["model_name_or_path"], help="默认取 SFT 配置中的模型")
+    parser.add_argument("--cutoff-len", type=int, default=sft_config["cutoff_len"])
+    parser.add_argument("--batch-size", type=int, default=sft_config["per_device_train_batch_size"],
+                        help="每个设备的 batch 大小，计算填充效率用")
+    parser.add_argument("--packing", action=argparse.BooleanOptionalAction, default=bool(sft_config.get("packing")),
+                        help="训练时是否 packing，默认取 SFT 配置")
+    parser.add_argument("--order", choices=["input", "bucketed"], default="input",
+                        help="输出顺序：保持输入顺序，或按长度分桶的 batch(只在不 packing 且配置中 "
+                             "disable_shuffling: true 时有效)")
+    parser.add_argument("--format-prompt-from", default=os.path.join(HERE, "..", "grpo", "qwen2_5_7b_kg.sh"),
+                        help="从该训练脚本读取 FORMAT_PROMPT，与 GRPO 和推理时的 prompt 保持一致")
+    parser.add_argument("--format-prompt", default=None, help="直接指定 format prompt，优先于 --format-prompt-from")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--estimate", type=float, default=None, metavar="CHARS_PER_TOKEN",
+                        help="不加载分词器，按每 token 字符数粗略估计长度(如 3.5)")
+    parser.add_argument("--dataset-info", default=None, help="LLaMA-Factory 的 dataset_info.json，写入数据集定义")
+    parser.add_argument("--dataset-name", default=sft_config["dataset"])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.time()
+    format_prompt = args.format_prompt if args.format_prompt is not None else read_format_prompt(args.format_prompt_from)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    tmp_path = args.output + ".tmp"
+    samples, skipped = convert(args.inputs, tmp_path, args.tokenizer, args.workers, args.estimate,
+                               format_prompt=format_prompt)
+    print(f"转换 {len(samples)} 条(跳过无效 {skipped['invalid']}，重复 {skipped['duplicate']})，"
+          f"耗时 {time.time() - start:.1f}s{'，长度为估计值' if args.estimate else ''}")
+    if skipped["raw_prompt"]:
+        print(f"  其中 {skipped['raw_prompt']} 条的 prompt 中找不到摘要，保留蒸馏时的原 prompt")
+    lengths = [n for _, n, _ in samples]
+    length_report(lengths, args.cutoff_len)
+
+    kept = [i for i, n in enumerate(lengths) if n <= args.cutoff_len]
+    over = [i for i, n in enumerate(lengths) if n > args.cutoff_len]
+    if over:
+        with open(args.output + ".overlength.jsonl", "w", encoding="utf-8") as f:
+            for i in over:
+                f.write(json.dumps({"id": samples[i][2], "tokens": lengths[i]}, ensure_ascii=False) + "\n")
+        print(f"超过 cutoff_len={args.cutoff_len} 的样本 {len(over)} 条未写入数据集，见 {args.output}.overlength.jsonl")
+
+    rng = random.Random(args.seed)
+    kept_lengths = [lengths[i] for i in kept]
+    bs = args.batch_size
+    shuffled = list(range(len(kept)))
+    rng.shuffle(shuffled)
+    random_batches = [shuffled[i:i + bs] for i in range(0, len(shuffled), bs)]
+    by_length = sorted(range(len(kept)), key=lambda i: kept_lengths[i])
+    bucketed = [by_length[i:i + bs] for i in range(0, len(by_length), bs)]
+    rng.shuffle(bucketed)
+    # LLaMA-Factory packing 时每个序列留一个 token 给 padding，容量为 cutoff_len - 1
+    bins = pack(kept_lengths, args.cutoff_len - 1)
+    bin_lengths = [sum(kept_lengths[i] for i in b) for b in bins]
+    bin_batches = [list(range(i, min(i + bs, len(bins)))) for i in range(0, len(bins), bs)]
+    total = sum(kept_lengths)
+    modes = [(f"不打包(bs={bs})", random_batches, padding_efficiency(random_batches, kept_lengths), not args.packing)]
+    if bs > 1:
+        modes.append((f"不打包，按长度分桶(bs={bs})", bucketed, padding_efficiency(bucketed, kept_lengths), False))
+    modes.append((f"packing 到 {args.cutoff_len}(bs={bs})", bin_batches,
+                  padding_efficiency(bin_batches, bin_lengths), args.packing))
+    print(f"每个 epoch 的前向步数 / 平均每步有效 token / 填充效率(有效 token / 填充后的 token)，* 为训练配置使用的方式:")
+    for name, batches, efficiency, used in modes:
+        print(f"{'*' if used else ' '} {name:<26} {len(batches):>8} {total / max(len(batches), 1):>10.0f} {efficiency:>8.1%}")
+    if bs == 1:
+        print("  bs=1 时不打包也没有填充，packing 的收益在于每步处理的 token 更多、步数更少")
+
+    if args.order == "bucketed" and (args.packing or not sft_config.get("disable_shuffling")):
+        print("注意: bucketed 顺序只在不 packing 且配置中 disable_shuffling: true 时保留，"
+              "否则 LLaMA-Factory 会重新装箱或打乱样本")
+    order = {"bucketed": [i for b in bucketed for i in b], "input": list(range(len(kept)))}[args.order]
+    with open(tmp_path, "r", encoding="utf-8") as src, open(args.output, "w", encoding="utf-8") as out:
+        for i in order:
+            src.seek(samples[kept[i]][0])
+            out.write(src.readline())
+    os.remove(tmp_path)
+    if args.packing:
+        # 与 LLaMA-Factory 按相同算法得到的装箱结果(只按长度装箱，与数据集中的顺序无关)
+        with open(args.output + ".packing.json", "w", encoding="utf-8") as f:
+            json.dump({"cutoff_len": args.cutoff_len,
+                       "bins": [[samples[kept[i]][2] for i in b] for b in bins]}, f, ensure_ascii=False)
+    print(f"已写入 {args.output} ({args.order} 顺序)，耗时 {time.time() - start:.1f}s")
+    if args.dataset_info:
+        update_dataset_info(args.dataset_info, args.dataset_name, os.path.basename(args.output))
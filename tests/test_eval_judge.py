@@ -0,0 +1,165 @@
+"""
+src/test/eval.py 的并发评判对一个本地的 OpenAI 兼容桩评判服务运行
+
+桩服务按 prompt 中的标准答案逐行给出 正确/错误，每个请求按 prompt 内容延迟不同的时间，
+使并发时的完成顺序与提交顺序不同；第一个请求返回 503 以走到重试。
+检查 --workers 1(串行)与 --workers 4 得到的 doc_results.jsonl 逐行相同、P/R/F1 相同且与预期一致。
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+
+EVAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "test", "eval.py")
+SECTION_RE = re.compile(r"## 标准答案\n(.*?)\n\n## 模型识别结果\n(.*?)\n\n## 输出格式", re.DOTALL)
+METRIC_RE = re.compile(r"^(Entities|Relationships)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s*$", re.MULTILINE)
+
+TYPES = ["disease", "drug", "symptom", "gene"]
+RELATIONS = ["treat", "is_symptom_of", "is_located_in"]
+
+
+def make_docs(n_docs=12):
+    """标准答案与识别结果：识别结果丢掉一部分、改错一部分、多出一部分，顺序与标准答案不同"""
+    std, pred = [], []
+    for d in range(n_docs):
+        entities = [{"entity_type": TYPES[(d + i) % 4], "name": f"entity {d}-{i}"} for i in range(3 + d % 4)]
+        relationships = [{"entity_name1": f"entity {d}-{i}", "relationship": RELATIONS[(d + i) % 3],
+                          "entity_name2": f"entity {d}-{i + 1}"} for i in range(len(entities) - 1)]
+        std.append({"id": f"doc-{d}", "entities": entities, "relationships": relationships})
+        pred_entities = [dict(e) for e in entities[d % 2:]]
+        pred_entities.append({"entity_type": "drug", "name": f"spurious {d}"})
+        if d % 3 == 0:
+            pred_entities[0]["entity_type"] = "target"
+        pred_relationships = [dict(r) for r in relationships[:len(relationships) - d % 3]]
+        if d % 4 == 1:
+            pred_relationships.append({"entity_name1": f"entity {d}-0", "relationship": "treat",
+                                       "entity_name2": f"spurious {d}"})
+        pred.append({"id": f"doc-{d}", "entities": pred_entities, "relationships": pred_relationships})
+    pred.reverse()
+    pred.append({"id": "doc-unknown", "entities": [], "relationships": []})
+    return std, pred
+
+
+def _norm(row):
+    return row.strip().lower().replace("_", " ")
+
+
+class JudgeHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = request["messages"][-1]["content"]
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            first = server.requests == 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if first:
+                self._send(503, {"error": {"message": "warming up", "type": "server_error"}})
+                return
+            time.sleep(int(hashlib.md5(prompt.encode("utf-8")).hexdigest(), 16) % 40 / 1000)
+            gold, rows = SECTION_RE.search(prompt).groups()
+            gold = {_norm(row) for row in gold.split("\n") if row}
+            verdicts = [f"{row}|{'正确' if _norm(row) in gold else '错误'}" for row in rows.split("\n") if row]
+            self._send(200, {
+                "id": "cmpl", "object": "chat.completion", "created": 0, "model": request["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "\n".join(verdicts)}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+@pytest.fixture
+def judge_server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), JudgeHandler)
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def run_eval(server, std_path, pred_path, outputdir, workers):
+    server.requests = server.in_flight = server.max_in_flight = 0
+    result = subprocess.run(
+        [sys.executable, EVAL, "--std", str(std_path), "--pred", str(pred_path), "--outputdir", outputdir,
+         "--base-url", f"http://127.0.0.1:{server.server_address[1]}/v1", "--match", "llm", "--no-cache",
+         "--workers", str(workers), "--rps", "200", "--window", "5"],
+        capture_output=True, text=True, timeout=120, cwd=os.path.dirname(EVAL))
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def expected_metrics(std, pred):
+    """按桩服务的判定规则直接计算 P/R/F1"""
+    std_by_id = {doc["id"]: doc for doc in std}
+    counts = {"Entities": [0, 0, 0], "Relationships": [0, 0, 0]}
+    for doc in pred:
+        gold = std_by_id.get(doc["id"])
+        if gold is None:
+            continue
+        for key, field, fmt in (("Entities", "entities", lambda e: f"{e['entity_type']}|{e['name']}"),
+                                ("Relationships", "relationships",
+                                 lambda r: f"{r['entity_name1']}|{r['relationship']}|{r['entity_name2']}")):
+            gold_rows = {_norm(fmt(x)) for x in gold[field]}
+            rows = [_norm(fmt(x)) for x in doc[field]]
+            counts[key][0] += sum(row in gold_rows for row in rows)
+            counts[key][1] += len(gold[field])
+            counts[key][2] += len(rows)
+    metrics = {}
+    for key, (right, n_std, n_test) in counts.items():
+        precision, recall = right / n_test, right / n_std
+        metrics[key] = (precision, recall, 2 * precision * recall / (precision + recall))
+    return metrics
+
+
+def test_parallel_matches_serial(judge_server, tmp_path):
+    std, pred = make_docs()
+    std_path, pred_path = tmp_path / "std.json", tmp_path / "pred.json"
+    std_path.write_text("".join(json.dumps(doc) + "\n" for doc in std), encoding="utf-8")
+    pred_path.write_text("".join(json.dumps(doc) + "\n" for doc in pred), encoding="utf-8")
+
+    serial_out = run_eval(judge_server, std_path, pred_path, f"{tmp_path}/w1-", 1)
+    assert judge_server.max_in_flight == 1
+    parallel_out = run_eval(judge_server, std_path, pred_path, f"{tmp_path}/w4-", 4)
+    assert judge_server.max_in_flight > 1
+    # 每个识别结果非空的任务一个请求，外加第一次 503 的重试
+    known = {doc["id"] for doc in std}
+    n_jobs = sum(bool(doc[field]) for doc in pred if doc["id"] in known for field in ("entities", "relationships"))
+    assert judge_server.requests == n_jobs + 1
+
+    serial = (tmp_path / "w1-doc_results.jsonl").read_text(encoding="utf-8")
+    parallel = (tmp_path / "w4-doc_results.jsonl").read_text(encoding="utf-8")
+    assert serial == parallel
+    assert [json.loads(line)["id"] for line in serial.splitlines()] == [doc["id"] for doc in pred[:-1]]
+
+    serial_metrics = METRIC_RE.findall(serial_out)
+    assert len(serial_metrics) == 2
+    assert METRIC_RE.findall(parallel_out) == serial_metrics
+    for key, *values in serial_metrics:
+        assert [float(v) for v in values] == pytest.approx(expected_metrics(std, pred)[key], abs=5e-4)
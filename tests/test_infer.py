@@ -0,0 +1,143 @@
+"""
+src/test/infer.py 对一个本地的 OpenAI 兼容桩服务运行
+
+桩服务在 /v1/models 返回一个模型，对 /v1/chat/completions 按 prompt 中的摘要给出固定回复；
+检查输出文件的格式、无法解析的回复，以及中断后重新运行时只补齐缺少的 id。
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+
+INFER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "test", "infer.py")
+FORMAT_PROMPT = "Answer inside <answer></answer>."
+ANSWER = {"Entities": {"aspirin": "drug", "pain": "disease"},
+          "Relationships": [["aspirin", "drug", "treat", "pain", "disease"], ["aspirin", "relieves", "pain"]]}
+DOCS = [{"id": f"doc-{i}", "content": f"Abstract number {i}: aspirin treats pain."} for i in range(5)]
+DOCS[3]["content"] = "Abstract number 3: broken reply."
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._send({"object": "list", "data": [{"id": "stub-model", "object": "model", "created": 0,
+                                                "owned_by": "test"}]})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = request["messages"][0]["content"]
+        self.server.prompts.append(prompt)
+        if "broken" in prompt:
+            content = "<think>...</think>\n<answer>not json</answer>"
+        else:
+            content = f"<think>...</think>\n<answer>{json.dumps(ANSWER)}</answer>"
+        self._send({
+            "id": "cmpl", "object": "chat.completion", "created": 0, "model": request["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        })
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    httpd.prompts = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def input_path(tmp_path):
+    path = tmp_path / "test.json"
+    path.write_text("".join(json.dumps(doc) + "\n" for doc in DOCS), encoding="utf-8")
+    return path
+
+
+def run_infer(server, input_path, pred_path, *extra):
+    result = subprocess.run(
+        [sys.executable, INFER, "--input", str(input_path), "--pred", str(pred_path),
+         "--base-url", f"http://127.0.0.1:{server.server_address[1]}/v1", "--format-prompt", FORMAT_PROMPT,
+         "--concurrency", "4", "--max-retries", "1", "--report-interval", "60", *extra],
+        capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def read_pred(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_output_format(server, input_path, tmp_path):
+    pred_path = tmp_path / "pred.json"
+    stdout = run_infer(server, input_path, pred_path)
+
+    records = {record["id"]: record for record in read_pred(pred_path)}
+    assert sorted(records) == [doc["id"] for doc in DOCS]
+    assert records["doc-0"] == {
+        "id": "doc-0",
+        "entities": [{"entity_type": "drug", "name": "aspirin"}, {"entity_type": "disease", "name": "pain"}],
+        "relationships": [
+            {"entity_name1": "aspirin", "entity_type1": "drug", "relationship": "treat",
+             "entity_name2": "pain", "entity_type2": "disease"},
+            {"entity_name1": "aspirin", "relationship": "relieves", "entity_name2": "pain"},
+        ],
+    }
+    assert records["doc-3"] == {"id": "doc-3", "entities": [], "relationships": []}
+    assert "parse_errors=1" in stdout
+
+    # prompt 与 GRPO 训练数据的布局一致：摘要在 schema 之后，format prompt 在末尾
+    assert len(server.prompts) == len(DOCS)
+    for prompt in server.prompts:
+        assert prompt.endswith(" " + FORMAT_PROMPT)
+        assert "Abstract number" in prompt
+
+
+def test_keep_response(server, input_path, tmp_path):
+    pred_path = tmp_path / "pred.json"
+    run_infer(server, input_path, pred_path, "--limit", "1", "--keep-response")
+    (record,) = read_pred(pred_path)
+    assert record["response"].startswith("<think>")
+
+
+def test_resume(server, input_path, tmp_path):
+    pred_path = tmp_path / "pred.json"
+    run_infer(server, input_path, pred_path, "--limit", "2")
+    first = read_pred(pred_path)
+    assert len(first) == 2 and len(server.prompts) == 2
+
+    # 模拟中断：末尾留下写了一半的一行
+    with open(pred_path, "a", encoding="utf-8") as f:
+        f.write('{"id": "doc-9", "entit')
+    stdout = run_infer(server, input_path, pred_path)
+
+    records = read_pred(pred_path)
+    assert records[:2] == first
+    assert sorted(record["id"] for record in records) == [doc["id"] for doc in DOCS]
+    assert len(server.prompts) == len(DOCS)
+    assert f"待推理 {len(DOCS) - 2} 篇，已完成 2 篇" in stdout
+
+    # 全部完成后再次运行不发送请求
+    run_infer(server, input_path, pred_path)
+    assert len(server.prompts) == len(DOCS)
+    assert len(read_pred(pred_path)) == len(DOCS)
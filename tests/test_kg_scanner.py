@@ -0,0 +1,54 @@
+"""
+scan_response 与原正则实现的差分模糊测试
+
+随机拼接标签片段、各种 Unicode 空白和普通字符，检查线性扫描得到的 think 内容、answer 内容
+以及格式判定与 kg.py 原来的正则写法完全一致。
+"""
+import os
+import random
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "train", "grpo",
+                                "score_function"))
+from kg import scan_response
+
+PIECES = ["<think>", "</think>", "<answer>", "</answer>", "<think", "answer>", "</", "<", ">",
+          "\n", " ", "\t", "\r", "\x0b", "\x1c", "\x85", "\xa0", "\u2028", "a", "{}", "思考"]
+FORMAT_PATTERN = re.compile(r"<think>.*?</think>\s*<answer>.*?</answer>", re.DOTALL)
+THINK_PATTERN = re.compile(r"<think>(.*?)</think>")
+ANSWER_PATTERN = re.compile(r"<answer>(.*?)</answer>", re.DOTALL)
+
+
+def assert_matches_regex(s):
+    scan = scan_response(s)
+    assert scan.format_ok == bool(FORMAT_PATTERN.fullmatch(s)), repr(s)
+    assert [s[a:b] for a, b in scan.think_spans] == THINK_PATTERN.findall(s), repr(s)
+    assert scan.think_length == sum(len(t) for t in THINK_PATTERN.findall(s)), repr(s)
+    match = ANSWER_PATTERN.search(s)
+    assert scan.answer == (match.group(1) if match else None), repr(s)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_random_tag_soup(seed):
+    rng = random.Random(seed)
+    for _ in range(5000):
+        assert_matches_regex("".join(rng.choice(PIECES) for _ in range(rng.randint(0, 24))))
+
+
+@pytest.mark.parametrize("s", [
+    "",
+    "<think>a</think><answer>{}</answer>",
+    "<think>a</think>\n \t<answer>{}</answer>",
+    "<think>a\nb</think><answer>{}</answer>",
+    "<think>a</think><answer>x</answer><answer>y</answer>",
+    "<think><think>a</think></think><answer>{}</answer>",
+    "<answer>{}</answer>",
+    "<think>a</think> <answer>{}</answer>",
+    "<think>a</think>\x1c<answer>{}</answer>",
+    "<think>a</think><answer>{}",
+])
+def test_edge_cases(s):
+    assert_matches_regex(s)